@@ -1,10 +1,11 @@
 import logging
 from app.db.answer_key_db import get_answer_key
 from app.db.student_db import (
-    get_all_students, get_all_student_answers, 
-    save_analysis_result, get_all_analysis_results
+    get_all_student_answers, save_analysis_result,
+    save_analysis_results_bulk, get_all_analysis_results
 )
-from api.gemini_analysis import analyze_bubble_answers, analyze_class_performance
+from app.db.class_stats import get_class_stats
+from api.gemini_analysis import analyze_bubble_answers, analyze_bubble_answers_bulk, analyze_class_stats
 
 logger = logging.getLogger("chexam.api.analyze_all")
 logger.setLevel(logging.INFO)
@@ -48,7 +49,7 @@ def analyze_student(student_id, answer_key_id):
         logger.error(f"Failed to analyze answers for student {student['name']}")
         return None
 
-def analyze_all_students(answer_key_id=None):
+def analyze_all_students(answer_key_id=None, skip_analyzed=False):
     if answer_key_id is None:
         from app.db.answer_key_db import get_all_answer_keys
         answer_keys = get_all_answer_keys()
@@ -57,26 +58,47 @@ def analyze_all_students(answer_key_id=None):
             return []
         answer_key_id = answer_keys[0]['id']
     
-    students = get_all_students()
-    if not students:
-        logger.error("No students found. Please add some students first.")
+    answer_key = get_answer_key(key_id=answer_key_id)
+    if not answer_key:
+        logger.error(f"Answer key with ID {answer_key_id} not found")
         return []
     
-    student_answers = get_all_student_answers(answer_key_id)
+    # One query for every student's answers (with names), instead of several per student.
+    # With skip_analyzed, students whose analyzed flag is still set are left out.
+    student_answers = get_all_student_answers(answer_key_id, pending_only=skip_analyzed)
     if not student_answers:
-        logger.error(f"No student answers found for answer key ID {answer_key_id}")
+        if skip_analyzed:
+            logger.info(f"All students are already analyzed for answer key ID {answer_key_id}")
+        else:
+            logger.error(f"No student answers found for answer key ID {answer_key_id}")
         return []
     
+    rows = []
+    for sa in student_answers:
+        if not sa['answers']:
+            logger.info(f"Skipping student {sa['student_name']} - no answers for this answer key")
+            continue
+        rows.append(sa)
+    
+    analyses = analyze_bubble_answers_bulk(
+        answer_key['answers'],
+        [sa['answers'] for sa in rows],
+        [sa['student_name'] for sa in rows]
+    )
+    
     results = []
-    for student in students:
-        has_answers = any(sa['student_id'] == student['id'] for sa in student_answers)
-        if not has_answers:
-            logger.info(f"Skipping student {student['name']} - no answers for this answer key")
+    records = []
+    for sa, result in zip(rows, analyses):
+        if not result:
+            logger.error(f"Failed to analyze answers for student {sa['student_name']}")
             continue
         
-        result = analyze_student(student['id'], answer_key_id)
-        if result:
-            results.append(result)
+        records.append((sa['student_id'], answer_key_id, result))
+        result['student_name'] = sa['student_name']
+        results.append(result)
+    
+    # One transaction for the whole class instead of one commit per student
+    save_analysis_results_bulk(records)
     
     logger.info(f"Completed analysis for {len(results)} students")
     return results
@@ -95,14 +117,20 @@ def analyze_class(answer_key_id=None):
         logger.error(f"Answer key with ID {answer_key_id} not found")
         return None
     
-    analyze_all_students(answer_key_id)
+    # Only students whose answers changed since their last analysis are analyzed again; the
+    # class statistics are kept up to date as their results are saved
+    analyze_all_students(answer_key_id, skip_analyzed=True)
     
-    analysis_results = get_all_analysis_results(answer_key_id)
-    if not analysis_results:
+    stats = get_class_stats(answer_key_id)
+    if not stats:
         logger.error(f"No analysis results found for answer key ID {answer_key_id}")
         return None
     
-    result = analyze_class_performance(analysis_results, answer_key_name=answer_key['name'])
+    result = analyze_class_stats(
+        stats,
+        answer_key_name=answer_key['name'],
+        load_results=lambda: get_all_analysis_results(answer_key_id)
+    )
     if result:
         logger.info(f"Class analysis complete for answer key '{answer_key['name']}'")
         return result
@@ -0,0 +1,301 @@
+import argparse
+import logging
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+# PDF rendering is optional; image folders work without it
+try:
+    import fitz
+    PDF_AVAILABLE = True
+except ImportError:
+    fitz = None
+    PDF_AVAILABLE = False
+
+logger = logging.getLogger("chexam.api.batch_grade")
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    formatter = logging.Formatter('[%(levelname)s] %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff'}
+PDF_EXTENSIONS = {'.pdf'}
+PDF_RENDER_DPI = 200
+
+STAGES = ['load', 'document_pipeline', 'detect_bubbles', 'compare_answers']
+
+# Answer key and sheet template shared by every sheet a worker grades, set once per worker process
+_worker_teacher_answers = None
+_worker_template = None
+
+
+def find_sheets(folder):
+    """
+    Walk a folder and list every sheet to grade.
+
+    Args:
+        folder: Directory containing scanned photos and/or PDFs
+
+    Returns:
+        List of (path, page_index, student_name) tuples. page_index is None for images.
+    """
+    sheets = []
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            stem, ext = os.path.splitext(filename)
+            ext = ext.lower()
+
+            if ext in IMAGE_EXTENSIONS:
+                sheets.append((path, None, stem))
+            elif ext in PDF_EXTENSIONS:
+                if not PDF_AVAILABLE:
+                    logger.warning(f"Skipping {path}: install PyMuPDF to grade PDF scans")
+                    continue
+                with fitz.open(path) as doc:
+                    page_count = doc.page_count
+                for page_index in range(page_count):
+                    name = stem if page_count == 1 else f"{stem} p{page_index + 1}"
+                    sheets.append((path, page_index, name))
+    return sheets
+
+
+def load_sheet_image(path, page_index=None):
+    """Load a sheet as a BGR image, rendering the given page for PDFs."""
+    if page_index is None:
+        return cv2.imread(path)
+
+    with fitz.open(path) as doc:
+        pix = doc[page_index].get_pixmap(dpi=PDF_RENDER_DPI)
+        img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    if pix.n == 4:
+        return cv2.cvtColor(img, cv2.COLOR_RGBA2BGR)
+    if pix.n == 1:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    return cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+
+
+def _init_worker(teacher_answers, template=None):
+    global _worker_teacher_answers, _worker_template
+    _worker_teacher_answers = teacher_answers
+    _worker_template = template
+
+
+def grade_sheet(path, page_index, student_name):
+    """
+    Run one sheet through the full grading pipeline inside a worker process.
+
+    Returns:
+        Dictionary with the detected answers, comparison and per-stage timings (seconds)
+    """
+    from app.processing.image_processing import process_document_pipeline
+    from app.processing.answer_detection import detect_bubbles
+    from app.processing.gemini_vision import compare_answers
+
+    result = {
+        'path': path,
+        'page_index': page_index,
+        'student_name': student_name,
+        'answers': {},
+        'comparison': None,
+        'timings': {},
+        'error': None
+    }
+    timings = result['timings']
+
+    try:
+        start = time.perf_counter()
+        image = load_sheet_image(path, page_index)
+        timings['load'] = time.perf_counter() - start
+        if image is None:
+            result['error'] = "Could not read image"
+            return result
+
+        start = time.perf_counter()
+        _, warped_gray, _ = process_document_pipeline(image, debug=False)
+        timings['document_pipeline'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        answers = detect_bubbles(warped_gray, template=_worker_template)
+        timings['detect_bubbles'] = time.perf_counter() - start
+
+        if not answers:
+            result['error'] = "No bubbles detected"
+            return result
+        result['answers'] = answers
+
+        start = time.perf_counter()
+        result['comparison'] = compare_answers(answers, teacher_answers=_worker_teacher_answers)
+        timings['compare_answers'] = time.perf_counter() - start
+    except Exception as e:
+        result['error'] = str(e)
+
+    return result
+
+
+def load_teacher_answers(answer_key_id=None, answer_key_name=None):
+    """
+    Load the answer key once for the whole batch.
+    Falls back to the most recently created key when none is given.
+
+    Returns:
+        (answer_key_id, {question_number: answer}) or (None, None) if no key is found
+    """
+    from app.db.answer_key_db import get_all_answer_keys, get_answer_key
+
+    if answer_key_id is None and answer_key_name is None:
+        answer_keys = get_all_answer_keys()
+        if not answer_keys:
+            return None, None
+        answer_key_id = max(key['id'] for key in answer_keys)
+
+    answer_key = get_answer_key(answer_key_id, answer_key_name)
+    if not answer_key:
+        return None, None
+
+    return answer_key['id'], {int(k): v for k, v in answer_key['answers'].items()}
+
+
+def persist_results(results, answer_key_id):
+    """Write every graded sheet into student_answers in one transaction, creating students by name as needed."""
+    from app.db.student_db import add_students, save_student_answers_bulk
+
+    student_ids = add_students(result['student_name'] for result in results)
+    if not student_ids:
+        return 0
+    records = [(student_ids[result['student_name']], answer_key_id, result['answers'])
+               for result in results if result['student_name'] in student_ids]
+    return save_student_answers_bulk(records) or 0
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def format_report(results, stage_timings, elapsed):
+    graded = [r for r in results if r['error'] is None]
+    failed = [r for r in results if r['error'] is not None]
+
+    lines = [
+        f"Sheets:      {len(results)} ({len(graded)} graded, {len(failed)} failed)",
+        f"Wall time:   {elapsed:.2f} s",
+        f"Throughput:  {len(results) / elapsed if elapsed > 0 else 0:.2f} sheets/sec",
+        "",
+        f"{'Stage':<20}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}",
+    ]
+    for stage, values in stage_timings.items():
+        if not values:
+            continue
+        lines.append(
+            f"{stage:<20}{len(values):>8}"
+            f"{percentile(values, 50) * 1000:>10.1f}{percentile(values, 95) * 1000:>10.1f}"
+        )
+
+    for r in failed:
+        page = f" (page {r['page_index'] + 1})" if r['page_index'] is not None else ""
+        lines.append(f"FAILED {r['path']}{page}: {r['error']}")
+
+    return "\n".join(lines)
+
+
+def load_template(spec):
+    """Resolve the --template option: 'default' or a path to a JSON layout file."""
+    from app.processing.sheet_template import DEFAULT_TEMPLATE, SheetTemplate
+
+    if spec is None:
+        return None
+    if spec == 'default':
+        return DEFAULT_TEMPLATE
+    return SheetTemplate.from_json(spec)
+
+
+def run_batch(folder, answer_key_id=None, answer_key_name=None, workers=None, save=True, template=None):
+    """
+    Grade every sheet in a folder on a process pool and store the results.
+
+    Args:
+        folder: Directory of scanned photos or PDFs, one student per file (or PDF page)
+        answer_key_id: ID of the answer key to grade against (optional)
+        answer_key_name: Name of the answer key to grade against (optional)
+        workers: Number of worker processes (default: CPU count)
+        save: Whether to write the detected answers into student_answers
+        template: SheetTemplate to sample bubbles with (optional, default: contour detection)
+
+    Returns:
+        Tuple of (results, report text)
+    """
+    key_id, teacher_answers = load_teacher_answers(answer_key_id, answer_key_name)
+    if teacher_answers is None:
+        logger.error("No answer key found. Please create at least one answer key first.")
+        return [], ""
+
+    sheets = find_sheets(folder)
+    if not sheets:
+        logger.error(f"No sheets found in {folder}")
+        return [], ""
+
+    logger.info(f"Grading {len(sheets)} sheets against answer key ID {key_id}")
+
+    stage_timings = {stage: [] for stage in STAGES + ['persist']}
+    results = []
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(teacher_answers, template)) as executor:
+        futures = [executor.submit(grade_sheet, *sheet) for sheet in sheets]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            for stage, seconds in result['timings'].items():
+                stage_timings[stage].append(seconds)
+            if done % 50 == 0 or done == len(futures):
+                logger.info(f"Processed {done}/{len(futures)} sheets")
+
+    graded = [r for r in results if r['error'] is None]
+    if save and graded:
+        persist_start = time.perf_counter()
+        saved = persist_results(graded, key_id)
+        stage_timings['persist'].append(time.perf_counter() - persist_start)
+        logger.info(f"Saved answers for {saved} students")
+
+    elapsed = time.perf_counter() - start
+    return results, format_report(results, stage_timings, elapsed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade a folder of scanned bubble sheets without the UI.")
+    parser.add_argument("folder", help="Folder containing sheet photos or PDFs")
+    parser.add_argument("--answer-key-id", type=int, default=None, help="Answer key ID (default: most recent)")
+    parser.add_argument("--answer-key-name", default=None, help="Answer key name")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--no-save", action="store_true", help="Grade and report without writing to the database")
+    parser.add_argument("--template", default=None,
+                        help="Sample bubbles at fixed positions: 'default' or a JSON sheet layout file")
+    args = parser.parse_args(argv)
+
+    results, report = run_batch(
+        args.folder,
+        answer_key_id=args.answer_key_id,
+        answer_key_name=args.answer_key_name,
+        workers=args.workers,
+        save=not args.no_save,
+        template=load_template(args.template)
+    )
+    if report:
+        print(report)
+    return 0 if results else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
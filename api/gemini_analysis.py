@@ -1,12 +1,13 @@
 import os
 import json
 import logging
-import requests
 import random
 import math
 import os
 from collections import Counter
 from dotenv import load_dotenv
+from app.utils import gemini_client
+from app.processing.scoring import ClassScores
 
 logger = logging.getLogger("chexam.api.gemini_analysis")
 logger.setLevel(logging.INFO)
@@ -18,7 +19,7 @@ if not logger.handlers:
 
 load_dotenv()
 API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1/models/gemini-1.0-pro:generateContent"
+GEMINI_API_URL = gemini_client.api_url("/v1/models/gemini-1.0-pro:generateContent")
 USE_MOCK_ANALYSIS = True
 
 if not API_KEY:
@@ -56,6 +57,42 @@ def mock_analyze_student(correct_answers, student_answers, student_name):
         "suggestions": suggestions
     }
 
+def mock_analyze_students(correct_answers, student_answers_list):
+    """
+    Mock analysis of many students against one answer key.
+
+    Scores the whole class with one ClassScores matrix instead of a dictionary walk per
+    student; each result is the same as mock_analyze_student would return.
+
+    Args:
+        correct_answers: {"1": "A", ...}
+        student_answers_list: One answer dictionary per student, or a matrix of answer
+            codes from student_db.get_answer_matrix
+
+    Returns:
+        List of analysis dictionaries, in the order of student_answers_list
+    """
+    scores = ClassScores(correct_answers, student_answers_list)
+    total_questions = scores.num_questions
+    strongest = scores.busiest_group(scores.correct).tolist()
+    weakest = scores.busiest_group(scores.wrong).tolist()
+    
+    results = []
+    for i in range(scores.num_students):
+        wrong_indices = scores.wrong_indices(i)
+        percentage = round(float(scores.percentages[i]), 1) if total_questions > 0 else 0
+        
+        results.append({
+            "score": scores.score_text(i),
+            "percentage": percentage,
+            "correct_indices": scores.correct_indices(i),
+            "wrong_indices": wrong_indices,
+            "strengths": mock_strength_text(strongest[i]) if strongest[i] >= 0 else "No particular strengths identified.",
+            "weaknesses": mock_weakness_text(weakest[i]) if weakest[i] >= 0 else "No significant weaknesses identified.",
+            "suggestions": generate_mock_suggestions(percentage, wrong_indices)
+        })
+    return results
+
 def generate_mock_strengths(correct_indices, correct_answers):
     if not correct_indices:
         return "No particular strengths identified."
@@ -68,8 +105,11 @@ def generate_mock_strengths(correct_indices, correct_answers):
     
     # Find the strongest group
     strongest_group = max(groups.items(), key=lambda x: x[1], default=(0, 0))
-    group_start = strongest_group[0] * 10 + 1
-    group_end = min((strongest_group[0] + 1) * 10, 60)
+    return mock_strength_text(strongest_group[0])
+
+def mock_strength_text(group):
+    group_start = group * 10 + 1
+    group_end = min((group + 1) * 10, 60)
     
     strength_templates = [
         f"Strong performance in questions {group_start}-{group_end}.",
@@ -91,8 +131,11 @@ def generate_mock_weaknesses(wrong_indices, correct_answers):
     
     # Find the weakest group
     weakest_group = max(groups.items(), key=lambda x: x[1], default=(0, 0))
-    group_start = weakest_group[0] * 10 + 1
-    group_end = min((weakest_group[0] + 1) * 10, 60)
+    return mock_weakness_text(weakest_group[0])
+
+def mock_weakness_text(group):
+    group_start = group * 10 + 1
+    group_end = min((group + 1) * 10, 60)
     
     weakness_templates = [
         f"Struggled with questions {group_start}-{group_end}.",
@@ -155,6 +198,46 @@ def mock_analyze_class(analysis_results, answer_key_name):
         "teaching_suggestions": teaching_suggestions
     }
 
+def mock_analyze_class_stats(class_stats, answer_key_name):
+    """
+    Mock class analysis from the incrementally maintained class statistics.
+
+    Gives the same fields as mock_analyze_class without reading every student's result;
+    questions with equal counts are listed in question order.
+
+    Args:
+        class_stats: Dictionary from app.db.class_stats.get_class_stats
+        answer_key_name: Name of the answer key
+
+    Returns:
+        Dictionary with class analysis results, or None if there are no statistics
+    """
+    if not class_stats:
+        return None
+    
+    def most_common(counts):
+        ranked = sorted(counts.items(), key=lambda item: (-item[1], int(item[0]) if item[0].isdigit() else 0))
+        return [q for q, _ in ranked[:5]]
+    
+    class_average = class_stats["class_average"]
+    passing_rate = class_stats["passing_rate"]
+    most_missed = most_common(class_stats["question_wrong"])
+    best_understood = most_common(class_stats["question_correct"])
+    
+    return {
+        "class_average": class_average,
+        "passing_rate": passing_rate,
+        "highest_score": class_stats["highest_score"],
+        "lowest_score": class_stats["lowest_score"],
+        "student_count": class_stats["student_count"],
+        "score_histogram": class_stats["score_histogram"],
+        "most_missed_questions": most_missed,
+        "best_understood_questions": best_understood,
+        "class_strengths": generate_mock_class_strengths(best_understood, class_average),
+        "class_weaknesses": generate_mock_class_weaknesses(most_missed, class_average),
+        "teaching_suggestions": generate_mock_teaching_suggestions(class_average, passing_rate, most_missed)
+    }
+
 def generate_mock_class_strengths(best_understood, class_average):
     if not best_understood:
         return "No particular class strengths identified."
@@ -253,11 +336,7 @@ def analyze_bubble_answers(correct_answers, student_answers, student_name="Stude
             }
         }
         
-        response = requests.post(
-            f"{GEMINI_API_URL}?key={API_KEY}",
-            json=payload,
-            headers={"Content-Type": "application/json"}
-        )
+        response = gemini_client.post_json(GEMINI_API_URL, payload, api_key=API_KEY)
         
         if response.status_code != 200:
             logger.error(f"API request failed with status code {response.status_code}: {response.text}")
@@ -306,6 +385,44 @@ def analyze_bubble_answers(correct_answers, student_answers, student_name="Stude
         logger.info(f"Falling back to mock analysis for {student_name}")
         return mock_analyze_student(correct_answers, student_answers, student_name)
 
+def analyze_bubble_answers_bulk(correct_answers, student_answers_list, student_names):
+    """
+    Analyze many students' answers against one answer key.
+
+    With mock analysis the whole class is scored in one pass; otherwise each student is
+    sent to analyze_bubble_answers in turn.
+
+    Returns:
+        List of analysis dictionaries, in the order of student_answers_list
+    """
+    if USE_MOCK_ANALYSIS or not API_KEY:
+        logger.info(f"Using mock analysis for {len(student_answers_list)} students")
+        return mock_analyze_students(correct_answers, student_answers_list)
+    
+    return [analyze_bubble_answers(correct_answers, answers, student_name=name)
+            for answers, name in zip(student_answers_list, student_names)]
+
+def analyze_class_stats(class_stats, answer_key_name="Answer Key", load_results=None):
+    """
+    Analyze class performance starting from the class statistics.
+
+    With mock analysis the statistics are all that is needed. Otherwise every student's
+    result is loaded with load_results() and sent to analyze_class_performance.
+
+    Args:
+        class_stats: Dictionary from app.db.class_stats.get_class_stats
+        answer_key_name: Name of the answer key
+        load_results: Callable returning the list of analysis results
+
+    Returns:
+        Dictionary with class analysis results, or None on error
+    """
+    if USE_MOCK_ANALYSIS or not API_KEY or load_results is None:
+        logger.info(f"Using mock analysis for class with answer key '{answer_key_name}'")
+        return mock_analyze_class_stats(class_stats, answer_key_name)
+    
+    return analyze_class_performance(load_results(), answer_key_name=answer_key_name)
+
 def analyze_class_performance(analysis_results, answer_key_name="Answer Key"):
     if not analysis_results:
         logger.error("No analysis results provided for class analysis")
@@ -386,11 +503,7 @@ def analyze_class_performance(analysis_results, answer_key_name="Answer Key"):
             }
         }
         
-        response = requests.post(
-            f"{GEMINI_API_URL}?key={API_KEY}",
-            json=payload,
-            headers={"Content-Type": "application/json"}
-        )
+        response = gemini_client.post_json(GEMINI_API_URL, payload, api_key=API_KEY)
         
         if response.status_code != 200:
             logger.error(f"API request failed with status code {response.status_code}: {response.text}")
@@ -0,0 +1,97 @@
+import json
+
+import numpy as np
+
+from ..processing.scoring import MISSING, OPTION_CODES, BLANK, CODE_LETTERS
+
+# A packed answer vector is one version byte followed by one byte per question, question 1
+# first, up to the highest question answered. Each byte is an answer code from
+# app.processing.scoring: 0 for no answer, 1-4 for A-D and 5 for "blank". Sixty answers take
+# 61 bytes instead of about 600 bytes of JSON.
+#
+# Dictionaries that cannot be packed (question keys that are not positive integers, or answers
+# other than A-D and "blank") are stored as JSON text as before; reading accepts either form.
+FORMAT_VERSION = 1
+
+# Highest question number a packed vector can hold
+MAX_QUESTIONS = 1000
+
+_CODES = dict(OPTION_CODES, blank=BLANK)
+_LETTERS = [CODE_LETTERS.get(code) for code in range(256)]
+_QUESTION_KEYS = [str(q) for q in range(1, MAX_QUESTIONS + 1)]
+
+
+def pack_answers(answers):
+    """
+    Pack an answer dictionary into bytes.
+
+    Args:
+        answers: {"1": "A", ...} or {1: "A", ...}
+
+    Returns:
+        bytes, or None if the dictionary cannot be represented
+    """
+    packed = bytearray(1 + len(answers))
+    try:
+        for q, answer in answers.items():
+            q = int(q)
+            if q < 1:
+                return None
+            if q >= len(packed):
+                if q > MAX_QUESTIONS:
+                    return None
+                packed.extend(bytes(q + 1 - len(packed)))
+            packed[q] = _CODES[answer]
+    except (KeyError, TypeError, ValueError):
+        return None
+    # Questions missing from a sparse dictionary leave zero bytes at the end
+    packed = packed.rstrip(b"\x00")
+    packed[:1] = bytes([FORMAT_VERSION])
+    return bytes(packed)
+
+
+def answer_codes(data, num_questions=None):
+    """
+    Answer codes of a packed vector, as a uint8 array viewing the bytes without copying.
+
+    Args:
+        data: Packed bytes
+        num_questions: Pad with MISSING or cut to this many questions (copies when padding)
+
+    Returns:
+        uint8 array where element i is the code for question i + 1
+    """
+    if not data or data[0] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported answer vector format: {data[:1]!r}")
+    codes = np.frombuffer(data, dtype=np.uint8, offset=1)
+    if num_questions is None or len(codes) == num_questions:
+        return codes
+    if len(codes) > num_questions:
+        return codes[:num_questions]
+    padded = np.full(num_questions, MISSING, dtype=np.uint8)
+    padded[:len(codes)] = codes
+    return padded
+
+
+def unpack_answers(data):
+    """Answer dictionary ({"1": "A", ...}) of a packed vector; unanswered questions are left out."""
+    codes = answer_codes(data)
+    letters = map(_LETTERS.__getitem__, data[1:])
+    if MISSING not in codes:
+        return dict(zip(_QUESTION_KEYS, letters))
+    return {q: letter for q, letter in zip(_QUESTION_KEYS, letters) if letter is not None}
+
+
+def to_db(answers):
+    """Column value for an answer dictionary: packed bytes when possible, JSON text otherwise."""
+    packed = pack_answers(answers)
+    return packed if packed is not None else json.dumps(answers)
+
+
+def from_db(value):
+    """Answer dictionary of a column value written by to_db, or of a legacy JSON row."""
+    if value is None:
+        return {}
+    if isinstance(value, str):
+        return json.loads(value)
+    return unpack_answers(value)
@@ -1,8 +1,9 @@
-import sqlite3
-import os
-import json
 import logging
-from pathlib import Path
+
+from . import class_stats
+from .answer_codec import to_db, from_db
+from .connection import DB_PATH, get_connection, rollback
+from .migrations import migrate
 
 logger = logging.getLogger("chexam.db.answer_key_db")
 logger.setLevel(logging.INFO)
@@ -12,69 +13,57 @@ if not logger.handlers:
     handler.setFormatter(formatter)
     logger.addHandler(handler)
 
-DB_PATH = Path(os.path.dirname(os.path.abspath(__file__))) / ".." / ".." / "data" / "chexam.db"
-DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
 def initialize_db():
     try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS answer_keys (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            num_questions INTEGER NOT NULL,
-            answers TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        migrate()
         logger.info(f"Database initialized at {DB_PATH}")
         return True
     except Exception as e:
+        rollback()
         logger.error(f"Error initializing database: {str(e)}")
         return False
 
 def save_answer_key(name, num_questions, answers):
 
     try:
-        answers_json = json.dumps(answers)
+        answers_value = to_db(answers)
         
-        conn = sqlite3.connect(str(DB_PATH))
+        conn = get_connection()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT id FROM answer_keys WHERE name = ?", (name,))
+        cursor.execute("SELECT id, answers FROM answer_keys WHERE name = ?", (name,))
         existing = cursor.fetchone()
         
         if existing:
             cursor.execute(
                 "UPDATE answer_keys SET num_questions = ?, answers = ? WHERE name = ?",
-                (num_questions, answers_json, name)
+                (num_questions, answers_value, name)
             )
             key_id = existing[0]
+            if from_db(existing[1]) != from_db(answers_value):
+                # Every analysis against the old answers is out of date
+                cursor.execute("UPDATE student_answers SET analyzed = 0 WHERE answer_key_id = ?", (key_id,))
             logger.info(f"Updated answer key '{name}' with ID {key_id}")
         else:
             cursor.execute(
                 "INSERT INTO answer_keys (name, num_questions, answers) VALUES (?, ?, ?)",
-                (name, num_questions, answers_json)
+                (name, num_questions, answers_value)
             )
             key_id = cursor.lastrowid
             logger.info(f"Saved new answer key '{name}' with ID {key_id}")
         
         conn.commit()
-        conn.close()
         return key_id
     except Exception as e:
+        rollback()
         logger.error(f"Error saving answer key: {str(e)}")
         return None
 
 def get_answer_key(key_id=None, name=None):
 
     try:
-        conn = sqlite3.connect(str(DB_PATH))
+        conn = get_connection()
         cursor = conn.cursor()
         
         if key_id is not None:
@@ -83,35 +72,33 @@ def get_answer_key(key_id=None, name=None):
             cursor.execute("SELECT * FROM answer_keys WHERE name = ?", (name,))
         else:
             logger.error("Either key_id or name must be provided")
-            conn.close()
             return None
         
         row = cursor.fetchone()
-        conn.close()
         
         if row:
             return {
                 'id': row[0],
                 'name': row[1],
                 'num_questions': row[2],
-                'answers': json.loads(row[3]),
+                'answers': from_db(row[3]),
                 'created_at': row[4]
             }
         else:
             return None
     except Exception as e:
+        rollback()
         logger.error(f"Error getting answer key: {str(e)}")
         return None
 
 def get_all_answer_keys():
 
     try:
-        conn = sqlite3.connect(str(DB_PATH))
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute("SELECT id, name, num_questions, created_at FROM answer_keys ORDER BY name")
         rows = cursor.fetchall()
-        conn.close()
         
         return [
             {
@@ -123,28 +110,32 @@ def get_all_answer_keys():
             for row in rows
         ]
     except Exception as e:
+        rollback()
         logger.error(f"Error getting all answer keys: {str(e)}")
         return []
 
 def delete_answer_key(key_id=None, name=None):
 
     try:
-        conn = sqlite3.connect(str(DB_PATH))
+        conn = get_connection()
         cursor = conn.cursor()
         
         if key_id is not None:
-            cursor.execute("DELETE FROM answer_keys WHERE id = ?", (key_id,))
+            cursor.execute("SELECT id FROM answer_keys WHERE id = ?", (key_id,))
         elif name is not None:
-            cursor.execute("DELETE FROM answer_keys WHERE name = ?", (name,))
+            cursor.execute("SELECT id FROM answer_keys WHERE name = ?", (name,))
         else:
             logger.error("Either key_id or name must be provided")
-            conn.close()
             return False
         
+        for (found_id,) in cursor.fetchall():
+            class_stats.clear(cursor, found_id)
+            cursor.execute("DELETE FROM answer_keys WHERE id = ?", (found_id,))
+        
         conn.commit()
-        conn.close()
         return True
     except Exception as e:
+        rollback()
         logger.error(f"Error deleting answer key: {str(e)}")
         return False
 
@@ -158,6 +149,7 @@ def get_answer_key_answers(key_id):
             logger.warning(f"No answers found for answer key ID {key_id}")
             return {}
     except Exception as e:
+        rollback()
         logger.error(f"Error getting answer key answers: {str(e)}")
         return {}
 
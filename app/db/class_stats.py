@@ -0,0 +1,258 @@
+import json
+import logging
+from collections import defaultdict
+
+from .connection import get_connection, rollback
+
+logger = logging.getLogger("chexam.db.class_stats")
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    formatter = logging.Formatter('[%(levelname)s] %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+PASSING_PERCENTAGE = 60
+HISTOGRAM_BINS = 10
+
+# Class statistics per answer key, kept up to date by applying the difference each
+# analysis_results write makes instead of re-reading every result. Percentages are stored in
+# tenths of a percent (they are rounded to one decimal) so sums, minimums and maximums are exact.
+
+
+def create_tables(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS class_stats (
+        answer_key_id INTEGER PRIMARY KEY,
+        student_count INTEGER NOT NULL DEFAULT 0,
+        percentage_sum INTEGER NOT NULL DEFAULT 0,
+        passing_count INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS class_score_counts (
+        answer_key_id INTEGER NOT NULL,
+        percentage INTEGER NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (answer_key_id, percentage)
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS class_question_stats (
+        answer_key_id INTEGER NOT NULL,
+        question TEXT NOT NULL,
+        correct_count INTEGER NOT NULL DEFAULT 0,
+        wrong_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (answer_key_id, question)
+    )
+    ''')
+
+
+def _tenths(percentage):
+    return int(round(float(percentage or 0) * 10))
+
+
+def _indices(value):
+    if isinstance(value, str):
+        value = json.loads(value)
+    return [str(q) for q in value or []]
+
+
+class StatsDelta:
+    """Changes to the class statistics of one or more answer keys, written in one batch."""
+
+    def __init__(self):
+        # answer_key_id -> [student_count, percentage_sum, passing_count]
+        self.totals = defaultdict(lambda: [0, 0, 0])
+        # (answer_key_id, percentage) -> count
+        self.scores = defaultdict(int)
+        # (answer_key_id, question) -> [correct_count, wrong_count]
+        self.questions = defaultdict(lambda: [0, 0])
+
+    def add(self, answer_key_id, percentage, correct_indices, wrong_indices, sign=1):
+        """
+        Count one analysis result (sign=-1 to take it away).
+
+        Args:
+            answer_key_id: ID of the answer key
+            percentage: The result's percentage
+            correct_indices: Questions answered correctly (list, or its JSON text)
+            wrong_indices: Questions missed (list, or its JSON text)
+            sign: 1 to add the result, -1 to remove it
+        """
+        tenths = _tenths(percentage)
+        totals = self.totals[answer_key_id]
+        totals[0] += sign
+        totals[1] += sign * tenths
+        if tenths >= PASSING_PERCENTAGE * 10:
+            totals[2] += sign
+        self.scores[(answer_key_id, tenths)] += sign
+        for q in _indices(correct_indices):
+            self.questions[(answer_key_id, q)][0] += sign
+        for q in _indices(wrong_indices):
+            self.questions[(answer_key_id, q)][1] += sign
+
+    def remove(self, answer_key_id, percentage, correct_indices, wrong_indices):
+        self.add(answer_key_id, percentage, correct_indices, wrong_indices, sign=-1)
+
+    def remove_existing(self, cursor, pairs):
+        """
+        Take away the stored results about to be replaced or deleted.
+
+        Args:
+            cursor: Cursor inside the caller's transaction
+            pairs: Iterable of (student_id, answer_key_id)
+        """
+        for student_id, answer_key_id in pairs:
+            cursor.execute(
+                """
+                SELECT percentage, correct_indices, wrong_indices FROM analysis_results
+                WHERE student_id = ? AND answer_key_id = ?
+                """,
+                (student_id, answer_key_id)
+            )
+            row = cursor.fetchone()
+            if row:
+                self.remove(answer_key_id, *row)
+
+    def apply(self, cursor):
+        """Write the accumulated changes inside the caller's transaction."""
+        totals = [(key, *values) for key, values in self.totals.items() if any(values)]
+        scores = [(key, tenths, count) for (key, tenths), count in self.scores.items() if count]
+        questions = [(key, q, *counts) for (key, q), counts in self.questions.items() if any(counts)]
+
+        cursor.executemany(
+            """
+            INSERT INTO class_stats (answer_key_id, student_count, percentage_sum, passing_count)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (answer_key_id) DO UPDATE SET
+                student_count = student_count + excluded.student_count,
+                percentage_sum = percentage_sum + excluded.percentage_sum,
+                passing_count = passing_count + excluded.passing_count
+            """,
+            totals
+        )
+        cursor.executemany(
+            """
+            INSERT INTO class_score_counts (answer_key_id, percentage, count) VALUES (?, ?, ?)
+            ON CONFLICT (answer_key_id, percentage) DO UPDATE SET count = count + excluded.count
+            """,
+            scores
+        )
+        cursor.executemany(
+            """
+            INSERT INTO class_question_stats (answer_key_id, question, correct_count, wrong_count)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (answer_key_id, question) DO UPDATE SET
+                correct_count = correct_count + excluded.correct_count,
+                wrong_count = wrong_count + excluded.wrong_count
+            """,
+            questions
+        )
+        if scores:
+            cursor.execute("DELETE FROM class_score_counts WHERE count <= 0")
+
+        self.__init__()
+
+
+def clear(cursor, answer_key_id=None):
+    """Delete the statistics of one answer key (or of all of them) inside the caller's transaction."""
+    for table in ("class_stats", "class_score_counts", "class_question_stats"):
+        if answer_key_id is None:
+            cursor.execute(f"DELETE FROM {table}")
+        else:
+            cursor.execute(f"DELETE FROM {table} WHERE answer_key_id = ?", (answer_key_id,))
+
+
+def rebuild(cursor, answer_key_id=None):
+    """Recompute statistics from analysis_results inside the caller's transaction."""
+    clear(cursor, answer_key_id)
+
+    query = """
+        SELECT ar.answer_key_id, ar.percentage, ar.correct_indices, ar.wrong_indices
+        FROM analysis_results ar
+        JOIN students s ON ar.student_id = s.id
+    """
+    if answer_key_id is None:
+        cursor.execute(query)
+    else:
+        cursor.execute(query + " WHERE ar.answer_key_id = ?", (answer_key_id,))
+
+    delta = StatsDelta()
+    for row in cursor.fetchall():
+        delta.add(*row)
+    delta.apply(cursor)
+
+
+def rebuild_class_stats(answer_key_id=None):
+    """
+    Recompute class statistics from scratch, e.g. after editing analysis_results by hand.
+
+    Returns:
+        True on success, False on error
+    """
+    try:
+        conn = get_connection()
+        rebuild(conn.cursor(), answer_key_id)
+        conn.commit()
+        return True
+    except Exception as e:
+        rollback()
+        logger.error(f"Error rebuilding class statistics: {str(e)}")
+        return False
+
+
+def get_class_stats(answer_key_id):
+    """
+    Get the class statistics of an answer key.
+
+    Returns:
+        Dictionary with student_count, class_average, passing_count, passing_rate,
+        highest_score, lowest_score, score_histogram (students per 10% band, the last band
+        including 100%), question_correct and question_wrong ({question: students}),
+        or None if no student has been analyzed against the key
+    """
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            "SELECT student_count, percentage_sum, passing_count FROM class_stats WHERE answer_key_id = ?",
+            (answer_key_id,)
+        )
+        row = cursor.fetchone()
+        if not row or row[0] <= 0:
+            return None
+        student_count, percentage_sum, passing_count = row
+
+        cursor.execute(
+            "SELECT percentage, count FROM class_score_counts WHERE answer_key_id = ? AND count > 0 ORDER BY percentage",
+            (answer_key_id,)
+        )
+        score_counts = cursor.fetchall()
+        histogram = [0] * HISTOGRAM_BINS
+        for tenths, count in score_counts:
+            histogram[min(tenths * HISTOGRAM_BINS // 1000, HISTOGRAM_BINS - 1)] += count
+
+        cursor.execute(
+            "SELECT question, correct_count, wrong_count FROM class_question_stats WHERE answer_key_id = ?",
+            (answer_key_id,)
+        )
+        question_rows = cursor.fetchall()
+
+        return {
+            'answer_key_id': answer_key_id,
+            'student_count': student_count,
+            'class_average': round(percentage_sum / 10 / student_count, 1),
+            'passing_count': passing_count,
+            'passing_rate': round(passing_count / student_count * 100, 1),
+            'highest_score': score_counts[-1][0] / 10 if score_counts else 0,
+            'lowest_score': score_counts[0][0] / 10 if score_counts else 0,
+            'score_histogram': histogram,
+            'question_correct': {q: correct for q, correct, _ in question_rows if correct > 0},
+            'question_wrong': {q: wrong for q, _, wrong in question_rows if wrong > 0}
+        }
+    except Exception as e:
+        rollback()
+        logger.error(f"Error getting class statistics: {str(e)}")
+        return None
@@ -0,0 +1,83 @@
+import sqlite3
+import os
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger("chexam.db.connection")
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    formatter = logging.Formatter('[%(levelname)s] %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+DB_PATH = Path(os.path.dirname(os.path.abspath(__file__))) / ".." / ".." / "data" / "chexam.db"
+DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+
+# Number of compiled statements each connection keeps for reuse
+CACHED_STATEMENTS = 256
+
+# Negative cache_size is in KiB
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -8192",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+_local = threading.local()
+
+
+def _open(path):
+    conn = sqlite3.connect(path, timeout=30, cached_statements=CACHED_STATEMENTS)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    logger.debug(f"Opened database connection to {path} on thread {threading.current_thread().name}")
+    return conn
+
+
+def get_connection(path=None):
+    """
+    Return this thread's connection to the database, opening it on first use.
+
+    SQLite connections cannot be shared between threads, so each thread gets its own,
+    kept open for the life of the thread. Connections use WAL journaling so readers do not
+    block the writer, synchronous=NORMAL so commits do not wait for an fsync, and a
+    statement cache so repeated queries are not recompiled.
+
+    Callers must not close the returned connection; commit or rollback() instead.
+
+    Args:
+        path: Database file (defaults to data/chexam.db)
+
+    Returns:
+        sqlite3.Connection
+    """
+    path = str(path or DB_PATH)
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = connections[path] = _open(path)
+    return conn
+
+
+def rollback(path=None):
+    """Roll back any transaction left open on this thread's connection after an error."""
+    conn = getattr(_local, "connections", {}).get(str(path or DB_PATH))
+    if conn is not None and conn.in_transaction:
+        try:
+            conn.rollback()
+        except sqlite3.Error as e:
+            logger.error(f"Error rolling back transaction: {str(e)}")
+
+
+def close_connection(path=None):
+    """Close this thread's connection (e.g. before a worker thread exits or the file is replaced)."""
+    connections = getattr(_local, "connections", {})
+    conn = connections.pop(str(path or DB_PATH), None)
+    if conn is not None:
+        conn.close()
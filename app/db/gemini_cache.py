@@ -0,0 +1,157 @@
+import sqlite3
+import os
+import json
+import time
+import hashlib
+import logging
+from pathlib import Path
+
+logger = logging.getLogger("chexam.db.gemini_cache")
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    formatter = logging.Formatter('[%(levelname)s] %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+CACHE_PATH = Path(os.path.dirname(os.path.abspath(__file__))) / ".." / ".." / "data" / "gemini_cache.db"
+CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+
+# Set CHEXAM_GEMINI_CACHE=0 to always call the API
+CACHE_ENABLED = os.environ.get("CHEXAM_GEMINI_CACHE", "1") != "0"
+
+# The least recently used entries are evicted once either limit is exceeded
+MAX_ENTRIES = 1000
+MAX_BYTES = 16 * 1024 * 1024
+
+_initialized = False
+
+
+def _connect():
+    global _initialized
+    conn = sqlite3.connect(str(CACHE_PATH), timeout=10)
+    if not _initialized:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS gemini_cache (
+            key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL
+        )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_gemini_cache_last_used ON gemini_cache(last_used)")
+        conn.commit()
+        _initialized = True
+    return conn
+
+
+def make_key(image_bytes, prompt_version, num_questions):
+    """
+    Build the cache key for a request.
+
+    Args:
+        image_bytes: The optimized JPEG bytes that are sent to the API
+        prompt_version: Version of the prompt; bump it whenever the prompt changes
+        num_questions: Number of questions requested
+
+    Returns:
+        Hex SHA-256 digest identifying the request
+    """
+    digest = hashlib.sha256(image_bytes)
+    digest.update(f"|{prompt_version}|{num_questions}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_cached_result(key):
+    """
+    Look up a cached result and mark it as recently used.
+
+    Returns:
+        The cached result dictionary, or None on a miss
+    """
+    if not CACHE_ENABLED:
+        return None
+    try:
+        conn = _connect()
+        cursor = conn.cursor()
+        cursor.execute("SELECT result FROM gemini_cache WHERE key = ?", (key,))
+        row = cursor.fetchone()
+        if row:
+            cursor.execute("UPDATE gemini_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+        conn.close()
+        return json.loads(row[0]) if row else None
+    except Exception as e:
+        logger.error(f"Error reading Gemini cache: {str(e)}")
+        return None
+
+
+def save_cached_result(key, result):
+    """Store a result and evict the least recently used entries beyond the size limits."""
+    if not CACHE_ENABLED:
+        return False
+    try:
+        result_json = json.dumps(result)
+        now = time.time()
+
+        conn = _connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT OR REPLACE INTO gemini_cache (key, result, size, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, result_json, len(result_json), now, now)
+        )
+        _evict(cursor)
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        logger.error(f"Error writing Gemini cache: {str(e)}")
+        return False
+
+
+def _evict(cursor):
+    cursor.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM gemini_cache")
+    count, total = cursor.fetchone()
+    if count <= MAX_ENTRIES and total <= MAX_BYTES:
+        return
+
+    # Walk from the most recently used entry and keep everything that fits both limits
+    cursor.execute("SELECT key, size FROM gemini_cache ORDER BY last_used DESC")
+    kept_count = kept_bytes = 0
+    stale = []
+    for key, size in cursor.fetchall():
+        if kept_count < MAX_ENTRIES and kept_bytes + size <= MAX_BYTES:
+            kept_count += 1
+            kept_bytes += size
+        else:
+            stale.append((key,))
+    cursor.executemany("DELETE FROM gemini_cache WHERE key = ?", stale)
+    logger.info(f"Evicted {len(stale)} entries from the Gemini cache")
+
+
+def clear_cache():
+    """Remove every cached result."""
+    try:
+        conn = _connect()
+        conn.execute("DELETE FROM gemini_cache")
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        logger.error(f"Error clearing Gemini cache: {str(e)}")
+        return False
+
+
+def get_cache_stats():
+    """Return the number of cached results and their total size in bytes."""
+    try:
+        conn = _connect()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM gemini_cache")
+        count, total = cursor.fetchone()
+        conn.close()
+        return {"entries": count, "bytes": total}
+    except Exception as e:
+        logger.error(f"Error reading Gemini cache stats: {str(e)}")
+        return {"entries": 0, "bytes": 0}
@@ -0,0 +1,163 @@
+import json
+import logging
+
+from . import class_stats
+from .answer_codec import pack_answers
+from .connection import DB_PATH, get_connection
+
+logger = logging.getLogger("chexam.db.migrations")
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    formatter = logging.Formatter('[%(levelname)s] %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+
+def _create_tables(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS answer_keys (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        num_questions INTEGER NOT NULL,
+        answers TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS students (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS student_answers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,
+        answer_key_id INTEGER NOT NULL,
+        answers TEXT NOT NULL,
+        analyzed BOOLEAN DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE,
+        FOREIGN KEY (answer_key_id) REFERENCES answer_keys (id) ON DELETE CASCADE
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS analysis_results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,
+        answer_key_id INTEGER NOT NULL,
+        score TEXT NOT NULL,
+        percentage REAL NOT NULL,
+        correct_indices TEXT NOT NULL,
+        wrong_indices TEXT NOT NULL,
+        strengths TEXT NOT NULL,
+        weaknesses TEXT NOT NULL,
+        suggestions TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE,
+        FOREIGN KEY (answer_key_id) REFERENCES answer_keys (id) ON DELETE CASCADE
+    )
+    ''')
+
+
+def _add_answer_indexes(cursor):
+    # Older databases can hold several rows for one student and answer key. The app always
+    # read and updated the first one, so that is the row kept.
+    for table in ("student_answers", "analysis_results"):
+        cursor.execute(f'''
+        DELETE FROM {table}
+        WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY student_id, answer_key_id)
+        ''')
+        if cursor.rowcount:
+            logger.info(f"Removed {cursor.rowcount} duplicate rows from {table}")
+
+    cursor.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_student_answers_student_key
+    ON student_answers (student_id, answer_key_id)
+    ''')
+    cursor.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_analysis_results_student_key
+    ON analysis_results (student_id, answer_key_id)
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_student_answers_key ON student_answers (answer_key_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_analysis_results_key ON analysis_results (answer_key_id)")
+
+
+def _pack_answer_vectors(cursor):
+    # Rows whose answers cannot be packed stay as JSON text, which readers still accept
+    for table in ("answer_keys", "student_answers"):
+        cursor.execute(f"SELECT id, answers FROM {table} WHERE typeof(answers) = 'text'")
+        packed = []
+        for row_id, answers_json in cursor.fetchall():
+            try:
+                data = pack_answers(json.loads(answers_json))
+            except (TypeError, ValueError, AttributeError):
+                data = None
+            if data is not None:
+                packed.append((data, row_id))
+        cursor.executemany(f"UPDATE {table} SET answers = ? WHERE id = ?", packed)
+        if packed:
+            logger.info(f"Packed {len(packed)} answer vectors in {table}")
+
+
+def _add_class_stats(cursor):
+    class_stats.create_tables(cursor)
+    class_stats.rebuild(cursor)
+
+
+# Schema versions in order. The database's PRAGMA user_version records the last one applied;
+# append new migrations to the end and never change one that has shipped.
+MIGRATIONS = [
+    (1, "Create answer key, student, answer and analysis tables", _create_tables),
+    (2, "Unique (student_id, answer_key_id) indexes and answer_key_id indexes", _add_answer_indexes),
+    (3, "Store answer vectors as packed bytes instead of JSON", _pack_answer_vectors),
+    (4, "Incrementally maintained class statistics", _add_class_stats),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn=None):
+    conn = conn or get_connection()
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn=None):
+    """
+    Bring the database schema up to SCHEMA_VERSION, applying each pending migration in its
+    own transaction. Safe to call on every start-up; up-to-date databases are left untouched.
+
+    Returns:
+        The schema version after migrating
+    """
+    conn = conn or get_connection()
+    version = get_schema_version(conn)
+
+    for target, description, apply in MIGRATIONS:
+        if target <= version:
+            continue
+
+        # Take the write lock before re-reading the version, so two processes starting at
+        # once cannot both apply the same migration
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = get_schema_version(conn)
+            if target <= version:
+                conn.rollback()
+                continue
+            apply(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {int(target)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        version = target
+        logger.info(f"Migrated {DB_PATH.name} to schema version {target}: {description}")
+
+    return version
@@ -1,11 +1,17 @@
 import sqlite3
-import os
 import json
 import logging
 import random
-from pathlib import Path
 from datetime import datetime
 
+import numpy as np
+
+from . import class_stats
+from .answer_codec import to_db, from_db, answer_codes
+from ..processing.scoring import encode_answers
+from .connection import DB_PATH, get_connection, rollback
+from .migrations import migrate
+
 logger = logging.getLogger("chexam.db.student_db")
 logger.setLevel(logging.INFO)
 if not logger.handlers:
@@ -14,64 +20,20 @@ if not logger.handlers:
     handler.setFormatter(formatter)
     logger.addHandler(handler)
 
-DB_PATH = Path(os.path.dirname(os.path.abspath(__file__))) / ".." / ".." / "data" / "chexam.db"
-DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
 def initialize_student_db():
     try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS students (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS student_answers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id INTEGER NOT NULL,
-            answer_key_id INTEGER NOT NULL,
-            answers TEXT NOT NULL,
-            analyzed BOOLEAN DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE,
-            FOREIGN KEY (answer_key_id) REFERENCES answer_keys (id) ON DELETE CASCADE
-        )
-        ''')
-        
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS analysis_results (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id INTEGER NOT NULL,
-            answer_key_id INTEGER NOT NULL,
-            score TEXT NOT NULL,
-            percentage REAL NOT NULL,
-            correct_indices TEXT NOT NULL,
-            wrong_indices TEXT NOT NULL,
-            strengths TEXT NOT NULL,
-            weaknesses TEXT NOT NULL,
-            suggestions TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE,
-            FOREIGN KEY (answer_key_id) REFERENCES answer_keys (id) ON DELETE CASCADE
-        )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        migrate()
         logger.info(f"Student database tables initialized at {DB_PATH}")
         return True
     except Exception as e:
+        rollback()
         logger.error(f"Error initializing student database: {str(e)}")
         return False
 
 def add_student(name):
     try:
-        conn = sqlite3.connect(str(DB_PATH))
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute("SELECT id FROM students WHERE name = ?", (name,))
@@ -79,7 +41,6 @@ def add_student(name):
         
         if existing:
             logger.info(f"Student '{name}' already exists with ID {existing[0]}")
-            conn.close()
             return existing[0]
         
         cursor.execute(
@@ -89,16 +50,16 @@ def add_student(name):
         student_id = cursor.lastrowid
         
         conn.commit()
-        conn.close()
         logger.info(f"Added new student '{name}' with ID {student_id}")
         return student_id
     except Exception as e:
+        rollback()
         logger.error(f"Error adding student: {str(e)}")
         return None
 
 def get_student(student_id=None, name=None):
     try:
-        conn = sqlite3.connect(str(DB_PATH))
+        conn = get_connection()
         cursor = conn.cursor()
         
         if student_id is not None:
@@ -107,11 +68,9 @@ def get_student(student_id=None, name=None):
             cursor.execute("SELECT * FROM students WHERE name = ?", (name,))
         else:
             logger.error("Either student_id or name must be provided")
-            conn.close()
             return None
         
         row = cursor.fetchone()
-        conn.close()
         
         if row:
             return {
@@ -122,17 +81,17 @@ def get_student(student_id=None, name=None):
         else:
             return None
     except Exception as e:
+        rollback()
         logger.error(f"Error getting student: {str(e)}")
         return None
 
 def get_all_students():
     try:
-        conn = sqlite3.connect(str(DB_PATH))
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute("SELECT id, name, created_at FROM students ORDER BY name")
         rows = cursor.fetchall()
-        conn.close()
         
         return [
             {
@@ -143,35 +102,51 @@ def get_all_students():
             for row in rows
         ]
     except Exception as e:
+        rollback()
         logger.error(f"Error getting all students: {str(e)}")
         return []
 
 def delete_student(student_id=None, name=None):
     try:
-        conn = sqlite3.connect(str(DB_PATH))
+        conn = get_connection()
         cursor = conn.cursor()
         
         if student_id is not None:
-            cursor.execute("DELETE FROM students WHERE id = ?", (student_id,))
+            cursor.execute("SELECT id FROM students WHERE id = ?", (student_id,))
         elif name is not None:
-            cursor.execute("DELETE FROM students WHERE name = ?", (name,))
+            cursor.execute("SELECT id FROM students WHERE name = ?", (name,))
         else:
             logger.error("Either student_id or name must be provided")
-            conn.close()
             return False
         
+        for (found_id,) in cursor.fetchall():
+            # Foreign keys are not enforced, so remove the student's rows here and take their
+            # results out of the class statistics
+            cursor.execute(
+                "SELECT answer_key_id, percentage, correct_indices, wrong_indices FROM analysis_results WHERE student_id = ?",
+                (found_id,)
+            )
+            delta = class_stats.StatsDelta()
+            for row in cursor.fetchall():
+                delta.remove(*row)
+            delta.apply(cursor)
+            
+            cursor.execute("DELETE FROM analysis_results WHERE student_id = ?", (found_id,))
+            cursor.execute("DELETE FROM student_answers WHERE student_id = ?", (found_id,))
+            cursor.execute("DELETE FROM students WHERE id = ?", (found_id,))
+        
         conn.commit()
-        conn.close()
         return True
     except Exception as e:
+        rollback()
         logger.error(f"Error deleting student: {str(e)}")
         return False
 
 def save_student_answers(student_id, answer_key_id, answers):
     try:
-        answers_json = json.dumps(answers)
+        answers_value = to_db(answers)
         
-        conn = sqlite3.connect(str(DB_PATH))
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -183,8 +158,11 @@ def save_student_answers(student_id, answer_key_id, answers):
         if existing:
             cursor.execute(
                 "UPDATE student_answers SET answers = ?, analyzed = 0 WHERE id = ?",
-                (answers_json, existing[0])
+                (answers_value, existing[0])
             )
+            delta = class_stats.StatsDelta()
+            delta.remove_existing(cursor, [(student_id, answer_key_id)])
+            delta.apply(cursor)
             cursor.execute(
                 "DELETE FROM analysis_results WHERE student_id = ? AND answer_key_id = ?",
                 (student_id, answer_key_id)
@@ -194,22 +172,22 @@ def save_student_answers(student_id, answer_key_id, answers):
         else:
             cursor.execute(
                 "INSERT INTO student_answers (student_id, answer_key_id, answers) VALUES (?, ?, ?)",
-                (student_id, answer_key_id, answers_json)
+                (student_id, answer_key_id, answers_value)
             )
             answer_id = cursor.lastrowid
             logger.info(f"Saved new answers for student ID {student_id} with answer key ID {answer_key_id}")
         
         conn.commit()
-        conn.close()
         return answer_id
     except Exception as e:
+        rollback()
         logger.error(f"Error saving student answers: {str(e)}")
         return None
 
 def get_student_answers(student_id, answer_key_id):
 
     try:
-        conn = sqlite3.connect(str(DB_PATH))
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -217,40 +195,51 @@ def get_student_answers(student_id, answer_key_id):
             (student_id, answer_key_id)
         )
         row = cursor.fetchone()
-        conn.close()
         
         if row and row[1]:
-            return json.loads(row[1])
+            return from_db(row[1])
         else:
             logger.warning(f"No answers found for student ID {student_id} and answer key ID {answer_key_id}")
             return {}
     except Exception as e:
+        rollback()
         logger.error(f"Error getting student answers: {str(e)}")
         return {}
 
-def get_all_student_answers(answer_key_id=None):
+def get_all_student_answers(answer_key_id=None, pending_only=False):
+    """
+    Get student answers with student names, optionally only those not yet analyzed.
+    
+    Args:
+        answer_key_id: Only answers for this answer key (optional)
+        pending_only: Only answers whose analyzed flag is not set
+        
+    Returns:
+        List of dictionaries, ordered by student name
+    """
     try:
-        conn = sqlite3.connect(str(DB_PATH))
+        conn = get_connection()
         cursor = conn.cursor()
         
+        pending = " AND sa.analyzed = 0" if pending_only else ""
         if answer_key_id is not None:
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT sa.id, s.id, s.name, sa.answer_key_id, sa.answers, sa.analyzed, sa.created_at
                 FROM student_answers sa
                 JOIN students s ON sa.student_id = s.id
-                WHERE sa.answer_key_id = ?
+                WHERE sa.answer_key_id = ?{pending}
                 ORDER BY s.name
             """, (answer_key_id,))
         else:
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT sa.id, s.id, s.name, sa.answer_key_id, sa.answers, sa.analyzed, sa.created_at
                 FROM student_answers sa
                 JOIN students s ON sa.student_id = s.id
+                WHERE 1 = 1{pending}
                 ORDER BY s.name
             """)
         
         rows = cursor.fetchall()
-        conn.close()
         
         return [
             {
@@ -258,19 +247,72 @@ def get_all_student_answers(answer_key_id=None):
                 'student_id': row[1],
                 'student_name': row[2],
                 'answer_key_id': row[3],
-                'answers': json.loads(row[4]),
+                'answers': from_db(row[4]),
                 'analyzed': bool(row[5]),
                 'created_at': row[6]
             }
             for row in rows
         ]
     except Exception as e:
+        rollback()
         logger.error(f"Error getting all student answers: {str(e)}")
         return []
 
+def get_answer_matrix(answer_key_id, num_questions):
+    """
+    Every student's answers for one answer key as a students x questions matrix of answer codes.
+
+    Packed rows are copied straight from their bytes without building dictionaries; the matrix
+    can be passed to ClassScores in place of a list of answer dictionaries.
+
+    Args:
+        answer_key_id: ID of the answer key
+        num_questions: Number of columns; column i holds question i + 1
+
+    Returns:
+        (students, matrix): students is a list of dicts with 'id', 'student_id', 'student_name'
+        and 'analyzed', in the order of the matrix rows; matrix is a uint8 numpy array.
+        ([], empty matrix) on error.
+    """
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT sa.id, s.id, s.name, sa.answers, sa.analyzed
+            FROM student_answers sa
+            JOIN students s ON sa.student_id = s.id
+            WHERE sa.answer_key_id = ?
+            ORDER BY s.name
+        """, (answer_key_id,))
+        rows = cursor.fetchall()
+
+        questions = [str(q) for q in range(1, num_questions + 1)]
+        students = []
+        matrix = np.zeros((len(rows), num_questions), dtype=np.uint8)
+        for i, (answer_id, student_id, name, value, analyzed) in enumerate(rows):
+            if isinstance(value, bytes):
+                codes = answer_codes(value)[:num_questions]
+                matrix[i, :len(codes)] = codes
+            elif value:
+                # JSON rows the codec could not pack
+                matrix[i] = encode_answers(from_db(value), questions)
+            students.append({
+                'id': answer_id,
+                'student_id': student_id,
+                'student_name': name,
+                'analyzed': bool(analyzed)
+            })
+
+        return students, matrix
+    except Exception as e:
+        rollback()
+        logger.error(f"Error getting answer matrix: {str(e)}")
+        return [], np.zeros((0, num_questions), dtype=np.uint8)
+
 def save_analysis_result(student_id, answer_key_id, result):
     try:
-        conn = sqlite3.connect(str(DB_PATH))
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -282,6 +324,10 @@ def save_analysis_result(student_id, answer_key_id, result):
         correct_indices_json = json.dumps(result.get("correct_indices", []))
         wrong_indices_json = json.dumps(result.get("wrong_indices", []))
         
+        delta = class_stats.StatsDelta()
+        delta.remove_existing(cursor, [(student_id, answer_key_id)])
+        delta.add(answer_key_id, result.get("percentage", 0), correct_indices_json, wrong_indices_json)
+        
         if existing:
             cursor.execute(
                 """
@@ -332,14 +378,165 @@ def save_analysis_result(student_id, answer_key_id, result):
             "UPDATE student_answers SET analyzed = 1 WHERE student_id = ? AND answer_key_id = ?",
             (student_id, answer_key_id)
         )
+        delta.apply(cursor)
         
         conn.commit()
-        conn.close()
         return result_id
     except Exception as e:
+        rollback()
         logger.error(f"Error saving analysis result: {str(e)}")
         return None
 
+def add_students(names):
+    """
+    Add many students in one transaction, reusing existing students with the same name.
+    
+    Args:
+        names: Iterable of student names
+        
+    Returns:
+        Dictionary mapping each name to its student ID, or None on error
+    """
+    try:
+        names = list(dict.fromkeys(names))
+        
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        cursor.executemany("INSERT OR IGNORE INTO students (name) VALUES (?)", [(name,) for name in names])
+        
+        ids = {}
+        # Stay below SQLite's limit on bound parameters per statement
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f"SELECT name, id FROM students WHERE name IN ({placeholders})", chunk)
+            ids.update(cursor.fetchall())
+        
+        conn.commit()
+        logger.info(f"Added or found {len(ids)} students")
+        return ids
+    except Exception as e:
+        rollback()
+        logger.error(f"Error adding students: {str(e)}")
+        return None
+
+def save_student_answers_bulk(records):
+    """
+    Save answers for many students in one transaction.
+    
+    Same behaviour as save_student_answers for every record: existing answers are replaced,
+    marked as not analyzed, and their old analysis result is removed.
+    
+    Args:
+        records: Iterable of (student_id, answer_key_id, answers) tuples
+        
+    Returns:
+        Number of records saved, or None on error
+    """
+    try:
+        # The last record wins when the same student and answer key appear more than once
+        latest = {(student_id, answer_key_id): answers for student_id, answer_key_id, answers in records}
+        rows = [(student_id, answer_key_id, to_db(answers)) for (student_id, answer_key_id), answers in latest.items()]
+        if not rows:
+            return 0
+        
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        cursor.executemany(
+            """
+            INSERT INTO student_answers (student_id, answer_key_id, answers) VALUES (?, ?, ?)
+            ON CONFLICT (student_id, answer_key_id) DO UPDATE SET answers = excluded.answers, analyzed = 0
+            """,
+            rows
+        )
+        delta = class_stats.StatsDelta()
+        delta.remove_existing(cursor, latest.keys())
+        delta.apply(cursor)
+        cursor.executemany(
+            "DELETE FROM analysis_results WHERE student_id = ? AND answer_key_id = ?",
+            [(student_id, answer_key_id) for student_id, answer_key_id, _ in rows]
+        )
+        
+        conn.commit()
+        logger.info(f"Saved answers for {len(rows)} students")
+        return len(rows)
+    except Exception as e:
+        rollback()
+        logger.error(f"Error saving student answers in bulk: {str(e)}")
+        return None
+
+def save_analysis_results_bulk(records):
+    """
+    Save analysis results for many students in one transaction.
+    
+    Same behaviour as save_analysis_result for every record, including marking the
+    student's answers as analyzed.
+    
+    Args:
+        records: Iterable of (student_id, answer_key_id, result) tuples
+        
+    Returns:
+        Number of records saved, or None on error
+    """
+    try:
+        latest = {(student_id, answer_key_id): result for student_id, answer_key_id, result in records}
+        rows = [
+            (
+                result.get("score", "0/0"),
+                result.get("percentage", 0),
+                json.dumps(result.get("correct_indices", [])),
+                json.dumps(result.get("wrong_indices", [])),
+                result.get("strengths", ""),
+                result.get("weaknesses", ""),
+                result.get("suggestions", ""),
+                student_id,
+                answer_key_id
+            )
+            for (student_id, answer_key_id), result in latest.items()
+        ]
+        if not rows:
+            return 0
+        
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        delta = class_stats.StatsDelta()
+        delta.remove_existing(cursor, latest.keys())
+        for score, percentage, correct_json, wrong_json, _, _, _, _, answer_key_id in rows:
+            delta.add(answer_key_id, percentage, correct_json, wrong_json)
+        
+        cursor.executemany(
+            """
+            INSERT INTO analysis_results (
+                score, percentage,
+                correct_indices, wrong_indices,
+                strengths, weaknesses, suggestions,
+                student_id, answer_key_id
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (student_id, answer_key_id) DO UPDATE SET
+                score = excluded.score, percentage = excluded.percentage,
+                correct_indices = excluded.correct_indices, wrong_indices = excluded.wrong_indices,
+                strengths = excluded.strengths, weaknesses = excluded.weaknesses,
+                suggestions = excluded.suggestions
+            """,
+            rows
+        )
+        cursor.executemany(
+            "UPDATE student_answers SET analyzed = 1 WHERE student_id = ? AND answer_key_id = ?",
+            [row[-2:] for row in rows]
+        )
+        delta.apply(cursor)
+        
+        conn.commit()
+        logger.info(f"Saved analysis results for {len(rows)} students")
+        return len(rows)
+    except Exception as e:
+        rollback()
+        logger.error(f"Error saving analysis results in bulk: {str(e)}")
+        return None
+
 def get_analysis_result(student_id, answer_key_id):
     """
     Get an analysis result from the database.
@@ -352,7 +549,7 @@ def get_analysis_result(student_id, answer_key_id):
         Dictionary with analysis result, or None if not found
     """
     try:
-        conn = sqlite3.connect(str(DB_PATH))
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -365,7 +562,6 @@ def get_analysis_result(student_id, answer_key_id):
             (student_id, answer_key_id)
         )
         row = cursor.fetchone()
-        conn.close()
         
         if row:
             return {
@@ -382,12 +578,13 @@ def get_analysis_result(student_id, answer_key_id):
         else:
             return None
     except Exception as e:
+        rollback()
         logger.error(f"Error getting analysis result: {str(e)}")
         return None
 
 def get_all_analysis_results(answer_key_id=None):
     try:
-        conn = sqlite3.connect(str(DB_PATH))
+        conn = get_connection()
         cursor = conn.cursor()
         
         if answer_key_id is not None:
@@ -416,7 +613,6 @@ def get_all_analysis_results(answer_key_id=None):
             )
         
         rows = cursor.fetchall()
-        conn.close()
         
         return [
             {
@@ -436,6 +632,7 @@ def get_all_analysis_results(answer_key_id=None):
             for row in rows
         ]
     except Exception as e:
+        rollback()
         logger.error(f"Error getting all analysis results: {str(e)}")
         return []
 
@@ -452,7 +649,7 @@ def generate_answers_for_existing_students(num_questions=60):
             logger.error("No answer keys found. Please create at least one answer key first.")
             return False
         
-        conn = sqlite3.connect(str(DB_PATH))
+        conn = get_connection()
         cursor = conn.cursor()
         
         # Get all existing students
@@ -461,7 +658,6 @@ def generate_answers_for_existing_students(num_questions=60):
         
         if not student_ids:
             logger.info("No existing students found.")
-            conn.close()
             return True
         
         # For each student and answer key combination, check if answers exist
@@ -480,12 +676,11 @@ def generate_answers_for_existing_students(num_questions=60):
                 
                 # Generate random answers for this student and answer key
                 answers = {str(q): random.choice(['A', 'B', 'C', 'D']) for q in range(1, num_questions + 1)}
-                answers_json = json.dumps(answers)
                 
                 try:
                     cursor.execute(
                         "INSERT INTO student_answers (student_id, answer_key_id, answers) VALUES (?, ?, ?)",
-                        (student_id, answer_key_id, answers_json)
+                        (student_id, answer_key_id, to_db(answers))
                     )
                     answers_added += 1
                 except sqlite3.IntegrityError as e:
@@ -493,7 +688,6 @@ def generate_answers_for_existing_students(num_questions=60):
                     continue
         
         conn.commit()
-        conn.close()
         
         if answers_added > 0:
             logger.info(f"Generated {answers_added} answer sets for existing students")
@@ -502,6 +696,7 @@ def generate_answers_for_existing_students(num_questions=60):
         
         return True
     except Exception as e:
+        rollback()
         logger.error(f"Error generating answers for existing students: {str(e)}")
         return False
 
@@ -514,7 +709,7 @@ def generate_random_student_data(num_students=30, num_questions=60):
             logger.error("No answer keys found. Please create at least one answer key first.")
             return False
         
-        conn = sqlite3.connect(str(DB_PATH))
+        conn = get_connection()
         cursor = conn.cursor()
         
         first_names = [
@@ -577,12 +772,11 @@ def generate_random_student_data(num_students=30, num_questions=60):
                 
                 # Generate random answers for this student and answer key
                 answers = {str(q): random.choice(['A', 'B', 'C', 'D']) for q in range(1, num_questions + 1)}
-                answers_json = json.dumps(answers)
                 
                 try:
                     cursor.execute(
                         "INSERT INTO student_answers (student_id, answer_key_id, answers) VALUES (?, ?, ?)",
-                        (student_id, answer_key_id, answers_json)
+                        (student_id, answer_key_id, to_db(answers))
                     )
                     answers_added += 1
                 except sqlite3.IntegrityError as e:
@@ -590,7 +784,6 @@ def generate_random_student_data(num_students=30, num_questions=60):
                     continue
         
         conn.commit()
-        conn.close()
         
         # Also generate answers for any existing students that might not have answers for all answer keys
         generate_answers_for_existing_students(num_questions)
@@ -602,6 +795,7 @@ def generate_random_student_data(num_students=30, num_questions=60):
             logger.warning(f"Only generated {students_added} out of {num_students} requested students")
             return students_added > 0
     except Exception as e:
+        rollback()
         logger.error(f"Error generating random student data: {str(e)}")
         return False
 
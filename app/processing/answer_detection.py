@@ -2,16 +2,39 @@ import numpy as np
 import cv2
 import logging
 import math
+from ..utils import debug_artifacts
 
-def detect_bubbles(warped_img, debug=False, debug_save_path=None):
+def contour_fill(binary, contour, bounding_rect=None):
+    """
+    Mean value of the binary image inside a contour.
+    
+    Only the contour's bounding box is masked and averaged, so the cost depends on the
+    bubble size rather than on the size of the whole image.
+    
+    Args:
+        binary: Binary (thresholded) image
+        contour: Contour as returned by cv2.findContours
+        bounding_rect: (x, y, w, h) of the contour, if already computed
+        
+    Returns:
+        Mean pixel value inside the contour, or 0 if the contour covers no pixels
+    """
+    x, y, w, h = bounding_rect if bounding_rect is not None else cv2.boundingRect(contour)
+    mask = np.zeros((h, w), dtype=np.uint8)
+    cv2.drawContours(mask, [contour], 0, 255, -1, offset=(-x, -y))
+    return cv2.mean(binary[y:y + h, x:x + w], mask=mask)[0]
+
+def detect_bubbles(warped_img, debug=False, debug_save_path=None, template=None):
     """
     Detect filled bubbles in a processed exam sheet image.
     Specifically designed for 60-question bubble sheets with A, B, C, D options.
     
     Args:
         warped_img: Preprocessed image (grayscale or binary)
-        debug: If True, save debug images and print verbose info
-        debug_save_path: Path prefix for debug images
+        debug: If True, print verbose info
+        debug_save_path: Name prefix for debug artifacts (saved only when utils/debug_artifacts is enabled)
+        template: SheetTemplate describing the sheet layout (optional). When given, fill is
+            sampled at the known bubble positions instead of searching for bubble contours.
         
     Returns:
         A dictionary with question numbers as keys and detected answers as values
@@ -25,6 +48,12 @@ def detect_bubbles(warped_img, debug=False, debug_save_path=None):
         handler.setFormatter(formatter)
         logger.addHandler(handler)
     
+    if template is not None:
+        results = template.detect_answers(warped_img)
+        if debug:
+            logger.debug(f"Detected answers from template: {results}")
+        return results
+    
     if len(warped_img.shape) == 3:
         gray = cv2.cvtColor(warped_img, cv2.COLOR_BGR2GRAY)
     else:
@@ -35,8 +64,8 @@ def detect_bubbles(warped_img, debug=False, debug_save_path=None):
     else:
         binary = gray
         
-    if debug and debug_save_path:
-        cv2.imwrite(debug_save_path + '_binary.png', binary)
+    if debug_artifacts.enabled():
+        debug_artifacts.save_image('binary', binary, prefix=debug_save_path)
     
     contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     
@@ -57,9 +86,7 @@ def detect_bubbles(warped_img, debug=False, debug_save_path=None):
             x, y, w, h = cv2.boundingRect(contour)
             aspect_ratio = float(w) / h
             if 0.8 < aspect_ratio < 1.2:
-                mask = np.zeros_like(gray)
-                cv2.drawContours(mask, [contour], 0, 255, -1)
-                fill_percentage = np.sum(binary[mask == 255]) / np.sum(mask == 255) if np.sum(mask == 255) > 0 else 0
+                fill_percentage = contour_fill(binary, contour, (x, y, w, h))
                 
                 if fill_percentage > 0.4:
                     center_x = x + w/2
@@ -162,32 +189,32 @@ def detect_bubbles(warped_img, debug=False, debug_save_path=None):
     if debug:
         logger.debug(f"Detected answers: {results}")
         
-        if debug_save_path:
-            if len(warped_img.shape) == 2:
-                debug_img = cv2.cvtColor(warped_img, cv2.COLOR_GRAY2BGR)
-            else:
-                debug_img = warped_img.copy()
-                
-            for bubble in bubbles:
-                center = (int(bubble['center'][0]), int(bubble['center'][1]))
-                radius = int(math.sqrt(bubble['area'] / math.pi))
-                cv2.circle(debug_img, center, radius, (0, 0, 255), 1)
-            
+    if debug_artifacts.enabled():
+        if len(warped_img.shape) == 2:
+            debug_img = cv2.cvtColor(warped_img, cv2.COLOR_GRAY2BGR)
+        else:
+            debug_img = warped_img.copy()
             
-            for q_num, answer in results.items():
-                for row in rows:
-                    for i, bubble in enumerate(row):
-                        if i < len(answer_options) and answer_options[i] == answer:
-             
-                            center = (int(bubble['center'][0]), int(bubble['center'][1]))
-                            radius = int(math.sqrt(bubble['area'] / math.pi))
+        for bubble in bubbles:
+            center = (int(bubble['center'][0]), int(bubble['center'][1]))
+            radius = int(math.sqrt(bubble['area'] / math.pi))
+            cv2.circle(debug_img, center, radius, (0, 0, 255), 1)
+        
+        
+        for q_num, answer in results.items():
+            for row in rows:
+                for i, bubble in enumerate(row):
+                    if i < len(answer_options) and answer_options[i] == answer:
+         
+                        center = (int(bubble['center'][0]), int(bubble['center'][1]))
+                        radius = int(math.sqrt(bubble['area'] / math.pi))
 
-                            cv2.circle(debug_img, center, radius, (0, 255, 0), 2)
-                 
-                            cv2.putText(debug_img, f"{q_num}:{answer}", 
-                                       (center[0]-10, center[1]-radius-5),
-                                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-            
-            cv2.imwrite(debug_save_path + '_detected.png', debug_img)
+                        cv2.circle(debug_img, center, radius, (0, 255, 0), 2)
+             
+                        cv2.putText(debug_img, f"{q_num}:{answer}", 
+                                   (center[0]-10, center[1]-radius-5),
+                                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+        
+        debug_artifacts.save_image('detected', debug_img, prefix=debug_save_path)
     
     return results
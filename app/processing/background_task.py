@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger("chexam.processing.background_task")
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    formatter = logging.Formatter('[%(levelname)s] %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+
+class BackgroundTask:
+    """
+    Runs one slow call (e.g. a Gemini request) on a daemon thread so the UI stays responsive.
+
+    The task can be cancelled and given a timeout. A running network call cannot be
+    interrupted, so both simply make the task drop its result: once cancelled or timed out,
+    on_done and on_error are never called. Callbacks go through `dispatch`, which UI code sets
+    to something like `lambda fn: Clock.schedule_once(lambda dt: fn())` so they run on the
+    main thread; the cancelled check is repeated there, so a result already on its way is
+    still dropped after cancel().
+    """
+
+    def __init__(self, func, on_done=None, on_error=None, on_progress=None, on_timeout=None,
+                 timeout=None, dispatch=None, name="chexam-background-task"):
+        """
+        Args:
+            func: Called as func(task) on the worker thread; may call task.progress(message)
+                and check task.cancelled. Its return value is passed to on_done.
+            on_done: Called with the result
+            on_error: Called with the exception func raised
+            on_progress: Called with each progress message
+            on_timeout: Called if func has not finished after `timeout` seconds
+            timeout: Seconds before the task gives up (None waits forever)
+            dispatch: Runs each callback, e.g. on the UI thread (default: call directly)
+            name: Name of the worker thread
+        """
+        self.func = func
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.on_timeout = on_timeout
+        self.timeout = timeout
+        self.dispatch = dispatch or (lambda fn: fn())
+        self.name = name
+
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+        self._timer = None
+        self._thread = None
+        self.timed_out = False
+        self.started_at = None
+        self.duration = None
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def finished(self):
+        return self._finished.is_set()
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        if self.timeout is not None:
+            self._timer = threading.Timer(self.timeout, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def cancel(self):
+        """Stop waiting for the result; it will be dropped when it arrives."""
+        self._cancelled.set()
+        if self._timer is not None:
+            self._timer.cancel()
+
+    def progress(self, message):
+        """Report progress from func (worker thread)."""
+        if self.on_progress and not self.cancelled:
+            self._dispatch(self.on_progress, message)
+
+    def _expire(self):
+        if self.finished or self.cancelled:
+            return
+        self.timed_out = True
+        self._cancelled.set()
+        logger.warning(f"{self.name} timed out after {self.timeout} s")
+        if self.on_timeout:
+            self.dispatch(self.on_timeout)
+
+    def _dispatch(self, callback, *args):
+        def call():
+            if self.cancelled:
+                return
+            try:
+                callback(*args)
+            except Exception as e:
+                logger.error(f"{self.name} callback failed: {str(e)}")
+        self.dispatch(call)
+
+    def _run(self):
+        try:
+            result = self.func(self)
+        except Exception as e:
+            self._finish()
+            logger.error(f"{self.name} failed: {str(e)}")
+            if self.on_error:
+                self._dispatch(self.on_error, e)
+            return
+        self._finish()
+        if self.on_done:
+            self._dispatch(self.on_done, result)
+
+    def _finish(self):
+        self.duration = time.perf_counter() - self.started_at
+        self._finished.set()
+        if self._timer is not None:
+            self._timer.cancel()
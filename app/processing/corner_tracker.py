@@ -0,0 +1,131 @@
+import cv2
+import numpy as np
+from .image_processing import detect_document_corners, order_points, sharpness_score
+
+
+class CornerTracker:
+    """
+    Follows the four sheet corners from one camera frame to the next.
+
+    Instead of searching every frame for the sheet from scratch, the corners found in the
+    previous frame are tracked with pyramidal Lucas-Kanade optical flow. Full detection only
+    runs when tracking confidence drops, when nothing is being tracked yet, or every
+    `redetect_interval` frames to correct slow drift.
+
+    The tracker also counts how many consecutive frames the quad has stayed still and scores
+    the frame's sharpness, which callers can use to trigger automatic capture.
+    """
+
+    def __init__(self, max_dim=480, redetect_interval=30, min_confidence=0.5,
+                 max_flow_error=12.0, stable_tolerance=3.0):
+        """
+        Args:
+            max_dim: Longest side of the downscaled frame used for tracking and detection
+            redetect_interval: Run full detection at least this often (in frames)
+            min_confidence: Tracking results below this confidence fall back to full detection
+            max_flow_error: Optical flow error at which confidence reaches zero
+            stable_tolerance: Largest corner movement (downscaled pixels) still counted as stable
+        """
+        self.max_dim = max_dim
+        self.redetect_interval = redetect_interval
+        self.min_confidence = min_confidence
+        self.max_flow_error = max_flow_error
+        self.stable_tolerance = stable_tolerance
+
+        self._lk_params = dict(
+            winSize=(21, 21),
+            maxLevel=3,
+            criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03)
+        )
+        self.reset()
+
+    def reset(self):
+        self._prev_gray = None
+        self._pts = None
+        self._anchor = None
+        self._frames_since_detect = 0
+        self.stable_frames = 0
+        self.confidence = 0.0
+        self.sharpness = 0.0
+        self.last_method = None
+
+    def _track(self, gray):
+        """Track the previous corners into the new frame; returns (points, confidence)."""
+        prev_pts = self._pts.reshape(-1, 1, 2)
+        new_pts, status, err = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, prev_pts, None, **self._lk_params)
+
+        if new_pts is None or status is None or not status.all():
+            return None, 0.0
+
+        new_pts = new_pts.reshape(4, 2)
+        quad = new_pts.reshape(-1, 1, 2).astype(np.float32)
+        if not cv2.isContourConvex(quad):
+            return None, 0.0
+
+        # A sheet cannot suddenly change size; a big jump means a corner slipped
+        prev_area = cv2.contourArea(self._pts.reshape(-1, 1, 2).astype(np.float32))
+        area = cv2.contourArea(quad)
+        if prev_area <= 0 or not 0.8 < area / prev_area < 1.25:
+            return None, 0.0
+
+        confidence = float(max(0.0, 1.0 - float(err.mean()) / self.max_flow_error))
+        return order_points(new_pts), confidence
+
+    def update(self, frame):
+        """
+        Process the next camera frame.
+
+        Args:
+            frame: Camera frame (BGR format)
+
+        Returns:
+            Four corner points (ordered, full-resolution coordinates) or None if no sheet is found
+        """
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.max_dim / max(height, width))
+        if scale < 1.0:
+            small = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+        else:
+            small = frame
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if len(small.shape) == 3 else small
+
+        if self._prev_gray is not None and self._prev_gray.shape != gray.shape:
+            self.reset()
+
+        pts = None
+        confidence = 0.0
+        if self._pts is not None and self._frames_since_detect < self.redetect_interval:
+            pts, confidence = self._track(gray)
+            if pts is not None and confidence >= self.min_confidence:
+                self.last_method = 'tracked'
+                self._frames_since_detect += 1
+            else:
+                pts = None
+
+        if pts is None:
+            pts = detect_document_corners(small, max_dim=self.max_dim)
+            confidence = 1.0 if pts is not None else 0.0
+            self.last_method = 'detected'
+            self._frames_since_detect = 0
+
+        # Stability is measured against where the quad was when it stopped moving,
+        # so a slow drift does not count as holding still
+        if pts is not None and self._anchor is not None and \
+                np.abs(pts - self._anchor).max() <= self.stable_tolerance:
+            self.stable_frames += 1
+        else:
+            self.stable_frames = 0
+            self._anchor = pts
+
+        self._prev_gray = gray
+        self._pts = pts
+        self.confidence = confidence
+        self.sharpness = sharpness_score(gray) if pts is not None else 0.0
+
+        if pts is None:
+            return None
+        return pts / scale
+
+    def is_stable(self, frames):
+        """True once the sheet has been found and held still for the given number of frames."""
+        return self._pts is not None and self.stable_frames >= frames
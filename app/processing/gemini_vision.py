@@ -7,11 +7,14 @@ from io import BytesIO
 import json
 import re
 import asyncio
-import requests
 import time
 import os
 from typing import Dict, List, Tuple, Optional, Any, Union
 
+from ..utils import gemini_client
+from ..db import gemini_cache
+from ..utils import debug_artifacts, instrumentation
+
 # Import secure storage for API keys
 try:
     from ..utils.secure_storage import get_api_key, GEMINI_API_KEY as GEMINI_KEY_NAME
@@ -59,14 +62,30 @@ if not api_key:
         logger.warning("Gemini API key not found. Please add your API key in the Settings screen.")
 
 
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro-vision:generateContent"
+GEMINI_API_URL = gemini_client.api_url("/v1beta/models/gemini-pro-vision:generateContent")
+
+# Part of the result cache key; bump it whenever the prompt or the response parsing changes
+PROMPT_VERSION = 2
+
+# Multi-sheet mode attaches several sheets to one request so the long prompt and the request
+# overhead are paid once per group. Each sheet adds its answer JSON to the response, so the
+# group size is capped to keep the output within max_output_tokens.
+MAX_SHEETS_PER_REQUEST = 8
+SHEET_OUTPUT_TOKENS = 1024
 
-def optimize_image_for_gemini(image: np.ndarray) -> bytes:
+# Longest side of the image sent to Gemini; larger images are downscaled
+MAX_IMAGE_DIM = 1024
+
+@instrumentation.timed("gemini_optimize")
+def optimize_image_for_gemini(image: np.ndarray, max_dim: int = MAX_IMAGE_DIM, binarize: bool = True) -> bytes:
     """
     Optimize an image for the Gemini Vision API by enhancing contrast, resizing and compressing it.
     
     Args:
         image: OpenCV image (numpy array)
+        max_dim: Longest side in pixels; larger images are downscaled to fit
+        binarize: Turn the image black and white. Keeps bubble outlines crisp on a downscaled
+            sheet, but hollows out flat fills, so close-up crops are sent in contrast-enhanced gray
         
     Returns:
         Bytes of the optimized JPEG image
@@ -81,16 +100,16 @@ def optimize_image_for_gemini(image: np.ndarray) -> bytes:
     clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
     img_enhanced = clahe.apply(img_gray)
     
-    img_enhanced = cv2.GaussianBlur(img_enhanced, (3, 3), 0)
-    
-    img_enhanced = cv2.adaptiveThreshold(
-        img_enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2
-    )
+    if binarize:
+        img_enhanced = cv2.GaussianBlur(img_enhanced, (3, 3), 0)
+        
+        img_enhanced = cv2.adaptiveThreshold(
+            img_enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2
+        )
     
     
     img_enhanced = cv2.cvtColor(img_enhanced, cv2.COLOR_GRAY2BGR)
     
-    max_dim = 1024
     height, width = img_enhanced.shape[:2]
     
     if max(height, width) > max_dim:
@@ -102,16 +121,19 @@ def optimize_image_for_gemini(image: np.ndarray) -> bytes:
     encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), 90]  
     _, img_bytes = cv2.imencode('.jpg', img_enhanced, encode_params)
     
-    cv2.imwrite(f"gemini_enhanced_{int(time.time())}.png", img_enhanced)
+    debug_artifacts.save_image('gemini_enhanced', img_enhanced)
     
     return img_bytes.tobytes()
 
-def prepare_image_for_api(image: np.ndarray) -> Optional[Dict[str, str]]:
+def prepare_image_for_api(image: np.ndarray, max_dim: int = MAX_IMAGE_DIM,
+                          binarize: bool = True) -> Optional[Dict[str, str]]:
     """
     Prepare an image for the Gemini Vision API by optimizing and encoding it.
     
     Args:
         image: OpenCV image (numpy array)
+        max_dim: Longest side in pixels of the image sent
+        binarize: Send the image black and white (see optimize_image_for_gemini)
         
     Returns:
         Dictionary with mime_type and base64-encoded image data, or None if Gemini is not available
@@ -120,7 +142,7 @@ def prepare_image_for_api(image: np.ndarray) -> Optional[Dict[str, str]]:
         logger.error("Cannot prepare image for API: Gemini is not available")
         return None
         
-    img_bytes = optimize_image_for_gemini(image)
+    img_bytes = optimize_image_for_gemini(image, max_dim, binarize)
     
     return {
         "mime_type": "image/jpeg",
@@ -232,44 +254,9 @@ def visualize_bubble_detection(image: np.ndarray, grid_info: Dict[str, Any]) ->
     
     return vis_image
 
-async def process_bubble_sheet(image: np.ndarray, num_questions: int = 60, debug: bool = False) -> Optional[Dict[str, str]]:
-    """
-    Process a bubble sheet image using Gemini Vision API with enhanced spatial understanding.
-    Uses direct API calls instead of the Google Generative AI package.
-    
-    Args:
-        image: OpenCV image (numpy array)
-        num_questions: Number of questions on the sheet (default: 60)
-        debug: Whether to log debug information
-        
-    Returns:
-        Dictionary with question numbers as keys and selected options as values
-        (A, B, C, D or blank for no/multiple selections)
-    """
-    if not GEMINI_AVAILABLE:
-        logger.error("Cannot process bubble sheet: Gemini Vision API is not available")
-        logger.error("Please set your GEMINI_API_KEY in the .env file")
-        return None
-    
-    try:
-        grid_info = detect_bubble_grid(image)
-        if debug and grid_info["detected"]:
-            logger.debug(f"Detected bubble grid with {grid_info['rows']} rows and {grid_info['columns']} columns")
-        
-        spatial_prompt = create_spatial_reference_prompt(grid_info, num_questions)
-        
-        image_part = prepare_image_for_api(image)
-        if image_part is None:
-            return None
-            
-        if debug:
-            vis_image = visualize_bubble_detection(image, grid_info)
-            if vis_image is not None:
-                debug_path = f"gemini_analysis_{int(time.time())}_bubble_detection.png"
-                cv2.imwrite(debug_path, vis_image)
-                logger.debug(f"Saved bubble detection visualization to {debug_path}")
-        
-        prompt = f"""
+def build_bubble_sheet_prompt(num_questions: int, spatial_prompt: str = "") -> str:
+    """Build the instruction prompt sent with a bubble sheet image."""
+    return f"""
         You are an expert in analyzing bubble sheet (OMR) answer forms. 
         
         TASK: Analyze this bubble sheet image and identify which bubbles are filled in for each question.
@@ -309,171 +296,602 @@ async def process_bubble_sheet(image: np.ndarray, num_questions: int = 60, debug
         IMPORTANT: Your response must ONLY contain a JSON object with question numbers as keys and answers as values.
         Do not include any explanations, comments, or additional text outside the JSON structure.
         """
-        
-        if debug:
-            logger.debug(f"Sending image to Gemini Vision API with enhanced spatial understanding prompt")
-        
-        payload = {
-            "contents": [
-                {
-                    "parts": [
-                        {"text": prompt},
-                        {"inline_data": image_part}
-                    ]
-                }
-            ],
-            "generation_config": {
-                "temperature": 0.1,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 2048,
+
+
+def build_bubble_sheet_request(image: np.ndarray, num_questions: int = 60, debug: bool = False,
+                               max_dim: int = MAX_IMAGE_DIM, binarize: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Build the generateContent payload for one bubble sheet.
+
+    Args:
+        image: OpenCV image (numpy array)
+        num_questions: Number of questions on the sheet
+        debug: Whether to log debug information
+        max_dim: Longest side in pixels of the image sent
+        binarize: Send the image black and white (see optimize_image_for_gemini)
+
+    Returns:
+        The JSON payload, or None if the image could not be prepared
+    """
+    grid_info = detect_bubble_grid(image)
+    if debug and grid_info["detected"]:
+        logger.debug(f"Detected bubble grid with {grid_info['rows']} rows and {grid_info['columns']} columns")
+
+    spatial_prompt = create_spatial_reference_prompt(grid_info, num_questions)
+
+    image_part = prepare_image_for_api(image, max_dim, binarize)
+    if image_part is None:
+        return None
+
+    if debug_artifacts.enabled():
+        vis_image = visualize_bubble_detection(image, grid_info)
+        debug_path = debug_artifacts.save_image('gemini_analysis_bubble_detection', vis_image)
+        if debug and debug_path:
+            logger.debug(f"Saved bubble detection visualization to {debug_path}")
+
+    return {
+        "contents": [
+            {
+                "parts": [
+                    {"text": build_bubble_sheet_prompt(num_questions, spatial_prompt)},
+                    {"inline_data": image_part}
+                ]
             }
+        ],
+        "generation_config": {
+            "temperature": 0.1,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 2048,
         }
+    }
+
+
+def image_cache_key(image_part: Dict[str, str], num_questions: int) -> str:
+    """Cache key for one sheet: the optimized JPEG bytes, prompt version and question count."""
+    return gemini_cache.make_key(base64.b64decode(image_part["data"]), PROMPT_VERSION, num_questions)
+
+
+def bubble_sheet_cache_key(payload: Dict[str, Any], num_questions: int) -> str:
+    """Cache key for a bubble sheet request (see image_cache_key)."""
+    return image_cache_key(payload["contents"][0]["parts"][1]["inline_data"], num_questions)
+
+
+async def request_bubble_sheet(payload: Dict[str, Any], image: np.ndarray, num_questions: int = 60,
+                               rate_limiter: Optional[gemini_client.AsyncRateLimiter] = None,
+                               debug: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Get the answers for a prepared request, from the result cache when the same sheet was sent before.
+
+    Args:
+        payload: Payload from build_bubble_sheet_request
+        image: The image the payload was built from
+        num_questions: Number of questions on the sheet
+        rate_limiter: Limiter to wait on before calling the API (optional)
+        debug: Whether to log debug information
+
+    Returns:
+        Result dictionary as returned by parse_bubble_sheet_response, or None on failure
+    """
+    cache_key = bubble_sheet_cache_key(payload, num_questions)
+    cached = await asyncio.to_thread(gemini_cache.get_cached_result, cache_key)
+    if cached is not None:
+        logger.info("Using cached Gemini result for this sheet")
+        return cached
+
+    if rate_limiter is not None:
+        await rate_limiter.acquire(gemini_client.estimate_request_tokens(payload))
+    response = await send_gemini_request(payload)
+    result = parse_bubble_sheet_response(response, image, num_questions, debug)
+
+    if result is not None:
+        await asyncio.to_thread(gemini_cache.save_cached_result, cache_key, result)
+    return result
+
+
+async def send_gemini_request(payload: Dict[str, Any]):
+    """Send a generateContent payload on the pooled session without blocking the event loop."""
+    headers = {
+        "Authorization": f"Bearer {api_key}"
+    }
+    return await asyncio.to_thread(
+        gemini_client.post_json,
+        GEMINI_API_URL,
+        payload,
+        api_key=api_key,
+        headers=headers
+    )
+
+
+def format_sheet_result(answers: Dict[str, Any], num_questions: int = 60) -> Dict[str, Any]:
+    """
+    Build the result dictionary for one sheet from the answers Gemini returned.
+
+    Every question from 1 to num_questions gets A, B, C, D or "blank" (for missing or
+    unrecognised answers).
+    """
+    formatted_answers = {}
+    for i in range(1, num_questions + 1):
+        question_key = str(i)
+        if question_key in answers:
+            answer = str(answers[question_key]).upper()
+            if answer in ['A', 'B', 'C', 'D']:
+                formatted_answers[question_key] = answer
+            else:
+                formatted_answers[question_key] = "blank"
+        else:
+            formatted_answers[question_key] = "blank"
+
+    return {
+        "answers": formatted_answers,
+        "score": 0,
+        "percentage": 0,
+        "summary": "No answer key available for comparison"
+    }
+
+
+@instrumentation.timed("gemini_parse", outcome=lambda result: "ok" if result else "failed")
+def parse_bubble_sheet_response(response, image: np.ndarray, num_questions: int = 60, debug: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Turn a Gemini HTTP response into the answers dictionary.
+
+    Args:
+        response: requests.Response returned by the API
+        image: The image that was sent (used for debug visualizations)
+        num_questions: Number of questions on the sheet
+        debug: Whether to log debug information
+
+    Returns:
+        Dictionary with "answers", "score", "percentage" and "summary", or None on failure or when
+        no answers could be read from the reply
+    """
+    if response.status_code != 200:
+        logger.error(f"Gemini API request failed with status code {response.status_code}")
+        logger.error(f"Response: {response.text}")
+        return None
+    
+    response_json = response.json()
+    
+    try:
+        try:
+            response_text = response_json["candidates"][0]["content"]["parts"][0]["text"]
+        except (KeyError, IndexError) as e:
+            logger.error(f"Failed to extract text from Gemini API response: {str(e)}")
+            logger.error(f"Response: {response_json}")
+            return None
         
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
+        logger.debug(f"Raw response from Gemini: {response_text}")
         
-        response = await asyncio.to_thread(
-            requests.post,
-            f"{GEMINI_API_URL}?key={api_key}",
-            headers=headers,
-            json=payload
-        )
+        answers = {}
         
-        if response.status_code != 200:
-            logger.error(f"Gemini API request failed with status code {response.status_code}")
-            logger.error(f"Response: {response.text}")
-            return None
+        import re
         
-        response_json = response.json()
+        json_match = re.search(r'\{[\s\S]*?\}', response_text)
         
-        try:
-            try:
-                response_text = response_json["candidates"][0]["content"]["parts"][0]["text"]
-            except (KeyError, IndexError) as e:
-                logger.error(f"Failed to extract text from Gemini API response: {str(e)}")
-                logger.error(f"Response: {response_json}")
-                return None
-            
-            logger.debug(f"Raw response from Gemini: {response_text}")
-            
-            answers = {}
+        if json_match:
+            json_str = json_match.group(0)
+            logger.debug(f"Extracted JSON string: {json_str}")
             
-            import re
-            
-            json_match = re.search(r'\{[\s\S]*?\}', response_text)
-            
-            if json_match:
-                json_str = json_match.group(0)
-                logger.debug(f"Extracted JSON string: {json_str}")
+            try:
+                answers = json.loads(json_str)
+                logger.info(f"Successfully extracted {len(answers)} answers from Gemini Vision API")
+            except json.JSONDecodeError as e:
+                logger.error(f"Error parsing JSON from Gemini response: {str(e)}")
+                logger.error(f"JSON string that failed to parse: {json_str}")
                 
                 try:
-                    answers = json.loads(json_str)
-                    logger.info(f"Successfully extracted {len(answers)} answers from Gemini Vision API")
+                    clean_json = re.sub(r'[^{}\[\]:,"\d\w\s.-]', '', json_str)
+                    clean_json = clean_json.replace("'", '"')
+                    clean_json = re.sub(r',\s*\}', '}', clean_json)
+                    clean_json = re.sub(r',\s*\]', ']', clean_json)
+                    clean_json = re.sub(r'//.*?\n', '', clean_json)
+                    clean_json = re.sub(r'/\*.*?\*/', '', clean_json, flags=re.DOTALL)
+                    
+                    answers = json.loads(clean_json)
+                    logger.info(f"Successfully extracted {len(answers)} answers after cleanup")
                 except json.JSONDecodeError as e:
-                    logger.error(f"Error parsing JSON from Gemini response: {str(e)}")
-                    logger.error(f"JSON string that failed to parse: {json_str}")
+                    logger.error(f"Failed to parse JSON even after cleanup: {str(e)}")
                     
                     try:
-                        clean_json = re.sub(r'[^{}\[\]:,"\d\w\s.-]', '', json_str)
-                        clean_json = clean_json.replace("'", '"')
-                        clean_json = re.sub(r',\s*\}', '}', clean_json)
-                        clean_json = re.sub(r',\s*\]', ']', clean_json)
-                        clean_json = re.sub(r'//.*?\n', '', clean_json)
-                        clean_json = re.sub(r'/\*.*?\*/', '', clean_json, flags=re.DOTALL)
-                        
-                        answers = json.loads(clean_json)
-                        logger.info(f"Successfully extracted {len(answers)} answers after cleanup")
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Failed to parse JSON even after cleanup: {str(e)}")
-                        
-                        try:
-                            pairs = re.findall(r'"(\d+)"\s*:\s*"([A-Da-d]|blank)"', json_str)
-                            if pairs:
-                                for q_num, answer in pairs:
-                                    answers[q_num] = answer.upper()
-                                logger.info(f"Successfully extracted {len(answers)} answers using regex pattern matching")
-                        except Exception as e:
-                            logger.error(f"Failed to extract answers using regex: {str(e)}")
-            
-            if not answers:
-                try:
-                    pairs = re.findall(r'"(\d+)"\s*:\s*"([A-Da-d]|blank)"', response_text)
-                    if pairs:
-                        for q_num, answer in pairs:
-                            answers[q_num] = answer.upper()
-                        logger.info(f"Successfully extracted {len(answers)} answers using regex pattern matching on full text")
-                except Exception as e:
-                    logger.error(f"Failed to extract answers using regex on full text: {str(e)}")
-                    
-            
-            if not answers:
-                logger.debug("Attempting to extract answers line by line")
-                lines = response_text.strip().split('\n')
-                for line in lines:
-                    match = re.search(r'(?:Question\s*)?"?(\d+)"?\s*[:.]?\s*"?([A-Da-d]|blank)"?', line)
-                    if match:
-                        q_num, answer = match.groups()
+                        pairs = re.findall(r'"(\d+)"\s*:\s*"([A-Da-d]|blank)"', json_str)
+                        if pairs:
+                            for q_num, answer in pairs:
+                                answers[q_num] = answer.upper()
+                            logger.info(f"Successfully extracted {len(answers)} answers using regex pattern matching")
+                    except Exception as e:
+                        logger.error(f"Failed to extract answers using regex: {str(e)}")
+        
+        if not answers:
+            try:
+                pairs = re.findall(r'"(\d+)"\s*:\s*"([A-Da-d]|blank)"', response_text)
+                if pairs:
+                    for q_num, answer in pairs:
                         answers[q_num] = answer.upper()
+                    logger.info(f"Successfully extracted {len(answers)} answers using regex pattern matching on full text")
+            except Exception as e:
+                logger.error(f"Failed to extract answers using regex on full text: {str(e)}")
                 
-                if answers:
-                    logger.debug(f"Extracted {len(answers)} answers from line-by-line parsing")
+        
+        if not answers:
+            logger.debug("Attempting to extract answers line by line")
+            lines = response_text.strip().split('\n')
+            for line in lines:
+                match = re.search(r'(?:Question\s*)?"?(\d+)"?\s*[:.]?\s*"?([A-Da-d]|blank)"?', line)
+                if match:
+                    q_num, answer = match.groups()
+                    answers[q_num] = answer.upper()
             
-            if debug:
-                debug_path = f"gemini_content_{int(time.time())}.txt"
-                with open(debug_path, 'w') as f:
-                    f.write(response_text)
-                logger.debug(f"Saved Gemini response to {debug_path}")
-                
-                if answers:
-                    vis_image = image.copy()
-                    for q_num, answer in sorted(answers.items(), key=lambda x: int(x[0])):
-                        y_pos = 30 + (int(q_num) - 1) * 30
-                        cv2.putText(vis_image, f"Q{q_num}: {answer}", (10, y_pos), 
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                    
-                    debug_path = f"gemini_content_{int(time.time())}_bubble_detection.png"
-                    cv2.imwrite(debug_path, vis_image)
-                    logger.debug(f"Saved answer visualization to {debug_path}")
+            if answers:
+                logger.debug(f"Extracted {len(answers)} answers from line-by-line parsing")
+        
+        if debug_artifacts.enabled():
+            debug_path = debug_artifacts.save_text('gemini_content', response_text)
+            logger.debug(f"Saved Gemini response to {debug_path}")
             
-            formatted_answers = {}
-            for i in range(1, num_questions + 1):
-                question_key = str(i)
-                if question_key in answers:
-                    answer = answers[question_key].upper()
-                    if answer in ['A', 'B', 'C', 'D']:
-                        formatted_answers[question_key] = answer
-                    else:
-                        formatted_answers[question_key] = "blank"
-                else:
-                    formatted_answers[question_key] = "blank"
-                    
-            result = {
-                "answers": formatted_answers,
-                "score": 0,
-                "percentage": 0,
-                "summary": "No answer key available for comparison"
+            if answers:
+                vis_image = image.copy()
+                for q_num, answer in sorted(answers.items(), key=lambda x: int(x[0])):
+                    y_pos = 30 + (int(q_num) - 1) * 30
+                    cv2.putText(vis_image, f"Q{q_num}: {answer}", (10, y_pos), 
+                              cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+                
+                debug_path = debug_artifacts.save_image('gemini_content_bubble_detection', vis_image)
+                logger.debug(f"Saved answer visualization to {debug_path}")
+        
+        # A truncated or garbled reply must not become an all-blank sheet (which would also be cached)
+        if not answers:
+            logger.error("No answers could be extracted from the Gemini response")
+            return None
+
+        return format_sheet_result(answers, num_questions)
+        
+    except Exception as e:
+        logger.error(f"Error parsing Gemini response: {str(e)}")
+        if 'response_text' in locals():
+            logger.error(f"Response text: {response_text}")
+        if debug_artifacts.enabled() and 'response_text' in locals():
+            debug_path = debug_artifacts.save_text('gemini_error', response_text)
+            logger.debug(f"Saved error response to {debug_path}")
+        return None
+
+
+def prepare_sheet_for_batch(image: np.ndarray, debug: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Optimize and encode one sheet for a multi-sheet request.
+
+    Args:
+        image: OpenCV image (numpy array)
+        debug: Whether to log debug information
+
+    Returns:
+        Dictionary with "image_part" (as returned by prepare_image_for_api) and "grid_info",
+        or None if the image could not be prepared
+    """
+    image_part = prepare_image_for_api(image)
+    if image_part is None:
+        return None
+
+    grid_info = detect_bubble_grid(image)
+    if debug and grid_info["detected"]:
+        logger.debug(f"Detected bubble grid with {grid_info['rows']} rows and {grid_info['columns']} columns")
+
+    return {"image_part": image_part, "grid_info": grid_info}
+
+
+def build_multi_sheet_prompt(sheet_ids: List[str], num_questions: int) -> str:
+    """Build the instruction prompt sent once with a group of bubble sheet images."""
+    example = ",\n".join(
+        f'          "{sheet_id}": {{"1": "A", "2": "blank", ... }}' for sheet_id in sheet_ids[:2]
+    )
+    return f"""
+        You are an expert in analyzing bubble sheet (OMR) answer forms.
+
+        TASK: This request contains {len(sheet_ids)} separate bubble sheet images, each from a different student.
+        Every image is preceded by a line "SHEET ID: <id>". Analyze each sheet on its own and identify
+        which bubbles are filled in for each question.
+
+        IMPORTANT DETAILS:
+        - Each image contains a multiple-choice answer sheet with questions numbered from 1 to {num_questions}.
+        - Each question has options A, B, C, and D arranged horizontally.
+        - Questions are numbered from top to bottom (1 at the top, increasing as you go down).
+        - Bubbles are organized in a grid pattern with 4 columns (A, B, C, D) and {num_questions} rows.
+        - A bubble is considered marked if it appears darker than the surrounding bubbles.
+        - Even partially filled bubbles should be considered as marked.
+        - The images may be low contrast - look carefully for subtle differences in shading.
+
+        ANALYSIS INSTRUCTIONS:
+        1. Carefully examine each row of bubbles (each question) of every sheet.
+        2. For each question (1-{num_questions}), determine which option (A, B, C, or D) is marked.
+        3. If no option is marked or multiple options are marked for a question, indicate "blank".
+        4. Never mix answers between sheets: compare bubbles only with other bubbles on the same sheet.
+        5. You MUST identify answers for ALL questions from 1 to {num_questions} on EVERY sheet.
+
+        FORMAT YOUR RESPONSE AS JSON ONLY, with one answer object per sheet ID:
+        {{
+{example}
+          ... (continue for all sheets: {", ".join(sheet_ids)})
+        }}
+
+        IMPORTANT: Your response must ONLY contain a JSON object with the sheet IDs as keys. Each value is an
+        object with question numbers as keys and answers as values.
+        Do not include any explanations, comments, or additional text outside the JSON structure.
+        """
+
+
+def build_multi_sheet_request(sheets: Dict[str, Dict[str, Any]], num_questions: int = 60) -> Dict[str, Any]:
+    """
+    Build the generateContent payload for several bubble sheets.
+
+    Args:
+        sheets: Sheets from prepare_sheet_for_batch keyed by sheet ID, in the order to send them
+        num_questions: Number of questions on each sheet
+
+    Returns:
+        The JSON payload: the prompt, then a "SHEET ID" label and the image of every sheet
+    """
+    sheet_ids = list(sheets)
+    parts = [{"text": build_multi_sheet_prompt(sheet_ids, num_questions)}]
+    for sheet_id, sheet in sheets.items():
+        grid_info = sheet["grid_info"]
+        label = f"SHEET ID: {sheet_id}"
+        if grid_info["detected"]:
+            label += f" (about {grid_info['rows']} rows and {grid_info['columns']} columns of bubbles)"
+        parts.append({"text": label})
+        parts.append({"inline_data": sheet["image_part"]})
+
+    return {
+        "contents": [
+            {
+                "parts": parts
             }
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"Error parsing Gemini response: {str(e)}")
-            if 'response_text' in locals():
-                logger.error(f"Response text: {response_text}")
-            if debug and 'response_text' in locals():
-                debug_path = f"gemini_error_{int(time.time())}.txt"
-                with open(debug_path, 'w') as f:
-                    f.write(response_text)
-                logger.debug(f"Saved error response to {debug_path}")
+        ],
+        "generation_config": {
+            "temperature": 0.1,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": SHEET_OUTPUT_TOKENS * len(sheet_ids),
+        }
+    }
+
+
+def extract_sheet_answers(response_text: str, sheet_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Pick the answer object of every sheet out of a multi-sheet response.
+
+    Args:
+        response_text: Text of the model's reply
+        sheet_ids: IDs of the sheets that were sent
+
+    Returns:
+        Dictionary mapping sheet ID to its raw answers; sheets the reply does not cover are left out
+    """
+    start, end = response_text.find("{"), response_text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            data = json.loads(response_text[start:end + 1])
+            if isinstance(data, dict):
+                return {sheet_id: data[sheet_id] for sheet_id in sheet_ids
+                        if isinstance(data.get(sheet_id), dict) and data[sheet_id]}
+        except json.JSONDecodeError as e:
+            logger.warning(f"Error parsing multi-sheet JSON from Gemini response: {str(e)}")
+
+    # Fall back to reading each sheet's object on its own, so one malformed sheet does not lose the rest
+    sheet_answers = {}
+    for sheet_id in sheet_ids:
+        match = re.search(r'"%s"\s*:\s*\{([^{}]*)\}' % re.escape(sheet_id), response_text)
+        if not match:
+            continue
+        pairs = re.findall(r'"(\d+)"\s*:\s*"([A-Da-d]|blank)"', match.group(1))
+        if pairs:
+            sheet_answers[sheet_id] = {q_num: answer.upper() for q_num, answer in pairs}
+    return sheet_answers
+
+
+@instrumentation.timed("gemini_parse_multi", outcome=lambda results: "ok" if results else "failed")
+def parse_multi_sheet_response(response, sheet_ids: List[str], num_questions: int = 60) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Split a multi-sheet Gemini HTTP response back into one result per sheet.
+
+    Args:
+        response: requests.Response returned by the API
+        sheet_ids: IDs of the sheets that were sent
+        num_questions: Number of questions on each sheet
+
+    Returns:
+        Dictionary mapping sheet ID to a result shaped like parse_bubble_sheet_response's
+        (sheets missing from the reply are left out), or None if the request failed
+    """
+    if response.status_code != 200:
+        logger.error(f"Gemini API request failed with status code {response.status_code}")
+        logger.error(f"Response: {response.text}")
+        return None
+
+    try:
+        response_text = response.json()["candidates"][0]["content"]["parts"][0]["text"]
+    except (KeyError, IndexError, ValueError) as e:
+        logger.error(f"Failed to extract text from Gemini API response: {str(e)}")
+        return None
+
+    if debug_artifacts.enabled():
+        debug_path = debug_artifacts.save_text('gemini_multi_content', response_text)
+        logger.debug(f"Saved Gemini response to {debug_path}")
+
+    sheet_answers = extract_sheet_answers(response_text, sheet_ids)
+    logger.info(f"Extracted answers for {len(sheet_answers)} of {len(sheet_ids)} sheets from one Gemini response")
+    return {sheet_id: format_sheet_result(answers, num_questions) for sheet_id, answers in sheet_answers.items()}
+
+
+async def request_bubble_sheet_group(images: List[np.ndarray], num_questions: int = 60,
+                                     rate_limiter: Optional[gemini_client.AsyncRateLimiter] = None,
+                                     debug: bool = False) -> List[Optional[Dict[str, Any]]]:
+    """
+    Get the answers of several sheets with a single request.
+
+    Sheets already in the result cache are not sent; the rest go out together under the IDs
+    sheet_1, sheet_2, ... and the reply is split back per sheet. Results are cached per sheet
+    under the same keys as single-sheet requests. A sheet the reply does not cover is retried
+    on its own request.
+
+    Args:
+        images: OpenCV images (numpy arrays), at most MAX_SHEETS_PER_REQUEST
+        num_questions: Number of questions on each sheet
+        rate_limiter: Limiter to wait on before calling the API (optional)
+        debug: Whether to log debug information
+
+    Returns:
+        One result per image, in input order, as returned by request_bubble_sheet (None on failure)
+    """
+    results = [None] * len(images)
+    pending = {}
+    for index, image in enumerate(images):
+        # Encoding the image is CPU work, keep it off the event loop
+        sheet = await asyncio.to_thread(prepare_sheet_for_batch, image, debug)
+        if sheet is None:
+            continue
+        sheet["index"] = index
+        sheet["cache_key"] = image_cache_key(sheet["image_part"], num_questions)
+        cached = await asyncio.to_thread(gemini_cache.get_cached_result, sheet["cache_key"])
+        if cached is not None:
+            results[index] = cached
+        else:
+            pending[f"sheet_{index + 1}"] = sheet
+
+    sent_together = len(pending) > 1
+    if sent_together:
+        payload = build_multi_sheet_request(pending, num_questions)
+        if rate_limiter is not None:
+            await rate_limiter.acquire(gemini_client.estimate_request_tokens(payload))
+        if debug:
+            logger.debug(f"Sending {len(pending)} sheets to Gemini Vision API in one request")
+        response = await send_gemini_request(payload)
+        sheet_results = parse_multi_sheet_response(response, list(pending), num_questions)
+        if sheet_results is None:
+            return results
+
+        for sheet_id, result in sheet_results.items():
+            sheet = pending.pop(sheet_id)
+            results[sheet["index"]] = result
+            await asyncio.to_thread(gemini_cache.save_cached_result, sheet["cache_key"], result)
+
+    for sheet in pending.values():
+        index = sheet["index"]
+        if sent_together:
+            logger.warning(f"Sheet {index + 1} missing from the multi-sheet reply, sending it on its own")
+        payload = await asyncio.to_thread(build_bubble_sheet_request, images[index], num_questions, debug)
+        if payload is not None:
+            results[index] = await request_bubble_sheet(payload, images[index], num_questions, rate_limiter, debug)
+    return results
+
+
+async def process_bubble_sheet(image: np.ndarray, num_questions: int = 60, debug: bool = False,
+                               max_dim: int = MAX_IMAGE_DIM, binarize: bool = True) -> Optional[Dict[str, str]]:
+    """
+    Process a bubble sheet image using Gemini Vision API with enhanced spatial understanding.
+    Uses direct API calls instead of the Google Generative AI package.
+    
+    Args:
+        image: OpenCV image (numpy array)
+        num_questions: Number of questions on the sheet (default: 60)
+        debug: Whether to log debug information
+        max_dim: Longest side in pixels of the image sent
+        binarize: Send the image black and white (see optimize_image_for_gemini)
+        
+    Returns:
+        Dictionary with question numbers as keys and selected options as values
+        (A, B, C, D or blank for no/multiple selections)
+    """
+    if not GEMINI_AVAILABLE:
+        logger.error("Cannot process bubble sheet: Gemini Vision API is not available")
+        logger.error("Please set your GEMINI_API_KEY in the .env file")
+        return None
+    
+    try:
+        payload = build_bubble_sheet_request(image, num_questions, debug, max_dim, binarize)
+        if payload is None:
             return None
         
+        if debug:
+            logger.debug(f"Sending image to Gemini Vision API with enhanced spatial understanding prompt")
+        
+        return await request_bubble_sheet(payload, image, num_questions, debug=debug)
+        
     except Exception as e:
         logger.error(f"Failed to process bubble sheet with Gemini Vision API: {str(e)}")
         return None
 
+
+async def process_bubble_sheets(images: List[np.ndarray], num_questions: int = 60,
+                                max_in_flight: int = gemini_client.DEFAULT_MAX_IN_FLIGHT,
+                                rate_limiter: Optional[gemini_client.AsyncRateLimiter] = None,
+                                sheets_per_request: int = 1,
+                                debug: bool = False):
+    """
+    Process many bubble sheets concurrently, yielding each result as soon as it is ready.
+
+    Up to `max_in_flight` requests are prepared and sent at once, and every request first waits
+    for room in the requests-per-minute and tokens-per-minute budgets of `rate_limiter`.
+    With `sheets_per_request` above 1, consecutive sheets are grouped and each group is sent
+    as one multi-sheet request (see request_bubble_sheet_group).
+
+    Args:
+        images: OpenCV images (numpy arrays)
+        num_questions: Number of questions on each sheet
+        max_in_flight: Maximum number of requests being prepared or awaiting a response
+        rate_limiter: Shared AsyncRateLimiter (a new one with the default quotas if None)
+        sheets_per_request: Sheets attached to each request (capped at MAX_SHEETS_PER_REQUEST)
+        debug: Whether to log debug information
+
+    Yields:
+        (index, result) tuples in completion order, where index is the position in `images`
+        and result is what process_bubble_sheet returns for that image (None on failure)
+    """
+    if not GEMINI_AVAILABLE:
+        logger.error("Cannot process bubble sheets: Gemini Vision API is not available")
+        for index in range(len(images)):
+            yield index, None
+        return
+
+    if rate_limiter is None:
+        rate_limiter = gemini_client.AsyncRateLimiter()
+    semaphore = asyncio.Semaphore(max(1, max_in_flight))
+
+    async def process_one(index, image):
+        async with semaphore:
+            try:
+                # Encoding the image is CPU work, keep it off the event loop as well
+                payload = await asyncio.to_thread(build_bubble_sheet_request, image, num_questions, debug)
+                if payload is None:
+                    return [(index, None)]
+                return [(index, await request_bubble_sheet(payload, image, num_questions, rate_limiter, debug))]
+            except Exception as e:
+                logger.error(f"Failed to process bubble sheet {index} with Gemini Vision API: {str(e)}")
+                return [(index, None)]
+
+    async def process_group(indices):
+        async with semaphore:
+            try:
+                results = await request_bubble_sheet_group([images[i] for i in indices], num_questions,
+                                                           rate_limiter, debug)
+            except Exception as e:
+                logger.error(f"Failed to process bubble sheets {indices[0]}-{indices[-1]} with Gemini Vision API: {str(e)}")
+                results = [None] * len(indices)
+            return list(zip(indices, results))
+
+    group_size = max(1, min(sheets_per_request, MAX_SHEETS_PER_REQUEST))
+    if group_size > 1:
+        groups = [list(range(start, min(start + group_size, len(images))))
+                  for start in range(0, len(images), group_size)]
+        tasks = [asyncio.ensure_future(process_group(indices)) for indices in groups]
+    else:
+        tasks = [asyncio.ensure_future(process_one(index, image)) for index, image in enumerate(images)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            for item in await next_done:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
 def get_teacher_answer_key(key_id=None, key_name=None):
     """
     Get the teacher's answer key from the database.
@@ -520,7 +938,7 @@ def get_teacher_answer_key(key_id=None, key_name=None):
         logger.error(f"Error getting teacher answer key: {str(e)}")
         return None
 
-def compare_answers(student_answers, teacher_key_id=None, teacher_key_name=None):
+def compare_answers(student_answers, teacher_key_id=None, teacher_key_name=None, teacher_answers=None):
     """
     Compare student answers with the teacher's answer key.
     
@@ -528,11 +946,14 @@ def compare_answers(student_answers, teacher_key_id=None, teacher_key_name=None)
         student_answers: Dictionary with question numbers as keys and student answers as values
         teacher_key_id: ID of the teacher's answer key to use (optional)
         teacher_key_name: Name of the teacher's answer key to use (optional)
+        teacher_answers: Already loaded answer key to compare against (optional).
+            Skips the database lookup when grading many sheets against one key.
         
     Returns:
         Dictionary with comparison results
     """
-    teacher_answers = get_teacher_answer_key(teacher_key_id, teacher_key_name)
+    if teacher_answers is None:
+        teacher_answers = get_teacher_answer_key(teacher_key_id, teacher_key_name)
     
     if not teacher_answers:
         logger.warning("No teacher answer key available for comparison")
@@ -569,27 +990,27 @@ def compare_answers(student_answers, teacher_key_id=None, teacher_key_name=None)
         "details": details
     }
 
-def process_document_with_gemini(image: np.ndarray, debug_save_path: Optional[str] = None, debug: bool = False) -> Dict[str, Any]:
+def process_document_with_gemini(image: np.ndarray, debug_save_path: Optional[str] = None, debug: bool = False,
+                                 num_questions: int = 60, max_dim: int = MAX_IMAGE_DIM,
+                                 binarize: bool = True) -> Dict[str, Any]:
     """
     Process a document image with Gemini Vision API.
-    This is a synchronous wrapper around the async process_bubble_sheet function.
+    This is a synchronous wrapper around the async process_bubble_sheet function. It runs
+    on a fresh event loop that is closed afterwards, so it can be called from any thread.
     
     Args:
         image: OpenCV image (numpy array)
         debug_save_path: Path to save debug images (optional)
         debug: Whether to log debug information
+        num_questions: Number of questions in the image
+        max_dim: Longest side in pixels of the image sent
+        binarize: Send the image black and white (see optimize_image_for_gemini)
         
     Returns:
         Dictionary with processing results
     """
     try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    
-    try:
-        answers = loop.run_until_complete(process_bubble_sheet(image, debug=debug))
+        answers = asyncio.run(process_bubble_sheet(image, num_questions, debug, max_dim, binarize))
         
         return {
             "gemini_results": answers,
@@ -602,3 +1023,50 @@ def process_document_with_gemini(image: np.ndarray, debug_save_path: Optional[st
             "debug_path": debug_save_path,
             "error": str(e)
         }
+
+
+def process_documents_with_gemini(images: List[np.ndarray], on_result=None,
+                                  max_in_flight: int = gemini_client.DEFAULT_MAX_IN_FLIGHT,
+                                  requests_per_minute: Optional[int] = gemini_client.DEFAULT_REQUESTS_PER_MINUTE,
+                                  tokens_per_minute: Optional[int] = gemini_client.DEFAULT_TOKENS_PER_MINUTE,
+                                  sheets_per_request: int = 1,
+                                  debug: bool = False) -> List[Dict[str, Any]]:
+    """
+    Process a batch of document images with Gemini Vision API.
+    This is a synchronous wrapper around the async process_bubble_sheets generator. It runs
+    on a fresh event loop that is closed afterwards, so it can be called from any thread.
+
+    Args:
+        images: OpenCV images (numpy arrays)
+        on_result: Called with (index, result) as each sheet finishes (optional)
+        max_in_flight: Maximum number of concurrent requests
+        requests_per_minute: Requests-per-minute budget (None for no limit)
+        tokens_per_minute: Tokens-per-minute budget (None for no limit)
+        sheets_per_request: Sheets sent together in one request; above 1 the prompt is shared
+            by the whole group, which saves input tokens when grading a class
+        debug: Whether to log debug information
+
+    Returns:
+        One result dictionary per image, in input order, shaped like process_document_with_gemini's
+    """
+    results = [{"gemini_results": None} for _ in images]
+
+    async def collect():
+        limiter = gemini_client.AsyncRateLimiter(requests_per_minute, tokens_per_minute)
+        async for index, answers in process_bubble_sheets(images, max_in_flight=max_in_flight,
+                                                          rate_limiter=limiter,
+                                                          sheets_per_request=sheets_per_request,
+                                                          debug=debug):
+            results[index] = {"gemini_results": answers}
+            if on_result is not None:
+                on_result(index, results[index])
+
+    try:
+        asyncio.run(collect())
+    except Exception as e:
+        logger.error(f"Error processing documents with Gemini Vision API: {str(e)}")
+        for result in results:
+            if result["gemini_results"] is None:
+                result["gemini_results"] = {}
+                result["error"] = str(e)
+    return results
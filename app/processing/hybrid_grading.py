@@ -0,0 +1,155 @@
+import logging
+import cv2
+import numpy as np
+from typing import Dict, List, Tuple, Optional, Any
+
+from . import gemini_vision
+from .row_strips import compose_row_strips, map_strip_answers
+from .sheet_template import DEFAULT_TEMPLATE, SheetTemplate
+from ..utils import debug_artifacts, instrumentation
+
+logger = logging.getLogger("chexam.hybrid_grading")
+if not logger.handlers:
+    logger.setLevel(logging.INFO)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+
+# Questions whose local confidence is below this are re-read by Gemini
+CONFIDENCE_THRESHOLD = 0.3
+
+# If more than this fraction of a sheet is ambiguous, the template probably does not line up
+# with the sheet, so the whole Gemini reading is used instead of patching individual questions
+MAX_AMBIGUOUS_FRACTION = 0.5
+
+# A template that does not line up with the printed bubbles reads neighbouring bubbles or blank
+# paper as confident answers, so the local reading is only trusted where the printed outlines
+# are found (see SheetTemplate.find_outlines). Below this fraction of questions with outlines,
+# or above this fraction of outlines just beyond the grid, the whole sheet is considered
+# misaligned.
+MIN_OUTLINE_FRACTION = 0.5
+MAX_BEYOND_OUTLINES = 0.5
+
+# Longest side of the row-strip image sent for ambiguous questions. Strips are cropped at full
+# resolution, so this is only reached when very many rows are ambiguous.
+STRIP_MAX_DIM = 2048
+
+
+@instrumentation.timed("local_grading")
+def grade_locally(image: np.ndarray, template: SheetTemplate = DEFAULT_TEMPLATE) -> Tuple[Dict[str, str], Dict[str, float]]:
+    """
+    Read a warped sheet on-device by sampling the template's bubble positions.
+
+    Args:
+        image: Warped sheet image (BGR or grayscale)
+        template: Layout of the sheet
+
+    Returns:
+        answers: {"1": "A", ..., "60": "blank"}
+        confidence: {"1": 0.0-1.0, ...}
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+    return template.read_answers_with_confidence(template.sample_fills(gray))
+
+
+def check_alignment(image: np.ndarray, template: SheetTemplate = DEFAULT_TEMPLATE) -> Tuple[List[str], bool]:
+    """
+    Check the template against the bubble outlines printed on a warped sheet.
+
+    Args:
+        image: Warped sheet image (BGR or grayscale)
+        template: Layout of the sheet
+
+    Returns:
+        unaligned: Questions whose bubble outlines were not all found, e.g. ["7", "31"]
+        misaligned: True when the template does not line up with the sheet as a whole
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+    found, beyond = template.find_outlines(gray)
+    unaligned = [str(q) for q in np.flatnonzero(~found) + 1]
+    misaligned = found.mean() < MIN_OUTLINE_FRACTION or beyond > MAX_BEYOND_OUTLINES
+    return unaligned, bool(misaligned)
+
+
+def process_document_hybrid(image: np.ndarray, template: SheetTemplate = DEFAULT_TEMPLATE,
+                            confidence_threshold: float = CONFIDENCE_THRESHOLD,
+                            debug_save_path: Optional[str] = None, debug: bool = False) -> Dict[str, Any]:
+    """
+    Grade a sheet locally first and ask Gemini only when the local reading is unsure.
+
+    Clean sheets are answered in milliseconds without any API call. When some questions are
+    ambiguous (faint marks, erasures) and Gemini is configured, only the rows of those
+    questions are cropped at full resolution and sent as one small image (see
+    compose_row_strips), and Gemini's answers replace the ambiguous questions. When most of
+    the sheet is ambiguous the whole sheet is sent instead. Questions whose printed bubble
+    outlines are not where the template expects them (see check_alignment) are ambiguous too,
+    and a sheet the template does not line up with counts as entirely ambiguous.
+
+    Args:
+        image: Warped sheet image (BGR or grayscale)
+        template: Layout of the sheet
+        confidence_threshold: Questions below this local confidence are considered ambiguous
+        debug_save_path: Path to save debug images (optional)
+        debug: Whether to log debug information
+
+    Returns:
+        Dictionary in the same shape as process_document_with_gemini, plus the per-question
+        confidence, the list of ambiguous questions, whether the template looked misaligned
+        and the source of the answers ("local", "hybrid" or "gemini")
+    """
+    answers, confidence = grade_locally(image, template)
+    unaligned, misaligned = check_alignment(image, template)
+    if misaligned:
+        logger.warning("Bubble outlines not where the template expects them; reading the whole sheet with Gemini")
+        ambiguous = list(answers)
+    else:
+        ambiguous = [q for q, score in confidence.items() if score < confidence_threshold or q in unaligned]
+    source = "local"
+
+    if debug:
+        logger.debug(f"Local reading: {len(ambiguous)} ambiguous questions: {ambiguous}")
+
+    if ambiguous:
+        if gemini_vision.GEMINI_AVAILABLE:
+            whole_sheet = len(ambiguous) > MAX_AMBIGUOUS_FRACTION * len(answers)
+            if whole_sheet:
+                logger.info(f"{len(ambiguous)} ambiguous questions, asking Gemini to read the whole sheet")
+                results = gemini_vision.process_document_with_gemini(image, debug_save_path=debug_save_path, debug=debug)
+            else:
+                logger.info(f"{len(ambiguous)} ambiguous questions, asking Gemini to read their rows")
+                strips, rows = compose_row_strips(image, ambiguous, template)
+                debug_artifacts.save_image('gemini_row_strips', strips)
+                results = gemini_vision.process_document_with_gemini(
+                    strips, debug_save_path=debug_save_path, debug=debug,
+                    num_questions=len(rows), max_dim=STRIP_MAX_DIM, binarize=False
+                )
+            gemini_data = results.get("gemini_results") or {}
+            gemini_answers = gemini_data.get("answers", {}) if isinstance(gemini_data, dict) else {}
+
+            if gemini_answers:
+                if whole_sheet:
+                    answers = {q: gemini_answers.get(q, "blank") for q in answers}
+                    source = "gemini"
+                else:
+                    gemini_answers = map_strip_answers(gemini_answers, rows)
+                    for q in ambiguous:
+                        answers[q] = gemini_answers.get(q, answers[q])
+                    source = "hybrid"
+            else:
+                logger.warning("Gemini returned no answers, keeping the local reading")
+        else:
+            logger.info(f"{len(ambiguous)} ambiguous questions, Gemini not available - keeping the local reading")
+
+    return {
+        "gemini_results": {
+            "answers": answers,
+            "score": 0,
+            "percentage": 0,
+            "summary": "No answer key available for comparison"
+        },
+        "confidence": confidence,
+        "ambiguous_questions": ambiguous,
+        "misaligned": misaligned,
+        "source": source,
+        "debug_path": debug_save_path
+    }
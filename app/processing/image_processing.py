@@ -1,6 +1,7 @@
 import cv2
 import numpy as np
 import logging
+from ..utils import debug_artifacts, instrumentation
 
 logger = logging.getLogger("chexam.image_processing")
 if not logger.handlers:
@@ -10,6 +11,7 @@ if not logger.handlers:
     logger.addHandler(handler)
     logger.setLevel(logging.ERROR)
 
+@instrumentation.timed("document_pipeline", outcome=lambda result: "ok" if result[2] is not None else "no_sheet")
 def process_document_pipeline(image, debug_save_path=None, debug=False):
     """
     Process document image with the following pipeline:
@@ -17,8 +19,8 @@ def process_document_pipeline(image, debug_save_path=None, debug=False):
     
     Args:
         image: Input image (BGR format)
-        debug_save_path: Path to save debug images (optional)
-        debug: Whether to save debug images and log debug info
+        debug_save_path: Name prefix for debug artifacts (optional, see utils/debug_artifacts)
+        debug: Whether to log debug info
         
     Returns:
         warped_color: Color version of the warped document
@@ -35,14 +37,14 @@ def process_document_pipeline(image, debug_save_path=None, debug=False):
     # 1. Convert to grayscale
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     
-    if debug and debug_save_path:
-        cv2.imwrite(debug_save_path.replace('.png', '_1_gray.png'), gray)
+    if debug_artifacts.enabled():
+        debug_artifacts.save_image('1_gray', gray, prefix=debug_save_path)
     
     # 2. Apply Gaussian blur to reduce noise
     blurred = cv2.GaussianBlur(gray, (5, 5), 0)
     
-    if debug and debug_save_path:
-        cv2.imwrite(debug_save_path.replace('.png', '_2_blurred.png'), blurred)
+    if debug_artifacts.enabled():
+        debug_artifacts.save_image('2_blurred', blurred, prefix=debug_save_path)
     
     # 3. Apply Canny edge detection
     edges = cv2.Canny(blurred, 75, 200)
@@ -52,44 +54,23 @@ def process_document_pipeline(image, debug_save_path=None, debug=False):
     dilated = cv2.dilate(edges, kernel, iterations=2)
     edges = cv2.erode(dilated, kernel, iterations=1)
     
-    if debug and debug_save_path:
-        cv2.imwrite(debug_save_path.replace('.png', '_3_thresh.png'), edges)
+    if debug_artifacts.enabled():
+        debug_artifacts.save_image('3_thresh', edges, prefix=debug_save_path)
     
     # 5. Find contours
     contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     
-
-    contour_vis = image.copy()
-    
-    if debug:
-        cv2.drawContours(contour_vis, contours, -1, (0, 255, 0), 2)
     
     # 6. Find the largest quadrilateral contour (the document)
-    max_area = 0
-    biggest_contour = None
-    
-    for contour in contours:
-        area = cv2.contourArea(contour)
-        
-
-        if area < 1000:
-            continue
-    
-        peri = cv2.arcLength(contour, True)
-        approx = cv2.approxPolyDP(contour, 0.02 * peri, True)
-        
-      
-        if len(approx) == 4 and area > max_area:
-            biggest_contour = approx
-            max_area = area
+    biggest_contour = find_largest_quad(contours)
    
     if biggest_contour is None:
         logger.warning("No suitable document contour found, using full image")
         h, w = image.shape[:2]
         sheet_pts = np.array([[0, 0], [w, 0], [w, h], [0, h]], dtype=np.float32)
         
-        if debug and debug_save_path:
-            cv2.imwrite(debug_save_path.replace('.png', '_4_no_contour.png'), image)
+        if debug_artifacts.enabled():
+            debug_artifacts.save_image('4_no_contour', image, prefix=debug_save_path)
         
         warped_color = image.copy()
         warped_gray = gray.copy()
@@ -101,9 +82,11 @@ def process_document_pipeline(image, debug_save_path=None, debug=False):
     # Reorder the points / perspective transformation
     sheet_pts = order_points(biggest_contour.reshape(4, 2))
     
-    if debug and debug_save_path:
+    if debug_artifacts.enabled():
+        contour_vis = image.copy()
+        cv2.drawContours(contour_vis, contours, -1, (0, 255, 0), 2)
         cv2.drawContours(contour_vis, [biggest_contour], -1, (0, 255, 0), 3)
-        cv2.imwrite(debug_save_path.replace('.png', '_4_contour.png'), contour_vis)
+        debug_artifacts.save_image('4_contour', contour_vis, prefix=debug_save_path)
 
     # 7. Apply perspective transform to get a top-down view
     warped_color = four_point_transform(original, sheet_pts)
@@ -111,26 +94,103 @@ def process_document_pipeline(image, debug_save_path=None, debug=False):
     # 8. Convert warped image to grayscale
     warped_gray = cv2.cvtColor(warped_color, cv2.COLOR_BGR2GRAY)
     
-    if debug and debug_save_path:
-        cv2.imwrite(debug_save_path.replace('.png', '_5_warped_color.png'), warped_color)
-        cv2.imwrite(debug_save_path.replace('.png', '_6_warped_gray.png'), warped_gray)
+    if debug_artifacts.enabled():
+        debug_artifacts.save_image('5_warped_color', warped_color, prefix=debug_save_path)
+        debug_artifacts.save_image('6_warped_gray', warped_gray, prefix=debug_save_path)
     
     # 9. Enhance the warped grayscale image for better visualization
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    warped_gray_enhanced = clahe.apply(warped_gray)
-    
-    if debug and debug_save_path:
-        cv2.imwrite(debug_save_path.replace('.png', '_6_5_enhanced.png'), warped_gray_enhanced)
-    
-    if debug and debug_save_path:
-        cv2.imwrite(debug_save_path.replace('.png', '_5_warped_color.png'), warped_color)
-        cv2.imwrite(debug_save_path.replace('.png', '_6_warped_gray.png'), warped_gray)
+    if debug_artifacts.enabled():
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        warped_gray_enhanced = clahe.apply(warped_gray)
+        debug_artifacts.save_image('6_5_enhanced', warped_gray_enhanced, prefix=debug_save_path)
     
     warped_color, warped_gray = correct_orientation(warped_color, warped_gray, debug_save_path, debug)
     
     return warped_color, warped_gray, sheet_pts
 
 
+def find_largest_quad(contours, min_area=1000):
+    """
+    Find the largest contour that approximates to a quadrilateral.
+    
+    Args:
+        contours: Contours as returned by cv2.findContours
+        min_area: Contours smaller than this (in pixels) are ignored
+        
+    Returns:
+        The 4-point approximation of the largest quadrilateral, or None if there is none
+    """
+    max_area = 0
+    biggest_contour = None
+    
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        
+        if area < min_area:
+            continue
+    
+        peri = cv2.arcLength(contour, True)
+        approx = cv2.approxPolyDP(contour, 0.02 * peri, True)
+        
+        if len(approx) == 4 and area > max_area:
+            biggest_contour = approx
+            max_area = area
+    
+    return biggest_contour
+
+
+def detect_document_corners(image, max_dim=480):
+    """
+    Find only the four corners of the document, for the live camera preview.
+    
+    Runs the same edge and contour search as process_document_pipeline, but on a
+    downscaled copy of the frame, and skips the warp, CLAHE and orientation steps.
+    
+    Args:
+        image: Input image (BGR format)
+        max_dim: Longest side of the downscaled frame used for the search
+        
+    Returns:
+        Four corner points (ordered, in full-resolution coordinates) or None if not found
+    """
+    height, width = image.shape[:2]
+    scale = min(1.0, max_dim / max(height, width))
+    
+    if scale < 1.0:
+        small = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    else:
+        small = image
+    
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if len(small.shape) == 3 else small
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    edges = cv2.Canny(blurred, 75, 200)
+    
+    # Smaller kernel than the full pipeline, since the frame is downscaled
+    kernel = np.ones((3, 3), np.uint8)
+    edges = cv2.erode(cv2.dilate(edges, kernel, iterations=2), kernel, iterations=1)
+    
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    quad = find_largest_quad(contours, min_area=1000 * scale * scale)
+    
+    if quad is None:
+        return None
+    
+    return order_points(quad.reshape(4, 2).astype(np.float32) / scale)
+
+
+def sharpness_score(gray):
+    """
+    Cheap focus measure: variance of the Laplacian. Blurry frames score low.
+    
+    Args:
+        gray: Grayscale image (ideally downscaled, the score depends on resolution)
+        
+    Returns:
+        Sharpness score as a float
+    """
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
 def correct_orientation(color_image, gray_image, debug_save_path=None, debug=False):
     """
     Detect and correct the orientation of the image to ensure it's upright.
@@ -138,8 +198,8 @@ def correct_orientation(color_image, gray_image, debug_save_path=None, debug=Fal
     Args:
         color_image: Color version of the image to correct
         gray_image: Grayscale version of the image to correct
-        debug_save_path: Path to save debug images (optional)
-        debug: Whether to save debug images and log debug info
+        debug_save_path: Name prefix for debug artifacts (optional, see utils/debug_artifacts)
+        debug: Whether to log debug info
         
     Returns:
         corrected_color: Color version of the corrected image
@@ -154,17 +214,17 @@ def correct_orientation(color_image, gray_image, debug_save_path=None, debug=Fal
         corrected_color = cv2.rotate(color_image, cv2.ROTATE_90_CLOCKWISE)
         corrected_gray = cv2.rotate(gray_image, cv2.ROTATE_90_CLOCKWISE)
         
-        if debug and debug_save_path:
-            cv2.imwrite(debug_save_path.replace('.png', '_7_rotated_color.png'), corrected_color)
-            cv2.imwrite(debug_save_path.replace('.png', '_8_rotated_gray.png'), corrected_gray)
+        if debug_artifacts.enabled():
+            debug_artifacts.save_image('7_rotated_color', corrected_color, prefix=debug_save_path)
+            debug_artifacts.save_image('8_rotated_gray', corrected_gray, prefix=debug_save_path)
     else:
         corrected_color = color_image
         corrected_gray = gray_image
     
     
-    if debug and debug_save_path:
-        cv2.imwrite(debug_save_path.replace('.png', '_9_final_color.png'), corrected_color)
-        cv2.imwrite(debug_save_path.replace('.png', '_10_final_gray.png'), corrected_gray)
+    if debug_artifacts.enabled():
+        debug_artifacts.save_image('9_final_color', corrected_color, prefix=debug_save_path)
+        debug_artifacts.save_image('10_final_gray', corrected_gray, prefix=debug_save_path)
     
     return corrected_color, corrected_gray
 
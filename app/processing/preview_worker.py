@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger("chexam.processing.preview_worker")
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    formatter = logging.Formatter('[%(levelname)s] %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+
+class LatestFrameWorker:
+    """
+    Runs a detection function on camera frames in a background thread.
+
+    Only the most recent frame is kept: submitting a new frame while the previous one is
+    still waiting replaces it, so the worker never falls behind the camera. Detection then
+    runs at whatever rate the device can sustain while the preview keeps the camera frame rate.
+
+    The result callback is called on the worker thread; UI code should marshal it back to
+    the main thread (e.g. with Clock.schedule_once).
+    """
+
+    def __init__(self, process_fn, result_callback, name="chexam-preview-worker"):
+        """
+        Args:
+            process_fn: Function taking a frame and returning a detection result
+            result_callback: Called with (result, frame_id) after each processed frame
+            name: Name of the worker thread
+        """
+        self.process_fn = process_fn
+        self.result_callback = result_callback
+        self.name = name
+
+        self._cond = threading.Condition()
+        self._pending = None
+        self._pending_id = None
+        self._running = False
+        self._thread = None
+        self._next_id = 0
+
+        self.frames_submitted = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+        self.last_process_time = 0.0
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        with self._cond:
+            self._running = False
+            self._pending = None
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._running
+
+    def submit(self, frame):
+        """
+        Hand the latest frame to the worker. Any frame still waiting is dropped.
+
+        Returns:
+            The id assigned to this frame
+        """
+        with self._cond:
+            if self._pending is not None:
+                self.frames_dropped += 1
+            self._next_id += 1
+            self._pending = frame
+            self._pending_id = self._next_id
+            self.frames_submitted += 1
+            self._cond.notify()
+            return self._next_id
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and self._pending is None:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                frame, frame_id = self._pending, self._pending_id
+                self._pending = None
+
+            start = time.perf_counter()
+            try:
+                result = self.process_fn(frame)
+            except Exception as e:
+                logger.error(f"Failed to process frame: {e}")
+                result = None
+            self.last_process_time = time.perf_counter() - start
+            self.frames_processed += 1
+
+            if self._running:
+                try:
+                    self.result_callback(result, frame_id)
+                except Exception as e:
+                    logger.error(f"Preview result callback failed: {e}")
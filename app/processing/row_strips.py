@@ -0,0 +1,97 @@
+import cv2
+import numpy as np
+
+from .sheet_template import DEFAULT_TEMPLATE
+
+# Extra height kept above and below each row, as a fraction of the row height, in case the
+# template lines up a little off the printed rows
+ROW_PADDING = 0.15
+
+# Width of the white margin holding each strip's row number, as a multiple of the row height
+LABEL_MARGIN = 1.2
+
+# White gap between stacked strips, in pixels
+STRIP_GAP = 4
+
+
+def _put_centered(image, text, center_x, center_y, scale, thickness):
+    (text_w, text_h), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+    origin = (int(center_x - text_w / 2), int(center_y + text_h / 2))
+    cv2.putText(image, text, origin, cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 0), thickness, cv2.LINE_AA)
+
+
+def compose_row_strips(image, questions, template=DEFAULT_TEMPLATE, padding=ROW_PADDING):
+    """
+    Crop the option rows of some questions at full resolution and stack them into one image.
+
+    The result reads like a small bubble sheet: a header with the option letters, then one
+    strip per question labelled 1, 2, ... on a white left margin. Sending this instead of the
+    whole sheet keeps every pixel of the marks that matter while the image stays small.
+
+    Args:
+        image: Warped sheet image (BGR or grayscale)
+        questions: Question numbers to crop (e.g. ["7", "31"]), in the order to stack them
+        template: Layout of the sheet
+        padding: Extra height above and below each row, as a fraction of the row height
+
+    Returns:
+        composite: BGR image of the stacked strips
+        rows: Question numbers as strings, in row order (row n of the composite is rows[n - 1])
+    """
+    if len(image.shape) == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    height, width = image.shape[:2]
+    boxes = template.option_boxes(width, height)
+    centers, _ = template.bubble_centers(width, height)
+
+    rows = [str(q) for q in questions]
+    strips = []
+    for q in rows:
+        x0, y0, x1, y1 = boxes[int(q) - 1]
+        pad = int(round((y1 - y0) * padding))
+        strips.append(image[max(0, y0 - pad):min(height, y1 + pad), x0:x1])
+
+    row_h = max(strip.shape[0] for strip in strips)
+    strip_w = max(strip.shape[1] for strip in strips)
+    margin = int(round(row_h * LABEL_MARGIN))
+    scale = row_h / 45.0
+    thickness = max(1, int(round(row_h / 25.0)))
+
+    header_h = row_h
+    composite_h = header_h + len(strips) * (row_h + STRIP_GAP)
+    composite = np.full((composite_h, margin + strip_w, 3), 255, dtype=np.uint8)
+
+    # Option letters above the bubble columns, placed from the first row's geometry
+    first = int(rows[0]) - 1
+    for o, option in enumerate(template.options):
+        _put_centered(composite, option, margin + centers[first, o, 0] - boxes[first, 0],
+                      header_h / 2, scale, thickness)
+
+    top = header_h
+    for n, strip in enumerate(strips, start=1):
+        strip_h, w = strip.shape[:2]
+        offset = (row_h - strip_h) // 2
+        composite[top + offset:top + offset + strip_h, margin:margin + w] = strip
+        _put_centered(composite, str(n), margin / 2, top + row_h / 2, scale, thickness)
+        top += row_h + STRIP_GAP
+
+    return composite, rows
+
+
+def map_strip_answers(strip_answers, rows):
+    """
+    Map answers read from a composite back to question numbers.
+
+    Args:
+        strip_answers: {"1": "A", ...} keyed by the composite's row numbers
+        rows: Question numbers in row order, as returned by compose_row_strips
+
+    Returns:
+        {question: answer} for every row that has an answer
+    """
+    answers = {}
+    for n, q in enumerate(rows, start=1):
+        answer = strip_answers.get(str(n))
+        if answer is not None:
+            answers[q] = answer
+    return answers
@@ -0,0 +1,331 @@
+import time
+import queue
+import logging
+import threading
+
+from .image_processing import process_document_pipeline
+from .hybrid_grading import check_alignment, grade_locally
+from .sheet_template import DEFAULT_TEMPLATE
+
+logger = logging.getLogger("chexam.processing.scan_pipeline")
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    formatter = logging.Formatter('[%(levelname)s] %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+# Items waiting in front of each stage; a full queue makes the stage before it wait
+DEFAULT_QUEUE_SIZE = 4
+
+# Put on a stage's queue once per worker to shut the stage down
+_STOP = object()
+
+
+class PipelineStage:
+    """
+    One step of a ScanPipeline: a bounded input queue drained by one or more worker threads.
+
+    The function receives the item produced by the previous stage and returns the item for
+    the next one. Returning None drops the item; raising an exception counts it as failed.
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=DEFAULT_QUEUE_SIZE):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.threads = []
+
+        self._lock = threading.Lock()
+        self.busy = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.total_seconds = 0.0
+        self.started_at = None
+
+    def _count(self, outcome, seconds):
+        with self._lock:
+            self.busy -= 1
+            self.total_seconds += seconds
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self):
+        """
+        Counters of this stage.
+
+        Returns:
+            Dictionary with depth (items queued), capacity, busy (items being worked on),
+            processed, dropped, failed, mean_ms per item and per_second (items finished per
+            second since the pipeline started)
+        """
+        with self._lock:
+            finished = self.processed + self.dropped + self.failed
+            elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+            return {
+                'name': self.name,
+                'depth': self.queue.qsize(),
+                'capacity': self.queue.maxsize,
+                'busy': self.busy,
+                'processed': self.processed,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'mean_ms': self.total_seconds * 1000 / finished if finished else 0.0,
+                'per_second': finished / elapsed if elapsed > 0 else 0.0
+            }
+
+
+class ScanPipeline:
+    """
+    Runs sheets through a chain of stages (e.g. warp -> detect -> persist), each in its own
+    worker threads, connected by bounded queues.
+
+    Every stage works on a different sheet at the same time, so the camera can take the next
+    photo while earlier ones are still being warped, read and saved. When a queue is full the
+    stage in front of it waits, and submit() refuses new sheets instead of letting them pile
+    up in memory. OpenCV releases the GIL while it works, so threads overlap well.
+    """
+
+    def __init__(self, stages, on_result=None, on_error=None, queue_size=DEFAULT_QUEUE_SIZE):
+        """
+        Args:
+            stages: List of PipelineStage, or (name, func) / (name, func, workers) tuples
+            on_result: Called with each item that comes out of the last stage (on a worker thread)
+            on_error: Called with (stage name, item, exception) when a stage fails (on a worker thread)
+            queue_size: Queue size for stages given as tuples
+        """
+        self.stages = [
+            stage if isinstance(stage, PipelineStage) else PipelineStage(*stage, queue_size=queue_size)
+            for stage in stages
+        ]
+        self.on_result = on_result
+        self.on_error = on_error
+        self.running = False
+        self._stage_lock = threading.Lock()
+        self._workers_left = {}
+
+    def start(self):
+        if self.running:
+            return self
+        self.running = True
+        started_at = time.perf_counter()
+        for index, stage in enumerate(self.stages):
+            stage.started_at = started_at
+            self._workers_left[stage.name] = stage.workers
+            for n in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(index,), daemon=True,
+                                          name=f"scan-{stage.name}-{n}")
+                stage.threads.append(thread)
+                thread.start()
+        return self
+
+    def submit(self, item, block=False, timeout=None):
+        """
+        Hand a new item to the first stage.
+
+        Args:
+            item: Input of the first stage
+            block: Wait for room in the first queue instead of refusing the item
+            timeout: Longest wait in seconds when blocking
+
+        Returns:
+            True if the item was queued, False if the pipeline is full or stopped
+        """
+        if not self.running:
+            return False
+        try:
+            self.stages[0].queue.put(item, block=block, timeout=timeout)
+            return True
+        except queue.Full:
+            return False
+
+    def _work(self, index):
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            item = stage.queue.get()
+            if item is _STOP:
+                break
+
+            with stage._lock:
+                stage.busy += 1
+            start = time.perf_counter()
+            try:
+                output = stage.func(item)
+            except Exception as e:
+                stage._count('failed', time.perf_counter() - start)
+                logger.warning(f"Stage {stage.name} failed: {str(e)}")
+                if self.on_error:
+                    self._callback(self.on_error, stage.name, item, e)
+                continue
+
+            if output is None:
+                stage._count('dropped', time.perf_counter() - start)
+                continue
+            stage._count('processed', time.perf_counter() - start)
+
+            if next_stage is not None:
+                next_stage.queue.put(output)
+            elif self.on_result:
+                self._callback(self.on_result, output)
+
+        # The last worker of a stage to stop passes the shutdown on, after everything it
+        # produced is already queued ahead of the stop markers
+        with self._stage_lock:
+            self._workers_left[stage.name] -= 1
+            last = self._workers_left[stage.name] == 0
+        if last and next_stage is not None:
+            for _ in range(next_stage.workers):
+                next_stage.queue.put(_STOP)
+
+    def _callback(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.error(f"Pipeline callback failed: {str(e)}")
+
+    def stop(self, wait=True, timeout=None):
+        """
+        Stop accepting items. Items already queued still go through every stage.
+
+        Args:
+            wait: Block until all workers have finished
+            timeout: Longest wait in seconds for each worker when waiting
+        """
+        if not self.running:
+            return
+        self.running = False
+        for _ in range(self.stages[0].workers):
+            self.stages[0].queue.put(_STOP)
+        if wait:
+            for stage in self.stages:
+                for thread in stage.threads:
+                    thread.join(timeout)
+
+    def pending(self):
+        """Number of items queued or being worked on in any stage."""
+        total = 0
+        for stage in self.stages:
+            stats = stage.stats()
+            total += stats['depth'] + stats['busy']
+        return total
+
+    def stats(self):
+        """Counters of every stage, in pipeline order (see PipelineStage.stats)."""
+        return [stage.stats() for stage in self.stages]
+
+    def format_stats(self):
+        """One line per stage: queue depth, items done and throughput."""
+        lines = []
+        for s in self.stats():
+            lines.append(
+                f"{s['name']:<8} queue {s['depth']}/{s['capacity']}  busy {s['busy']}  "
+                f"done {s['processed']}  dropped {s['dropped']}  failed {s['failed']}  "
+                f"{s['mean_ms']:.0f} ms/item  {s['per_second']:.2f}/s"
+            )
+        return "\n".join(lines)
+
+
+def warp_sheet(item):
+    """Pipeline stage: find, flatten and orient the sheet in item['frame'] (fails if none is found)."""
+    warped_color, warped_gray, sheet_pts = process_document_pipeline(item.pop('frame'))
+    if sheet_pts is None or warped_color is None:
+        raise ValueError("Sheet not detected")
+    item['warped_color'] = warped_color
+    item['warped_gray'] = warped_gray
+    return item
+
+
+def warp_sheet_or_frame(item):
+    """
+    Pipeline stage for single captures: like warp_sheet, but when no sheet outline is found
+    the whole frame is kept, so the user can still look at it and continue.
+    """
+    warped_color, warped_gray, sheet_pts = process_document_pipeline(item.pop('frame'))
+    if warped_color is None or warped_gray is None:
+        raise ValueError("Frame could not be processed")
+    if sheet_pts is None:
+        logger.info("No sheet outline found, using the whole frame")
+    item['warped_color'] = warped_color
+    item['warped_gray'] = warped_gray
+    return item
+
+
+def make_detect_stage(template=DEFAULT_TEMPLATE):
+    """
+    Pipeline stage: read the answers of item['warped_color'] on-device.
+
+    Fails the sheet when the printed bubble outlines are not where the template expects them,
+    since a misaligned template reads neighbouring bubbles as confident marks. Questions whose
+    own outlines were not all found get a confidence of 0.
+    """
+    def detect_answers(item):
+        unaligned, misaligned = check_alignment(item['warped_color'], template)
+        if misaligned:
+            raise ValueError("Bubble outlines not where the template expects them; the sheet may not line up")
+        answers, confidence = grade_locally(item['warped_color'], template)
+        for q in unaligned:
+            confidence[q] = 0.0
+        item['answers'], item['confidence'] = answers, confidence
+        return item
+    return detect_answers
+
+
+def make_persist_stage(answer_key_id, answer_key=None):
+    """
+    Pipeline stage: save item['answers'] for item['student_name'] and score them.
+
+    Args:
+        answer_key_id: Answer key the answers are saved against
+        answer_key: That key's answers, for scoring (loaded from the database if omitted)
+    """
+    from ..db.answer_key_db import get_answer_key
+    from ..db.student_db import add_student, save_student_answers
+    from .gemini_vision import compare_answers
+
+    if answer_key is None:
+        key = get_answer_key(key_id=answer_key_id)
+        answer_key = key['answers'] if key else {}
+
+    def persist_answers(item):
+        student_id = add_student(item['student_name'])
+        if student_id is None or save_student_answers(student_id, answer_key_id, item['answers']) is None:
+            raise RuntimeError(f"Could not save answers for {item['student_name']}")
+        item['student_id'] = student_id
+        item['comparison'] = compare_answers(item['answers'], teacher_answers=answer_key)
+        # The warped images are no longer needed once the answers are saved
+        item.pop('warped_color', None)
+        item.pop('warped_gray', None)
+        return item
+    return persist_answers
+
+
+def build_scan_pipeline(answer_key_id=None, template=DEFAULT_TEMPLATE, on_result=None, on_error=None,
+                        queue_size=DEFAULT_QUEUE_SIZE, warp_workers=2):
+    """
+    Pipeline for scanning a stack of sheets: warp -> detect -> persist.
+
+    Items are dictionaries with 'frame' (the camera photo) and 'student_name'. Results are the
+    same dictionaries with 'answers', 'confidence' and, when answer_key_id is given,
+    'student_id' and 'comparison'. Without an answer key nothing is saved.
+
+    Args:
+        answer_key_id: Answer key to save and score against (optional)
+        template: Layout of the sheet
+        on_result: Called with each finished item (on a worker thread)
+        on_error: Called with (stage name, item, exception) (on a worker thread)
+        queue_size: Items waiting in front of each stage
+        warp_workers: Threads for the warp stage, the slowest one
+
+    Returns:
+        ScanPipeline (not started)
+    """
+    stages = [
+        PipelineStage('warp', warp_sheet, workers=warp_workers, queue_size=queue_size),
+        PipelineStage('detect', make_detect_stage(template), queue_size=queue_size),
+    ]
+    if answer_key_id is not None:
+        stages.append(PipelineStage('persist', make_persist_stage(answer_key_id), queue_size=queue_size))
+    return ScanPipeline(stages, on_result=on_result, on_error=on_error)
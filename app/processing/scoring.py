@@ -0,0 +1,178 @@
+import numpy as np
+
+# Answer codes used in the response matrix
+MISSING = 0
+OPTION_CODES = {'A': 1, 'B': 2, 'C': 3, 'D': 4}
+BLANK = 5
+
+CODE_LETTERS = {code: letter for letter, code in OPTION_CODES.items()}
+CODE_LETTERS[BLANK] = 'blank'
+
+_CODES = dict(OPTION_CODES, blank=BLANK)
+
+
+def encode_answer(answer):
+    """Code for a single answer: 1-4 for A-D, BLANK for "blank", MISSING for anything else."""
+    return _CODES.get(answer, MISSING)
+
+
+def encode_answers(answers, questions, codes=None):
+    """
+    Pack one answer dictionary into a uint8 row.
+
+    Args:
+        answers: {"1": "A", ...}
+        questions: Question keys, in the column order of the matrix
+        codes: Answer-to-code mapping (defaults to A-D and "blank")
+
+    Returns:
+        uint8 array of shape (len(questions),)
+    """
+    codes = codes or _CODES
+    return np.fromiter((codes.get(a, MISSING) for a in map(answers.get, questions)),
+                       dtype=np.uint8, count=len(questions))
+
+
+def encode_responses(responses, questions, codes=None):
+    """
+    Pack many answer dictionaries into a students x questions uint8 matrix.
+
+    Args:
+        responses: List of {"1": "A", ...} dictionaries, one per student
+        questions: Question keys, in the column order of the matrix
+        codes: Answer-to-code mapping (defaults to A-D and "blank")
+
+    Returns:
+        uint8 array of shape (len(responses), len(questions))
+    """
+    lookup = (codes or _CODES).get
+    cells = (lookup(a, MISSING) for answers in responses for a in map(answers.get, questions))
+    matrix = np.fromiter(cells, dtype=np.uint8, count=len(responses) * len(questions))
+    return matrix.reshape(len(responses), len(questions))
+
+
+def select_questions(matrix, questions):
+    """
+    Reorder the columns of a code matrix whose column i holds question i + 1.
+
+    Args:
+        matrix: students x N uint8 array of answer codes
+        questions: Question keys ("1", "2", ...) for the columns of the result
+
+    Returns:
+        students x len(questions) uint8 array; questions beyond N are MISSING
+    """
+    columns = np.array([int(q) - 1 for q in questions], dtype=np.int64)
+    valid = (columns >= 0) & (columns < matrix.shape[1])
+    selected = np.full((matrix.shape[0], len(questions)), MISSING, dtype=np.uint8)
+    selected[:, valid] = matrix[:, columns[valid]]
+    return selected
+
+
+class ClassScores:
+    """
+    Scores of a whole class against one answer key, computed with array operations.
+
+    Matches mock_analyze_student question for question: a response is correct when it
+    equals the key, a question missing from a response is wrong, and every question of
+    the key counts towards the total.
+    """
+
+    def __init__(self, answer_key, responses):
+        """
+        Args:
+            answer_key: {"1": "A", ...}; its keys, in order, are the questions scored
+            responses: List of {"1": "A", ...} dictionaries, one per student, or a
+                students x questions uint8 matrix of answer codes whose column i holds
+                question i + 1 (as returned by student_db.get_answer_matrix)
+        """
+        self.questions = list(answer_key.keys())
+        self._question_array = np.array(self.questions, dtype=object)
+
+        # Key values other than A-D and "blank" get codes of their own so that a response
+        # only matches them when it is the same string
+        self.codes = dict(_CODES)
+        for answer in answer_key.values():
+            if answer is not None and answer not in self.codes and len(self.codes) < 255:
+                self.codes[answer] = len(self.codes) + 1
+
+        self.key = encode_answers(answer_key, self.questions, self.codes)
+        if isinstance(responses, np.ndarray):
+            self.matrix = select_questions(responses, self.questions)
+        else:
+            self.matrix = encode_responses(responses, self.questions, self.codes)
+
+        self.correct = (self.matrix == self.key) & (self.key != MISSING)
+        self.wrong = ~self.correct
+        self.scores = self.correct.sum(axis=1)
+        # Unrounded, computed as correct / total * 100 like the per-student code so that
+        # rounding each value with round(p, 1) gives the same result
+        total = len(self.questions)
+        if total:
+            self.percentages = self.scores / total * 100
+        else:
+            self.percentages = np.zeros(len(responses))
+
+    @property
+    def num_students(self):
+        return self.matrix.shape[0]
+
+    @property
+    def num_questions(self):
+        return len(self.questions)
+
+    def difficulty(self):
+        """Fraction of students who got each question wrong (0 = everyone right)."""
+        if not self.num_students:
+            return np.zeros(self.num_questions)
+        return self.wrong.mean(axis=0)
+
+    def option_counts(self):
+        """
+        How often each code was chosen per question.
+
+        Returns:
+            int array of shape (num_questions, max code + 1), indexed by answer code
+        """
+        num_codes = max(self.codes.values()) + 1
+        counts = np.zeros((self.num_questions, num_codes), dtype=np.int64)
+        for code in range(num_codes):
+            counts[:, code] = (self.matrix == code).sum(axis=0)
+        return counts
+
+    def question_groups(self, size=10):
+        """Group of each column, (question - 1) // size, as used to describe sections of the test."""
+        return np.array([(int(q) - 1) // size for q in self.questions], dtype=np.int64)
+
+    def busiest_group(self, mask, size=10):
+        """
+        For each student, the question group with the most True cells in mask.
+
+        Args:
+            mask: A students x questions boolean array, e.g. self.correct or self.wrong
+            size: Questions per group
+
+        Returns:
+            int array with one group per student (ties go to the group met first in the
+            answer key), or -1 where the student's row of mask is empty
+        """
+        if not self.num_questions:
+            return np.full(self.num_students, -1, dtype=np.int64)
+
+        groups = self.question_groups(size)
+        ids, first = np.unique(groups, return_index=True)
+        order = ids[np.argsort(first)]
+        counts = np.stack([mask[:, groups == g].sum(axis=1) for g in order], axis=1)
+        best = order[counts.argmax(axis=1)]
+        return np.where(counts.max(axis=1) > 0, best, -1)
+
+    def correct_indices(self, student):
+        """Question keys the student answered correctly."""
+        return self._question_array[self.correct[student]].tolist()
+
+    def wrong_indices(self, student):
+        """Question keys the student missed."""
+        return self._question_array[self.wrong[student]].tolist()
+
+    def score_text(self, student):
+        return f"{int(self.scores[student])}/{self.num_questions}"
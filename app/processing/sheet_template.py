@@ -0,0 +1,315 @@
+import json
+import cv2
+import numpy as np
+
+
+class SheetTemplate:
+    """
+    Layout definition for a printed bubble sheet.
+
+    Once a sheet has been warped to a top-down view by four_point_transform, every bubble
+    sits at a known position. The layout is stored as fractions of the warped sheet size,
+    so one template works for any capture resolution.
+
+    Questions are arranged in `num_columns` column blocks, numbered top to bottom and then
+    left to right (1-20 in the first block, 21-40 in the second, ... for 60 questions).
+    Inside a block each row starts with a question-number label followed by the options.
+    """
+
+    def __init__(self, num_questions=60, num_columns=3, options=('A', 'B', 'C', 'D'),
+                 grid_left=0.06, grid_top=0.20, grid_right=0.96, grid_bottom=0.96,
+                 label_width=0.25, bubble_scale=0.6, mark_threshold=0.35, outline_threshold=0.1):
+        """
+        Args:
+            num_questions: Number of questions on the sheet
+            num_columns: Number of question column blocks
+            options: Option letters, left to right
+            grid_left, grid_top, grid_right, grid_bottom: Bounds of the bubble grid as
+                fractions of the warped sheet width/height
+            label_width: Fraction of each column block taken by the question-number label
+            bubble_scale: Bubble diameter as a fraction of the smaller of row and option pitch
+            mark_threshold: Minimum fill (0-1 darkness relative to the paper) for a bubble to count as marked
+            outline_threshold: Minimum darkness where a bubble's printed outline should be
+                for the template to count as lined up with the sheet
+        """
+        self.num_questions = num_questions
+        self.num_columns = num_columns
+        self.options = tuple(options)
+        self.grid_left = grid_left
+        self.grid_top = grid_top
+        self.grid_right = grid_right
+        self.grid_bottom = grid_bottom
+        self.label_width = label_width
+        self.bubble_scale = bubble_scale
+        self.mark_threshold = mark_threshold
+        self.outline_threshold = outline_threshold
+        self._roi_cache = {}
+        self._outline_cache = {}
+
+    @property
+    def rows_per_column(self):
+        return -(-self.num_questions // self.num_columns)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create a template from a layout dictionary (e.g. loaded from JSON)."""
+        return cls(**data)
+
+    @classmethod
+    def from_json(cls, path):
+        """Load a template layout from a JSON file."""
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+    def to_dict(self):
+        return {
+            'num_questions': self.num_questions,
+            'num_columns': self.num_columns,
+            'options': list(self.options),
+            'grid_left': self.grid_left,
+            'grid_top': self.grid_top,
+            'grid_right': self.grid_right,
+            'grid_bottom': self.grid_bottom,
+            'label_width': self.label_width,
+            'bubble_scale': self.bubble_scale,
+            'mark_threshold': self.mark_threshold,
+            'outline_threshold': self.outline_threshold,
+        }
+
+    def bubble_centers(self, width, height):
+        """
+        Compute bubble centers and radius for a warped sheet of the given size.
+
+        Returns:
+            centers: float array of shape (num_questions, num_options, 2) with (x, y) pixels
+            radius: bubble radius in pixels
+        """
+        grid_w = (self.grid_right - self.grid_left) * width
+        grid_h = (self.grid_bottom - self.grid_top) * height
+        block_w = grid_w / self.num_columns
+        row_pitch = grid_h / self.rows_per_column
+        option_pitch = block_w * (1 - self.label_width) / len(self.options)
+
+        q = np.arange(self.num_questions)
+        column = q // self.rows_per_column
+        row = q % self.rows_per_column
+        opt = np.arange(len(self.options))
+
+        block_x = self.grid_left * width + column * block_w + block_w * self.label_width
+        xs = block_x[:, None] + (opt[None, :] + 0.5) * option_pitch
+        ys = self.grid_top * height + (row + 0.5) * row_pitch
+        ys = np.broadcast_to(ys[:, None], xs.shape)
+
+        radius = 0.5 * self.bubble_scale * min(row_pitch, option_pitch)
+        return np.stack([xs, ys], axis=-1), radius
+
+    def option_boxes(self, width, height):
+        """
+        Pixel box around the row of options of every question, without its printed label.
+
+        Returns:
+            int array of shape (num_questions, 4) with x0, y0, x1, y1 (exclusive), clipped to the sheet
+        """
+        centers, _ = self.bubble_centers(width, height)
+        row_pitch, option_pitch = self._pitches(width, height)
+
+        # Bubbles span at most 0.3 of the option pitch each side of their center, so this keeps
+        # them whole while leaving out the end of the printed label before the first option
+        x0 = centers[:, 0, 0] - 0.4 * option_pitch
+        x1 = centers[:, -1, 0] + 0.4 * option_pitch
+        y0 = centers[:, 0, 1] - row_pitch / 2
+        y1 = centers[:, 0, 1] + row_pitch / 2
+        boxes = np.stack([x0, y0, x1, y1], axis=-1)
+        boxes = np.round(boxes).astype(np.intp)
+        np.clip(boxes[:, 0::2], 0, width, out=boxes[:, 0::2])
+        np.clip(boxes[:, 1::2], 0, height, out=boxes[:, 1::2])
+        return boxes
+
+    def bubble_rois(self, width, height):
+        """
+        Sampling windows for every bubble, cached per sheet size.
+
+        Each window is the square inscribed in the bubble, so the printed outline is left out
+        and only the interior (where the pencil mark is) is sampled.
+
+        Returns:
+            Tuple of int arrays (x0, y0, x1, y1), each of shape (num_questions, num_options)
+        """
+        key = (width, height)
+        rois = self._roi_cache.get(key)
+        if rois is None:
+            centers, radius = self.bubble_centers(width, height)
+            half = max(1.0, radius / np.sqrt(2))
+            x0 = np.clip(np.round(centers[..., 0] - half), 0, width - 1).astype(np.intp)
+            y0 = np.clip(np.round(centers[..., 1] - half), 0, height - 1).astype(np.intp)
+            x1 = np.clip(np.round(centers[..., 0] + half), x0 + 1, width).astype(np.intp)
+            y1 = np.clip(np.round(centers[..., 1] + half), y0 + 1, height).astype(np.intp)
+            rois = (x0, y0, x1, y1)
+            self._roi_cache[key] = rois
+        return rois
+
+    def _pitches(self, width, height):
+        """Row pitch and option pitch in pixels for a warped sheet of the given size."""
+        block_w = (self.grid_right - self.grid_left) * width / self.num_columns
+        row_pitch = (self.grid_bottom - self.grid_top) * height / self.rows_per_column
+        return row_pitch, block_w * (1 - self.label_width) / len(self.options)
+
+    @staticmethod
+    def _ring_windows(centers, radius, width, height):
+        """Four windows where a bubble outline of the given radius crosses the axes through each center."""
+        half = max(1.0, 0.3 * radius)
+        xs = centers[..., 0][..., None] + np.array([radius, -radius, 0.0, 0.0])
+        ys = centers[..., 1][..., None] + np.array([0.0, 0.0, radius, -radius])
+        x0 = np.clip(np.round(xs - half), 0, width - 1).astype(np.intp)
+        y0 = np.clip(np.round(ys - half), 0, height - 1).astype(np.intp)
+        x1 = np.clip(np.round(xs + half), x0 + 1, width).astype(np.intp)
+        y1 = np.clip(np.round(ys + half), y0 + 1, height).astype(np.intp)
+        return x0, y0, x1, y1
+
+    def outline_rois(self, width, height):
+        """
+        Sampling windows on the printed outlines, cached per sheet size.
+
+        Returns:
+            bubbles: Windows on the outline of every bubble, a tuple of int arrays
+                (x0, y0, x1, y1) of shape (num_questions, num_options, 4)
+            beyond: The same for the positions just beyond the grid, where a lined-up template
+                must not find outlines: one tuple each for the row above and the row below every
+                column block, and the option left and right of every question
+        """
+        key = (width, height)
+        rois = self._outline_cache.get(key)
+        if rois is None:
+            centers, radius = self.bubble_centers(width, height)
+            row_pitch, option_pitch = self._pitches(width, height)
+            row = np.arange(self.num_questions) % self.rows_per_column
+            last = (row == self.rows_per_column - 1) | (np.arange(self.num_questions) == self.num_questions - 1)
+            beyond = [
+                centers[row == 0].reshape(-1, 2) - [0.0, row_pitch],
+                centers[last].reshape(-1, 2) + [0.0, row_pitch],
+                centers[:, 0] - [option_pitch, 0.0],
+                centers[:, -1] + [option_pitch, 0.0],
+            ]
+            rois = (self._ring_windows(centers, radius, width, height),
+                    [self._ring_windows(edge, radius, width, height) for edge in beyond])
+            self._outline_cache[key] = rois
+        return rois
+
+    @staticmethod
+    def _window_darkness(gray, rois):
+        """Darkness (0 = paper white, 1 = black) of every window, using an integral image."""
+        x0, y0, x1, y1 = rois
+        integral = cv2.integral(gray, sdepth=cv2.CV_64F)
+        sums = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+        means = sums / ((x1 - x0) * (y1 - y0))
+
+        # Paper level from a sparse sample, so lighting differences between sheets cancel out
+        paper = max(float(np.percentile(gray[::8, ::8], 95)), 1.0)
+        return np.clip(1.0 - means / paper, 0.0, 1.0)
+
+    def find_outlines(self, gray):
+        """
+        Check that the printed bubble outlines are where the template expects them.
+
+        A template that is off by half a row or a whole option still lands on printed
+        bubbles, so reading the fills alone cannot tell it is misaligned. The outline windows
+        can: shifted by more than about a third of the bubble radius, they fall inside a
+        bubble or on the paper between bubbles. A shift by a whole row or option lines the
+        windows up with other bubbles again, which the positions just beyond the grid reveal.
+
+        Args:
+            gray: Warped grayscale sheet image
+
+        Returns:
+            found: bool array of shape (num_questions,), True where the outline of every
+                option was found (at least three of its four windows dark)
+            beyond: Largest fraction of outlines found along one edge just beyond the grid
+                (near 0 when the template lines up, near 1 when it is a whole row or option off)
+        """
+        height, width = gray.shape[:2]
+        bubble_rois, edge_rois = self.outline_rois(width, height)
+
+        def outlines(rois):
+            return (self._window_darkness(gray, rois) >= self.outline_threshold).sum(axis=-1) >= 3
+
+        beyond = max(float(outlines(rois).mean()) for rois in edge_rois)
+        return outlines(bubble_rois).all(axis=1), beyond
+
+    def sample_fills(self, gray):
+        """
+        Measure how dark every bubble is with a handful of array operations.
+
+        Uses an integral image so each bubble costs four lookups regardless of its size.
+
+        Args:
+            gray: Warped grayscale sheet image
+
+        Returns:
+            float array of shape (num_questions, num_options), 0 = paper white, 1 = fully dark
+        """
+        height, width = gray.shape[:2]
+        return self._window_darkness(gray, self.bubble_rois(width, height))
+
+    def read_answers(self, fills):
+        """
+        Turn a fill matrix into answers: the darkest option per question, if it is marked.
+
+        Returns:
+            Dictionary with question numbers as keys and option letters as values
+        """
+        best = np.argmax(fills, axis=1)
+        best_fill = fills[np.arange(len(fills)), best]
+        marked = np.flatnonzero(best_fill > self.mark_threshold)
+        return {int(q) + 1: self.options[best[q]] for q in marked}
+
+    def read_answers_with_confidence(self, fills):
+        """
+        Turn a fill matrix into an answer and a confidence score for every question.
+
+        Each option is a marked/unmarked decision against mark_threshold, and only the two
+        darkest options of a question can flip its outcome. Confidence is how far those two
+        fills sit from the threshold, relative to the threshold: a clean mark or a clean
+        blank scores high, a faint mark or a half-erased second mark scores low.
+
+        Returns:
+            answers: {"1": "A", ...} with "blank" for unanswered or multiply marked questions
+            confidence: {"1": 0.0-1.0, ...}
+        """
+        order = np.argsort(fills, axis=1)
+        rows = np.arange(len(fills))
+        best = order[:, -1]
+        best_fill = fills[rows, best]
+        second_fill = fills[rows, order[:, -2]] if fills.shape[1] > 1 else np.zeros(len(fills))
+
+        threshold = self.mark_threshold
+        margin = np.minimum(np.abs(best_fill - threshold), np.abs(second_fill - threshold))
+        confidence = np.clip(margin / threshold, 0.0, 1.0)
+
+        single_mark = (best_fill > threshold) & (second_fill <= threshold)
+        answers = {}
+        scores = {}
+        for q in range(len(fills)):
+            key = str(q + 1)
+            answers[key] = self.options[best[q]] if single_mark[q] else "blank"
+            scores[key] = round(float(confidence[q]), 3)
+        return answers, scores
+
+    def detect_answers(self, warped_img):
+        """
+        Read the answers from a warped sheet image.
+
+        Args:
+            warped_img: Warped sheet image (BGR or grayscale)
+
+        Returns:
+            A dictionary with question numbers as keys and detected answers as values
+        """
+        if len(warped_img.shape) == 3:
+            gray = cv2.cvtColor(warped_img, cv2.COLOR_BGR2GRAY)
+        else:
+            gray = warped_img
+        return self.read_answers(self.sample_fills(gray))
+
+
+# Layout of the standard 60-question A-D Chexam sheet
+DEFAULT_TEMPLATE = SheetTemplate()
@@ -299,7 +299,14 @@ class AnalysisScreen(BaseScreen):
         best_str = ', '.join(best_items) if best_items else 'None'
         best_height = max(dp(60), min(dp(120), dp(40 + len(best_str) // 30 * 20)))
         self.add_result_item('Best Understood Questions', best_str, best_height)
-        
+
+        # Students per 10% score band
+        histogram = self.class_analysis_result.get('score_histogram')
+        if histogram:
+            bands = [f"{i * 10}-{100 if i == len(histogram) - 1 else i * 10 + 9}%: {count}"
+                     for i, count in enumerate(histogram)]
+            self.add_result_item('Score Distribution', ', '.join(bands), dp(80))
+
         # Class strengths, weaknesses, and teaching suggestions
         self.add_result_item('Class Strengths', 
                            self.class_analysis_result.get('class_strengths', 'No data'), 
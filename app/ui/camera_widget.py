@@ -5,7 +5,9 @@ from kivy.clock import Clock
 import cv2
 import numpy as np
 import logging
-from ..processing.image_processing import process_document_pipeline
+from ..processing.corner_tracker import CornerTracker
+from ..processing.preview_worker import LatestFrameWorker
+from ..utils import debug_artifacts
 
 class CameraWidget(FloatLayout):
     def __init__(self, capture_callback, **kwargs):
@@ -28,6 +30,22 @@ class CameraWidget(FloatLayout):
         self.capture = None
         self.current_frame = None
         self._update_ev = None
+        
+        # Sheet corners reported by the background detection worker
+        self.detected_pts = None
+        self.stable_frames = 0
+        self.sharpness = 0.0
+        self._detected_frame_id = 0
+        self._detector = None
+        self._tracker = CornerTracker()
+        
+        # Auto-capture once the sheet has been held still and in focus
+        self.auto_capture = True
+        self.auto_capture_frames = 10
+        self.sharpness_threshold = 100.0
+        # Cleared by each capture and set again once the sheet moves or leaves the frame, so a
+        # sheet that stays in view is captured only once
+        self._capture_armed = True
 
 
     def update(self, dt):
@@ -38,12 +56,15 @@ class CameraWidget(FloatLayout):
         if ret:
             self.current_frame = frame.copy()
             
+            # Hand the frame to the detection worker; the overlay uses the latest corners it reported
+            if self._detector is not None:
+                self._detector.submit(frame)
+            
                 # Create a visualization image for display
             try:
                 display_frame = frame.copy()
                 
-  
-                _, _, pts = process_document_pipeline(frame, debug=False)
+                pts = self.detected_pts
                 
                 if pts is not None and hasattr(pts, 'shape') and pts.shape == (4, 2):
                     pts_int = pts.astype(np.int32).reshape((-1, 1, 2))
@@ -79,19 +100,64 @@ class CameraWidget(FloatLayout):
                 image_texture.blit_buffer(buf, colorfmt='bgr', bufferfmt='ubyte')
                 self.image.texture = image_texture
 
+    def _detect_corners(self, frame):
+        """Runs on the detection worker thread; tracks the corners from the previous frame."""
+        pts = self._tracker.update(frame)
+        return pts, self._tracker.stable_frames, self._tracker.sharpness
+
+    def _on_corners_detected(self, result, frame_id):
+        """Called on the worker thread; applies the result on the Kivy main thread."""
+        Clock.schedule_once(lambda dt: self._apply_corners(result, frame_id))
+
+    def _apply_corners(self, result, frame_id):
+        # Ignore results that arrive after the camera was stopped or from an older frame
+        if self._detector is None or result is None or frame_id < self._detected_frame_id:
+            return
+        self._detected_frame_id = frame_id
+        self.detected_pts, self.stable_frames, self.sharpness = result
+        
+        if not self._capture_armed and (self.detected_pts is None or self.stable_frames < self.auto_capture_frames):
+            self._capture_armed = True
+        
+        if self.ready_to_capture():
+            self.logger.info(f"Auto-capturing: sheet stable for {self.stable_frames} frames, sharpness {self.sharpness:.0f}")
+            self.capture_image()
+
+    def ready_to_capture(self):
+        """True when auto-capture is on and a newly presented sheet is stable and sharp."""
+        return (self.auto_capture
+                and self._capture_armed
+                and self.current_frame is not None
+                and self.detected_pts is not None
+                and self.stable_frames >= self.auto_capture_frames
+                and self.sharpness >= self.sharpness_threshold)
+
 
     def capture_image(self, *args):
         if self.current_frame is not None:
-            # Save the captured frame for debugging
-            import cv2, time
-            ts = int(time.time() * 1000)
-            cv2.imwrite(f"captured_frame_{ts}.png", self.current_frame)
-            self.capture_callback(self.current_frame)
-            self.stop_camera()
+            frame = self.current_frame
+            # Processing happens on the scan pipeline's threads, which time each stage. The
+            # callback returns True once the frame is queued; until then the capture stays
+            # armed, so a sheet still held steady is captured as soon as there is room.
+            if self.capture_callback(frame):
+                # Save the captured frame for debugging
+                debug_artifacts.save_image('captured_frame', frame)
+                self._capture_armed = False
+                self.stable_frames = 0
+            # The camera keeps running: the screen stops it once the capture has been processed,
+            # so a failed capture can simply be retried
 
     def start_camera(self):
         if self.capture is None:
             self.capture = cv2.VideoCapture(0)
+            self.detected_pts = None
+            self.stable_frames = 0
+            self.sharpness = 0.0
+            self._capture_armed = True
+            self._detected_frame_id = 0
+            self._tracker.reset()
+            self._detector = LatestFrameWorker(self._detect_corners, self._on_corners_detected)
+            self._detector.start()
             self._update_ev = Clock.schedule_interval(self.update, 1.0 / 30)
 
     def stop_camera(self):
@@ -101,6 +167,12 @@ class CameraWidget(FloatLayout):
         if self._update_ev is not None:
             self._update_ev.cancel()
             self._update_ev = None
+        if self._detector is not None:
+            self._detector.stop()
+            self._detector = None
+        self.detected_pts = None
+        self.stable_frames = 0
+        self.sharpness = 0.0
 
     def on_stop(self):
         self.stop_camera()
@@ -8,6 +8,7 @@ from kivy.uix.gridlayout import GridLayout
 from kivy.uix.popup import Popup
 from kivy.uix.textinput import TextInput
 from kivy.metrics import dp
+from kivy.clock import Clock
 from .base_screen import BaseScreen
 import numpy as np
 import cv2
@@ -15,8 +16,14 @@ import logging
 import time
 import os
 import json
-# Import Gemini Vision processing instead of OCR
-from ..processing.gemini_vision import process_document_with_gemini
+# Answers are read on-device first; Gemini Vision is only asked about ambiguous sheets
+from ..processing.hybrid_grading import process_document_hybrid
+from ..processing.background_task import BackgroundTask
+from ..utils import gemini_client
+
+# Seconds to wait for an extraction before giving up on it: the longest a Gemini request can
+# take with its retries, plus time for the local reading and image preparation
+EXTRACTION_TIMEOUT = gemini_client.max_request_seconds() + 15
 
 class ProcessedImageScreen(BaseScreen):
     def __init__(self, **kwargs):
@@ -119,6 +126,8 @@ class ProcessedImageScreen(BaseScreen):
         self.flip_h = False 
         self.flip_v = False 
         self.detected_answers = {}
+        # Extractions still running in the background
+        self.tasks = []
 
     def set_image(self, binary_img, color_img=None):
         """Set the image to display and process."""
@@ -311,30 +320,73 @@ class ProcessedImageScreen(BaseScreen):
             
             # Read the saved image to ensure we're using the same file that will be used for future analysis
             processed_image = cv2.imread(image_path)
+            if processed_image is None:
+                processed_image = img_to_save[..., ::-1].copy() if len(img_to_save.shape) == 3 else img_to_save
         
-        # Create a popup to show progress
+        # Create a popup to show progress. Extraction runs in the background: Cancel drops
+        # it, and closing the popup just hides it until the results are ready, so the next
+        # sheet can be scanned meanwhile.
         content = BoxLayout(orientation='vertical')
         progress_label = Label(
             text=f"Extracting content for {student_name}\nusing Gemini Vision API...\nThis may take a few seconds.", 
-            halign='center', size_hint=(1, 0.1)
+            halign='center', size_hint=(1, 0.8)
         )
         content.add_widget(progress_label)
+        cancel_button = Button(text='Cancel', size_hint=(1, 0.2))
+        content.add_widget(cancel_button)
         
         popup = Popup(title='Document Content Extraction', content=content, size_hint=(0.8, 0.8))
         popup.open()
         
-        # Save a debug image with timestamp
-        debug_path = None
+        # Store the student name for later use
+        self.student_name = student_name
         
-        # Process the document with Gemini Vision
-        progress_label.text = "Sending image to Gemini Vision API..."
+        def extract(task):
+            # Runs on the background thread
+            task.progress("Reading answers...")
+            return process_document_hybrid(processed_image, debug=False)
+        
+        task = self._start_task(
+            extract,
+            on_done=lambda results: self._show_extraction_results(popup, content, student_name, results),
+            on_error=lambda e: self._handle_extraction_error(popup, content, e),
+            on_progress=lambda message: setattr(progress_label, 'text', f"{student_name}: {message}"),
+            on_timeout=lambda: self._handle_extraction_error(
+                popup, content, TimeoutError(f"No answer after {EXTRACTION_TIMEOUT:.0f} seconds")),
+            name="gemini-extraction"
+        )
         
-        # Store the student name for later use
+        def cancel(*args):
+            task.cancel()
+            popup.dismiss()
+            self.logger.info(f"Extraction for {student_name} cancelled")
+        cancel_button.bind(on_press=cancel)
+    
+    def _start_task(self, func, on_done, on_error, on_progress=None, on_timeout=None, name="background-task"):
+        """Run func(task) on a background thread, with every callback on the Kivy main thread."""
+        task = BackgroundTask(
+            func,
+            on_done=on_done,
+            on_error=on_error,
+            on_progress=on_progress,
+            on_timeout=on_timeout,
+            timeout=EXTRACTION_TIMEOUT,
+            dispatch=lambda fn: Clock.schedule_once(lambda dt: fn()),
+            name=name
+        )
+        self.tasks = [t for t in self.tasks if not t.finished and not t.cancelled] + [task]
+        return task.start()
+
+    def on_leave(self, *args):
+        # Results of extractions still running would fill popups on a screen no longer shown
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+    
+    def _show_extraction_results(self, popup, content, student_name, results):
+        """Fill the extraction popup with the results (main thread)."""
         self.student_name = student_name
         
-        # Process using the saved image file
-        results = process_document_with_gemini(processed_image, debug_save_path=debug_path, debug=False)
-            
         # Extract the answers from the results
         gemini_data = results.get('gemini_results', {})
         
@@ -351,7 +403,7 @@ class ProcessedImageScreen(BaseScreen):
             score_info = None
         
         # Format the results for display
-        formatted_text = f"Student: {self.student_name}\n\nGemini Vision API Results:\n\n"
+        formatted_text = f"Student: {self.student_name}\n\n{self._describe_source(results)}\n\n"
         
         if gemini_results:
             # Format the answers in JSON format
@@ -468,8 +520,20 @@ class ProcessedImageScreen(BaseScreen):
         # Show the results popup
         popup.open()
     
+    def _describe_source(self, results):
+        """Describe where the answers came from for the results popup."""
+        source = results.get('source')
+        ambiguous = results.get('ambiguous_questions', [])
+        if source == 'local':
+            if ambiguous:
+                return f"On-device Results ({len(ambiguous)} uncertain questions, Gemini not used):"
+            return "On-device Results:"
+        if source == 'hybrid':
+            return f"On-device Results ({len(ambiguous)} uncertain questions checked with Gemini Vision API):"
+        return "Gemini Vision API Results:"
+    
     def _handle_extraction_error(self, popup, content, e):
-        """Handle errors during content extraction."""
+        """Handle errors during content extraction (main thread)."""
         self.logger.error(f"Error extracting content: {str(e)}")
         # Update popup with error
         content.clear_widgets()
@@ -478,6 +542,8 @@ class ProcessedImageScreen(BaseScreen):
         close_button = Button(text='Close', size_hint=(1, 0.2))
         close_button.bind(on_press=popup.dismiss)
         content.add_widget(close_button)
+        # The popup may have been closed while waiting
+        popup.open()
     
     def save_image(self, *args):
         import cv2
@@ -575,33 +641,50 @@ class ProcessedImageScreen(BaseScreen):
         if self.flip_v:
             processed_image = cv2.flip(processed_image, 0) 
         
-        # Process the image with Gemini Vision API
+        # Process the image in the background; the popup can cancel it
         self.logger.info("Analyzing answers with Gemini Vision API...")
-        try:
-            # Save a single debug image with a timestamp
-            import time
-            debug_path = None
-            
-            # Show a processing popup
-            content = BoxLayout(orientation='vertical')
-            processing_label = Label(text="Processing with Gemini Vision API...\nThis may take a few seconds.", halign='center')
-            content.add_widget(processing_label)
-            popup = Popup(title='Processing', content=content, size_hint=(0.6, 0.3), auto_dismiss=False)
-            popup.open()
-            
-            # Process the document with Gemini Vision
-            results = process_document_with_gemini(processed_image, debug_save_path=debug_path, debug=False)
-            
-            # Extract the answers from the results
-            gemini_results = results.get('gemini_results', {})
+        content = BoxLayout(orientation='vertical')
+        processing_label = Label(text="Processing with Gemini Vision API...\nThis may take a few seconds.", halign='center')
+        content.add_widget(processing_label)
+        cancel_button = Button(text='Cancel', size_hint=(1, 0.3))
+        content.add_widget(cancel_button)
+        popup = Popup(title='Processing', content=content, size_hint=(0.6, 0.3), auto_dismiss=False)
+        popup.open()
+        
+        def analyze(task):
+            # Runs on the background thread: read the sheet locally, with Gemini Vision for
+            # ambiguous questions, then compare with the teacher's answer key
+            results = process_document_hybrid(processed_image, debug=False)
+            gemini_results = (results.get('gemini_results') or {}).get('answers', {})
             
-            # Get teacher's answer key and compare results
             from ..processing.gemini_vision import compare_answers
-            comparison_results = compare_answers(gemini_results)
-            
-            # Close the popup
+            return gemini_results, compare_answers(gemini_results)
+        
+        def done(output):
             popup.dismiss()
-            
+            self._show_answer_analysis(*output)
+        
+        def failed(e):
+            popup.dismiss()
+            self._show_analysis_error(e)
+        
+        task = self._start_task(
+            analyze,
+            on_done=done,
+            on_error=failed,
+            on_timeout=lambda: failed(TimeoutError(f"No answer after {EXTRACTION_TIMEOUT:.0f} seconds")),
+            name="answer-analysis"
+        )
+        
+        def cancel(*args):
+            task.cancel()
+            popup.dismiss()
+            self.logger.info("Answer analysis cancelled")
+        cancel_button.bind(on_press=cancel)
+    
+    def _show_answer_analysis(self, gemini_results, comparison_results):
+        """Show the detected answers and their comparison with the answer key (main thread)."""
+        try:
             # Clear previous results
             self.results_grid.clear_widgets()
             self.detected_answers = {}
@@ -696,6 +779,9 @@ class ProcessedImageScreen(BaseScreen):
                 self.logger.warning("No answers detected in the image")
                 
         except Exception as e:
-            self.logger.error(f"Error analyzing answers with Gemini Vision: {e}")
-            self.results_grid.clear_widgets()
-            self.results_grid.add_widget(Label(text=f"Error: {str(e)}", size_hint_y=None, height=40))
+            self._show_analysis_error(e)
+    
+    def _show_analysis_error(self, e):
+        self.logger.error(f"Error analyzing answers with Gemini Vision: {e}")
+        self.results_grid.clear_widgets()
+        self.results_grid.add_widget(Label(text=f"Error: {str(e)}", size_hint_y=None, height=40))
@@ -2,15 +2,27 @@ from .camera_widget import CameraWidget
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.floatlayout import FloatLayout
 from kivy.uix.button import Button
+from kivy.uix.togglebutton import ToggleButton
 from kivy.uix.label import Label
 from kivy.metrics import dp
 from kivy.graphics import Rectangle
-from ..processing.image_processing import process_document_pipeline
-from ..processing.answer_detection import detect_bubbles
+from kivy.clock import Clock
+from ..processing.scan_pipeline import ScanPipeline, build_scan_pipeline, warp_sheet_or_frame
 from .base_screen import BaseScreen
+from ..utils import debug_artifacts, instrumentation
 import cv2
 import numpy as np
 import logging
+import time
+import uuid
+
+logger = logging.getLogger("chexam.ui.scanner_screen")
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    formatter = logging.Formatter('[%(levelname)s] %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
 
 class ScannerScreen(BaseScreen):
     def __init__(self, **kwargs):
@@ -57,6 +69,30 @@ class ScannerScreen(BaseScreen):
         )
         self.capture_btn.bind(on_press=self.capture_image)
         btn_row.add_widget(self.capture_btn)
+        
+        # Auto-capture: take the photo as soon as the sheet is held still and in focus
+        self.auto_capture_btn = ToggleButton(
+            text='Auto Capture: On',
+            state='down',
+            font_size=dp(14),
+            size_hint=(None, None),
+            width=dp(160),
+            height=dp(50)
+        )
+        self.auto_capture_btn.bind(state=self.toggle_auto_capture)
+        btn_row.add_widget(self.auto_capture_btn)
+
+        # Batch mode: every capture is warped, read and saved in the background while the
+        # camera keeps scanning; the next sheet is captured once the previous one is swapped out
+        self.batch_mode_btn = ToggleButton(
+            text='Batch Mode: Off',
+            font_size=dp(14),
+            size_hint=(None, None),
+            width=dp(160),
+            height=dp(50)
+        )
+        self.batch_mode_btn.bind(state=self.toggle_batch_mode)
+        btn_row.add_widget(self.batch_mode_btn)
         scanner_layout.add_widget(btn_row)
 
         # Add a small "Back" button below the "Capture Photo" button
@@ -75,10 +111,18 @@ class ScannerScreen(BaseScreen):
         
         self.content_area.add_widget(scanner_layout)
 
+        # Single captures are warped off the UI thread before the processed image is shown
+        self.preview_pipeline = None
+        self.batch_pipeline = None
+        self.batch_name = None
+        self.batch_count = 0
+        self._batch_status_ev = None
+
     def _update_bg(self, *args):
         self.bg_rect.size = self.size
         self.bg_rect.pos = self.pos
 
+    @instrumentation.timed("preprocess_bubbles")
     def preprocess_for_bubble_detection(self, gray_img):
         """
         Specialized preprocessing method optimized for bubble detection.
@@ -117,67 +161,155 @@ class ScannerScreen(BaseScreen):
         # preserves the shading information in the bubbles
         return processed
 
+    def toggle_auto_capture(self, instance, state):
+        enabled = state == 'down'
+        self.camera_widget.auto_capture = enabled
+        instance.text = 'Auto Capture: On' if enabled else 'Auto Capture: Off'
+
+    def toggle_batch_mode(self, instance, state):
+        if state == 'down':
+            self.start_batch()
+        else:
+            self.stop_batch()
+
+    def start_batch(self):
+        from ..db.answer_key_db import get_all_answer_keys
+
+        # Sheets are saved against the most recent answer key, as compare_answers does
+        answer_keys = get_all_answer_keys()
+        answer_key = max(answer_keys, key=lambda k: k['id']) if answer_keys else None
+
+        # Sheets are saved under "Scan <batch name> #n", and saving under an existing student name
+        # replaces that student's answers, so every batch gets a name of its own
+        self.batch_name = f"{time.strftime('%Y-%m-%d %H:%M:%S')} {uuid.uuid4().hex[:6]}"
+        self.batch_count = 0
+        self.batch_pipeline = build_scan_pipeline(
+            answer_key_id=answer_key['id'] if answer_key else None,
+            on_result=self._on_batch_result,
+            on_error=self._on_batch_error
+        ).start()
+        self.batch_mode_btn.text = 'Batch Mode: On'
+        if answer_key:
+            logger.info(f"Batch scan started with answer key '{answer_key['name']}'")
+            self.status_label.text = f"Batch mode: saving to '{answer_key['name']}'"
+        else:
+            logger.warning("Batch scan started without an answer key; answers will not be saved")
+            self.status_label.text = 'Batch mode: no answer key, answers are not saved'
+        self._batch_status_ev = Clock.schedule_interval(self._update_batch_status, 0.5)
+
+    def stop_batch(self):
+        if self._batch_status_ev is not None:
+            self._batch_status_ev.cancel()
+            self._batch_status_ev = None
+        self.batch_mode_btn.text = 'Batch Mode: Off'
+
+        pipeline, self.batch_pipeline = self.batch_pipeline, None
+        if pipeline is None:
+            return
+        # Sheets already captured still finish in the background
+        pipeline.stop(wait=False)
+        logger.info(f"Batch scan stopped:\n{pipeline.format_stats()}")
+        if self.batch_count:
+            saved, failed, pending = self._batch_counts(pipeline)
+            self.status_label.text = f'Batch stopped: {saved} done, {failed} failed, {pending} still finishing'
+
+    def _batch_counts(self, pipeline):
+        stats = pipeline.stats()
+        return stats[-1]['processed'], sum(s['failed'] for s in stats), pipeline.pending()
+
+    def _on_batch_result(self, item):
+        # Runs on a pipeline thread
+        comparison = item.get('comparison')
+        if comparison and comparison['total']:
+            logger.info(f"{item['student_name']}: {comparison['score']}/{comparison['total']}")
+
+    def _on_batch_error(self, stage, item, error):
+        # Runs on a pipeline thread
+        logger.warning(f"{item.get('student_name', 'Sheet')} failed at {stage}: {error}")
+
+    def _update_batch_status(self, dt):
+        if self.batch_pipeline is None:
+            return
+        saved, failed, pending = self._batch_counts(self.batch_pipeline)
+        self.status_label.text = (f'Batch: {self.batch_count} captured, {saved} done, '
+                                  f'{failed} failed, {pending} in progress')
+
     def on_enter(self, *args):
+        self.preview_pipeline = ScanPipeline(
+            [('warp', warp_sheet_or_frame), ('preprocess', self._preprocess_item)],
+            on_result=lambda item: Clock.schedule_once(lambda dt: self._show_processed(item)),
+            on_error=lambda stage, item, error: Clock.schedule_once(lambda dt: self._show_capture_error(error)),
+            queue_size=1
+        ).start()
         self.camera_widget.start_camera()
+        if self.camera_widget.auto_capture:
+            self.status_label.text = 'Hold the sheet steady to capture automatically'
 
     def on_leave(self, *args):
         self.camera_widget.stop_camera()
+        if self.batch_mode_btn.state == 'down':
+            self.batch_mode_btn.state = 'normal'
+        if self.preview_pipeline is not None:
+            self.preview_pipeline.stop(wait=False)
+            self.preview_pipeline = None
 
     def on_image_captured(self, frame):
-        logger = logging.getLogger("chexam.ui.scanner_screen")
-        logger.setLevel(logging.INFO)
-        if not logger.handlers:
-            handler = logging.StreamHandler()
-            formatter = logging.Formatter('[%(levelname)s] %(message)s')
-            handler.setFormatter(formatter)
-            logger.addHandler(handler)
-            
-        self.status_label.text = 'Processing...'
+        """Queue a captured frame for processing; returns True if it was queued."""
         logger.info('on_image_captured called')
-        from kivy.app import App
-        import time
-        import os
-        
-        # Debug path (set to None to disable debug image saving)
-        debug_path = None
-        
+
         if frame is None:
-            print('[ERROR] No frame received from camera_widget!')
             logger.error('No frame received from camera_widget!')
             self.status_label.text = 'Camera error.'
+            return False
+
+        if self.batch_pipeline is not None:
+            name = f"Scan {self.batch_name} #{self.batch_count + 1}"
+            if not self.batch_pipeline.submit({'frame': frame, 'student_name': name}):
+                self.status_label.text = 'Still processing earlier sheets, hold on...'
+                return False
+            self.batch_count += 1
+            self._update_batch_status(0)
+            return True
+
+        if self.preview_pipeline is None or not self.preview_pipeline.submit({'frame': frame}):
+            self.status_label.text = 'Still processing the previous capture...'
+            return False
+        self.status_label.text = 'Processing...'
+        return True
+
+    def _preprocess_item(self, item):
+        # Runs on a pipeline thread: a version of the sheet optimized for bubble detection
+        item['warped_thresh'] = self.preprocess_for_bubble_detection(item['warped_gray'])
+
+        # Saved only when debug artifacts are enabled
+        debug_artifacts.save_image('bubble_optimized', item['warped_thresh'])
+        return item
+
+    def _show_capture_error(self, error):
+        logger.error(f'Sheet processing failed: {error}')
+        self.status_label.text = 'Sheet not detected. Try again.'
+        if self.manager is not None and self.manager.current == self.name:
+            self.camera_widget.start_camera()
+
+    def _show_processed(self, item):
+        from kivy.app import App
+
+        logger.info('Document detected and processed successfully')
+        if self.manager is None or self.manager.current != self.name:
             return
-            
-        logger.info('Running process_document_pipeline')
-        warped_color, warped_gray, sheet_pts = process_document_pipeline(frame, debug_save_path=debug_path, debug=False)
-        
-        # Generate a binary version optimized for bubble detection
-        warped_thresh = self.preprocess_for_bubble_detection(warped_gray)
-        
-        # Disable saving processed image for reference
-        if debug_path is not None:
-            cv2.imwrite(debug_path.replace('.png', '_bubble_optimized.png'), warped_thresh)
-        
-        if warped_gray is not None:
-            logger.info('Document detected and processed successfully')
-            # Show processed image screen
-            app = App.get_running_app()
-            sm = app.root
-            logger.info(f'Got ScreenManager: {sm}')
-            try:
-                processed_screen = sm.get_screen('processed_image')
-                logger.info('Got ProcessedImageScreen')
-                processed_screen.set_image(warped_thresh, warped_color)
-                logger.info('Set image on ProcessedImageScreen')
-                processed_screen.set_back_destination('scanner')
-                sm.current = 'processed_image'
-                logger.info('Switched to processed_image screen')
-                self.status_label.text = 'Processed image displayed.'
-            except Exception as e:
-                logger.error(f'Failed to switch to processed_image screen: {e}')
-                self.status_label.text = 'Error displaying processed image.'
-        else:
-            logger.error('No processed image returned (warped_adapt is None)')
-            self.status_label.text = 'Sheet not detected. Try again.'
+        app = App.get_running_app()
+        sm = app.root
+        self.camera_widget.stop_camera()
+        try:
+            processed_screen = sm.get_screen('processed_image')
+            processed_screen.set_image(item['warped_thresh'], item['warped_color'])
+            processed_screen.set_back_destination('scanner')
+            sm.current = 'processed_image'
+            logger.info('Switched to processed_image screen')
+            self.status_label.text = 'Processed image displayed.'
+        except Exception as e:
+            logger.error(f'Failed to switch to processed_image screen: {e}')
+            self.status_label.text = 'Error displaying processed image.'
 
     def capture_image(self, *args):
         self.on_image_captured(self.camera_widget.current_frame)
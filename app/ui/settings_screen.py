@@ -11,6 +11,7 @@ from kivy.clock import Clock
 import os
 import logging
 from ..utils.secure_storage import save_api_key, get_api_key, delete_api_key, GEMINI_API_KEY
+from ..utils import instrumentation
 from .base_screen import BaseScreen
 
 logger = logging.getLogger("chexam.ui.settings_screen")
@@ -122,8 +123,49 @@ class SettingsScreen(BaseScreen):
         # Add API key section to main layout
         settings_layout.add_widget(api_key_section)
         
-        # Add a spacer
-        settings_layout.add_widget(BoxLayout(size_hint_y=1))
+        # Performance timings section
+        timings_section = BoxLayout(orientation='vertical', size_hint_y=1, spacing=dp(10))
+        
+        timings_label = Label(
+            text='Performance Timings',
+            size_hint_y=None,
+            height=dp(30),
+            font_size=dp(18),
+            halign='left',
+            valign='middle'
+        )
+        timings_label.bind(size=lambda *args: setattr(timings_label, 'text_size', timings_label.size))
+        
+        timings_scroll = ScrollView()
+        self.timings_text = Label(
+            text='',
+            font_name='RobotoMono-Regular',
+            font_size=dp(12),
+            size_hint_y=None,
+            halign='left',
+            valign='top'
+        )
+        self.timings_text.bind(
+            width=lambda *args: setattr(self.timings_text, 'text_size', (self.timings_text.width, None)),
+            texture_size=lambda *args: setattr(self.timings_text, 'height', self.timings_text.texture_size[1])
+        )
+        timings_scroll.add_widget(self.timings_text)
+        
+        timings_btn_row = BoxLayout(size_hint_y=None, height=dp(40), spacing=dp(10))
+        refresh_timings_btn = Button(text='Refresh')
+        refresh_timings_btn.bind(on_press=lambda instance: self.refresh_timings())
+        export_timings_btn = Button(text='Export')
+        export_timings_btn.bind(on_press=self.export_timings)
+        reset_timings_btn = Button(text='Reset')
+        reset_timings_btn.bind(on_press=self.reset_timings)
+        timings_btn_row.add_widget(refresh_timings_btn)
+        timings_btn_row.add_widget(export_timings_btn)
+        timings_btn_row.add_widget(reset_timings_btn)
+        
+        timings_section.add_widget(timings_label)
+        timings_section.add_widget(timings_scroll)
+        timings_section.add_widget(timings_btn_row)
+        settings_layout.add_widget(timings_section)
         
         # Add settings layout to content area
         self.content_area.add_widget(settings_layout)
@@ -138,6 +180,24 @@ class SettingsScreen(BaseScreen):
         )
         settings_layout.add_widget(self.status_label)
     
+    def on_enter(self, *args):
+        self.refresh_timings()
+    
+    def refresh_timings(self):
+        self.timings_text.text = instrumentation.format_summary()
+    
+    def export_timings(self, instance):
+        try:
+            path = instrumentation.export_summary()
+            self.show_status_message(f'Timings exported to {os.path.basename(path)}')
+        except Exception as e:
+            logger.error(f"Failed to export timings: {e}")
+            self.show_status_message('Failed to export timings', error=True)
+    
+    def reset_timings(self, instance):
+        instrumentation.reset()
+        self.refresh_timings()
+    
     def _update_bg(self, *args):
         self.bg_rect.size = self.size
         self.bg_rect.pos = self.pos
@@ -0,0 +1,169 @@
+import os
+import re
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+
+import cv2
+
+logger = logging.getLogger("chexam.debug_artifacts")
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    formatter = logging.Formatter('[%(levelname)s] %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+# Debug images and texts are only written when CHEXAM_DEBUG_ARTIFACTS=1 or after enable()
+DEFAULT_DIR = Path(os.path.dirname(os.path.abspath(__file__))) / ".." / ".." / "data" / "debug"
+ARTIFACT_DIR = Path(os.environ.get("CHEXAM_DEBUG_DIR", str(DEFAULT_DIR)))
+
+# Oldest artifacts are deleted once the directory holds more than this many
+MAX_ARTIFACTS = 200
+
+# Artifacts waiting to be written; new ones are dropped rather than blocking the caller
+QUEUE_SIZE = 32
+
+_enabled = os.environ.get("CHEXAM_DEBUG_ARTIFACTS", "0") == "1"
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_writer = None
+_writer_lock = threading.Lock()
+_written = deque()
+_sequence = 0
+dropped = 0
+
+
+def enabled():
+    """True if artifacts are being saved. Callers use this to skip building debug images."""
+    return _enabled
+
+
+def enable(directory=None, max_artifacts=None):
+    """
+    Start saving debug artifacts.
+
+    Args:
+        directory: Directory to write into (defaults to ARTIFACT_DIR)
+        max_artifacts: Number of files to keep before the oldest are deleted
+    """
+    global _enabled, ARTIFACT_DIR, MAX_ARTIFACTS
+    if directory is not None:
+        ARTIFACT_DIR = Path(directory)
+    if max_artifacts is not None:
+        MAX_ARTIFACTS = max_artifacts
+    _enabled = True
+
+
+def disable():
+    """Stop saving debug artifacts. Anything already queued is still written."""
+    global _enabled
+    _enabled = False
+
+
+def _artifact_path(name, prefix, extension):
+    global _sequence
+    if prefix:
+        name = f"{os.path.splitext(os.path.basename(prefix))[0]}_{name}"
+    name = re.sub(r'[^\w.-]+', '_', name)
+    _sequence += 1
+    return ARTIFACT_DIR / f"{int(time.time() * 1000)}_{_sequence:04d}_{name}{extension}"
+
+
+def _enqueue(kind, path, data):
+    global dropped
+    _start_writer()
+    try:
+        _queue.put_nowait((kind, path, data))
+        return str(path)
+    except queue.Full:
+        dropped += 1
+        logger.warning(f"Debug artifact queue full, dropping {path.name}")
+        return None
+
+
+def save_image(name, image, prefix=None):
+    """
+    Queue an image to be written as PNG in the background.
+
+    Does nothing and costs nothing when artifacts are disabled. The image is copied, so
+    the caller may keep modifying it.
+
+    Args:
+        name: Short description, e.g. "3_thresh"
+        image: Image to save
+        prefix: Optional file name or path whose base name prefixes the artifact name
+
+    Returns:
+        Path the image will be written to, or None if nothing is saved
+    """
+    if not _enabled or image is None:
+        return None
+    return _enqueue("image", _artifact_path(name, prefix, ".png"), image.copy())
+
+
+def save_text(name, text, prefix=None):
+    """Queue a text artifact (e.g. a raw API response). Same rules as save_image."""
+    if not _enabled or text is None:
+        return None
+    return _enqueue("text", _artifact_path(name, prefix, ".txt"), str(text))
+
+
+def flush(timeout=5.0):
+    """Wait until every queued artifact has been written. Returns False on timeout."""
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks:
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def _start_writer():
+    global _writer
+    if _writer is not None:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_run_writer, name="chexam-debug-artifacts", daemon=True)
+            _writer.start()
+
+
+def _load_existing():
+    # Artifacts from earlier sessions count towards the retention limit too
+    if ARTIFACT_DIR.is_dir():
+        existing = sorted((p for p in ARTIFACT_DIR.iterdir() if p.suffix in ('.png', '.txt')),
+                          key=lambda p: p.stat().st_mtime)
+        _written.extend(existing)
+
+
+def _run_writer():
+    directory = None
+    while True:
+        kind, path, data = _queue.get()
+        try:
+            if path.parent != directory:
+                directory = path.parent
+                directory.mkdir(parents=True, exist_ok=True)
+                _written.clear()
+                _load_existing()
+
+            if kind == "image":
+                cv2.imwrite(str(path), data)
+            else:
+                with open(path, 'w') as f:
+                    f.write(data)
+            _written.append(path)
+
+            while len(_written) > MAX_ARTIFACTS:
+                oldest = _written.popleft()
+                try:
+                    oldest.unlink()
+                except OSError:
+                    pass
+        except Exception as e:
+            logger.error(f"Failed to write debug artifact {path}: {e}")
+        finally:
+            _queue.task_done()
@@ -0,0 +1,221 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import instrumentation
+
+logger = logging.getLogger("chexam.gemini_client")
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    formatter = logging.Formatter('[%(levelname)s] %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+# Base URL of the Gemini API. Point it at a local stub server to test without the network.
+API_BASE_URL = os.environ.get("GEMINI_API_BASE_URL", "https://generativelanguage.googleapis.com").rstrip("/")
+
+# (connect, read) timeouts in seconds; vision requests can take a while to answer
+DEFAULT_TIMEOUT = (5, 60)
+
+# Transient failures worth retrying: rate limiting and server-side errors. Read timeouts are
+# not retried: the request reached the server and may still be answered and billed.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_POOL_SIZE = 10
+
+# Batch submission limits. Keep these within the quota of the API key's tier.
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_REQUESTS_PER_MINUTE = 60
+DEFAULT_TOKENS_PER_MINUTE = 1000000
+
+# Gemini bills each inline image as a fixed number of input tokens
+IMAGE_TOKENS = 258
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def api_url(path):
+    """Build a full API URL from a path such as '/v1beta/models/...:generateContent'."""
+    return f"{API_BASE_URL}/{path.lstrip('/')}"
+
+
+def create_session(retries=DEFAULT_RETRIES, backoff_factor=DEFAULT_BACKOFF, pool_size=DEFAULT_POOL_SIZE):
+    """
+    Create an HTTP session with keep-alive connection pooling and retry with backoff.
+
+    POSTs are retried only when the request never reached the server (connection errors) or
+    the server answered with a retryable status (RETRY_STATUS_CODES). A read timeout or a
+    dropped connection after sending is not retried, since Gemini may still process and bill
+    the request. Retry-After headers are not honoured so the total time stays bounded (see
+    max_request_seconds); the batch rate limiter paces requests instead.
+
+    Args:
+        retries: Maximum number of retries for connection errors and retryable status codes
+        backoff_factor: Exponential backoff factor between retries (seconds)
+        pool_size: Maximum number of pooled connections per host
+
+    Returns:
+        A configured requests.Session
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        other=0,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(["POST"]),
+        respect_retry_after_header=False,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Content-Type": "application/json"})
+    return session
+
+
+def max_request_seconds(timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, backoff_factor=DEFAULT_BACKOFF):
+    """
+    Upper bound on how long post_json can take with a session from create_session.
+
+    Every attempt may use the full connect and read timeouts before a retryable status comes
+    back, and urllib3 sleeps at most backoff_factor * 2 ** n before retry n + 1.
+    """
+    connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    backoff = sum(backoff_factor * 2 ** n for n in range(retries))
+    return (retries + 1) * (connect + read) + backoff
+
+
+def get_session():
+    """Return the shared session, creating it on first use. Safe to call from any thread."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def set_session(session):
+    """Replace the shared session (e.g. one with different retry settings, or for tests)."""
+    global _session
+    with _session_lock:
+        old, _session = _session, session
+    if old is not None and old is not session:
+        old.close()
+
+
+def post_json(url, payload, api_key=None, headers=None, timeout=DEFAULT_TIMEOUT):
+    """
+    POST a JSON payload through the shared pooled session.
+
+    Args:
+        url: Full endpoint URL
+        payload: JSON-serializable request body
+        api_key: Gemini API key, sent as the `key` query parameter (optional)
+        headers: Extra request headers (optional)
+        timeout: (connect, read) timeout in seconds
+
+    Returns:
+        The requests.Response. Network errors that persist after retries raise requests.RequestException.
+    """
+    params = {"key": api_key} if api_key else None
+    with instrumentation.span("gemini_http") as span:
+        response = get_session().post(url, json=payload, params=params, headers=headers, timeout=timeout)
+        span.outcome = "ok" if response.status_code == 200 else f"http_{response.status_code}"
+        span.set(status=response.status_code, response_bytes=len(response.content))
+    return response
+
+
+def estimate_request_tokens(payload):
+    """
+    Roughly estimate how many tokens a generateContent request uses against the quota.
+
+    Text is counted at ~4 characters per token, each inline image at IMAGE_TOKENS, and the
+    requested max_output_tokens is included so the budget is never overshot.
+    """
+    tokens = 0
+    for content in payload.get("contents", []):
+        for part in content.get("parts", []):
+            if "text" in part:
+                tokens += len(part["text"]) // 4 + 1
+            elif "inline_data" in part:
+                tokens += IMAGE_TOKENS
+    config = payload.get("generation_config") or payload.get("generationConfig") or {}
+    tokens += config.get("max_output_tokens", config.get("maxOutputTokens", 0))
+    return tokens
+
+
+class AsyncRateLimiter:
+    """
+    Token-bucket limiter for requests-per-minute and tokens-per-minute quotas.
+
+    Each budget refills continuously at its per-minute rate up to one minute's worth, so short
+    bursts go out immediately and sustained load is spread evenly. Waiters are served in order.
+    A limit of None disables that budget.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+        """
+        Args:
+            requests_per_minute: Maximum requests per minute (None for no limit)
+            tokens_per_minute: Maximum estimated tokens per minute (None for no limit)
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_allowance = float(requests_per_minute or 0)
+        self._token_allowance = float(tokens_per_minute or 0)
+        self._updated = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._request_allowance = min(float(self.requests_per_minute),
+                                          self._request_allowance + elapsed * self.requests_per_minute / 60.0)
+        if self.tokens_per_minute:
+            self._token_allowance = min(float(self.tokens_per_minute),
+                                        self._token_allowance + elapsed * self.tokens_per_minute / 60.0)
+
+    def _wait_time(self, tokens):
+        wait = 0.0
+        if self.requests_per_minute and self._request_allowance < 1:
+            wait = max(wait, (1 - self._request_allowance) * 60.0 / self.requests_per_minute)
+        if self.tokens_per_minute and self._token_allowance < tokens:
+            wait = max(wait, (tokens - self._token_allowance) * 60.0 / self.tokens_per_minute)
+        return wait
+
+    async def acquire(self, tokens=0):
+        """Wait until one request using `tokens` tokens fits in both budgets, then spend it."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        if self.tokens_per_minute:
+            # A single request larger than the whole budget would otherwise wait forever
+            tokens = min(tokens, self.tokens_per_minute)
+
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    break
+                logger.debug(f"Rate limit reached, waiting {wait:.2f}s")
+                await asyncio.sleep(wait)
+            if self.requests_per_minute:
+                self._request_allowance -= 1
+            if self.tokens_per_minute:
+                self._token_allowance -= tokens
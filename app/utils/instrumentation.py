@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import logging
+import asyncio
+import threading
+import functools
+from bisect import bisect_left
+from pathlib import Path
+
+logger = logging.getLogger("chexam.instrumentation")
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    formatter = logging.Formatter('[%(levelname)s] %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+# Upper bounds (ms) of the latency histogram buckets; anything slower lands in a final overflow bucket
+BUCKET_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+
+# Set CHEXAM_TIMINGS_FILE to append every span to a JSONL file
+SINK_PATH = os.environ.get("CHEXAM_TIMINGS_FILE")
+
+DEFAULT_EXPORT_PATH = Path(os.path.dirname(os.path.abspath(__file__))) / ".." / ".." / "data" / "timings_summary.json"
+
+_lock = threading.Lock()
+_stages = {}
+_sink = None
+
+
+class StageStats:
+    """Running statistics and latency histogram for one pipeline stage."""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = None
+        self.max_ms = 0.0
+        self.outcomes = {}
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+
+    def add(self, duration_ms, outcome):
+        self.count += 1
+        self.total_ms += duration_ms
+        self.min_ms = duration_ms if self.min_ms is None else min(self.min_ms, duration_ms)
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        self.buckets[bisect_left(BUCKET_BOUNDS_MS, duration_ms)] += 1
+
+    def percentile(self, pct):
+        """Upper bound of the histogram bucket holding the given percentile, capped at the slowest sample."""
+        if not self.count:
+            return 0.0
+        target = pct / 100.0 * self.count
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target and n:
+                return min(float(BUCKET_BOUNDS_MS[index]), self.max_ms) if index < len(BUCKET_BOUNDS_MS) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "min_ms": round(self.min_ms or 0.0, 3),
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "outcomes": dict(self.outcomes),
+            "histogram": {
+                **{f"<={bound}ms": n for bound, n in zip(BUCKET_BOUNDS_MS, self.buckets)},
+                f">{BUCKET_BOUNDS_MS[-1]}ms": self.buckets[-1]
+            }
+        }
+
+
+def image_size(image):
+    """'WxH' for an image array, or None for anything else."""
+    shape = getattr(image, "shape", None)
+    if shape is None or len(shape) < 2:
+        return None
+    return f"{shape[1]}x{shape[0]}"
+
+
+def record(stage, duration_ms, outcome="ok", **fields):
+    """
+    Record one completed stage.
+
+    Args:
+        stage: Stage name, e.g. "document_pipeline"
+        duration_ms: How long the stage took
+        outcome: Short result label such as "ok", "error" or "no_sheet"
+        **fields: Extra JSON-serializable details written to the sink (e.g. image_size)
+    """
+    with _lock:
+        stats = _stages.get(stage)
+        if stats is None:
+            stats = _stages[stage] = StageStats(stage)
+        stats.add(duration_ms, outcome)
+        sink = _sink
+
+    if sink is not None:
+        entry = {"ts": time.time(), "stage": stage, "duration_ms": round(duration_ms, 3), "outcome": outcome}
+        entry.update(fields)
+        try:
+            with _lock:
+                sink.write(json.dumps(entry, default=str) + "\n")
+        except Exception as e:
+            logger.error(f"Failed to write timing entry: {e}")
+
+
+class Span:
+    """
+    Times a block of code as one stage.
+
+        with span("optimize", image=img) as s:
+            ...
+            s.outcome = "resized"
+
+    An exception escaping the block is recorded as outcome "error" and re-raised.
+    """
+
+    def __init__(self, stage, image=None, **fields):
+        self.stage = stage
+        self.fields = fields
+        self.outcome = "ok"
+        if image is not None:
+            self.fields["image_size"] = image_size(image)
+        self._start = None
+
+    def set(self, **fields):
+        """Attach extra details to the span."""
+        self.fields.update(fields)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_ms = (time.perf_counter() - self._start) * 1000.0
+        if exc_type is not None:
+            self.outcome = "error"
+            self.fields["error"] = exc_type.__name__
+        record(self.stage, duration_ms, self.outcome, **self.fields)
+        return False
+
+
+def span(stage, image=None, **fields):
+    """Create a Span for `stage`; use it as a context manager."""
+    return Span(stage, image=image, **fields)
+
+
+def timed(stage, outcome=None):
+    """
+    Decorator that records every call of a function (sync or async) as a stage.
+
+    The size of the first image argument is recorded with the span.
+
+    Args:
+        stage: Stage name
+        outcome: Optional function mapping the return value to an outcome label
+    """
+    def decorate(func):
+        def start_span(args, kwargs):
+            image = next((a for a in list(args) + list(kwargs.values()) if image_size(a)), None)
+            return Span(stage, image=image)
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(args, kwargs) as s:
+                    result = await func(*args, **kwargs)
+                    if outcome is not None:
+                        s.outcome = outcome(result)
+                    return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with start_span(args, kwargs) as s:
+                result = func(*args, **kwargs)
+                if outcome is not None:
+                    s.outcome = outcome(result)
+                return result
+        return wrapper
+    return decorate
+
+
+def set_sink(path):
+    """Append every recorded span to a JSONL file, or stop writing with path=None."""
+    global _sink
+    with _lock:
+        old, _sink = _sink, None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            _sink = open(path, "a", buffering=1)
+    if old is not None:
+        old.close()
+
+
+def get_summary():
+    """Return {stage: statistics dictionary} for every stage recorded so far."""
+    with _lock:
+        return {stage: stats.to_dict() for stage, stats in _stages.items()}
+
+
+def format_summary():
+    """Human-readable table of the summary, one line per stage."""
+    summary = get_summary()
+    if not summary:
+        return "No timings recorded yet."
+    lines = [f"{'stage':<22}{'n':>5}{'mean':>9}{'p50':>8}{'p95':>8}{'max':>9}"]
+    for stage, stats in sorted(summary.items()):
+        lines.append(f"{stage:<22}{stats['count']:>5}{stats['mean_ms']:>9.1f}{stats['p50_ms']:>8.0f}"
+                     f"{stats['p95_ms']:>8.0f}{stats['max_ms']:>9.1f}")
+    lines.append("(milliseconds)")
+    return "\n".join(lines)
+
+
+def export_summary(path=None):
+    """
+    Write the summary as JSON.
+
+    Args:
+        path: Output file (defaults to data/timings_summary.json)
+
+    Returns:
+        The path written to
+    """
+    path = Path(path) if path is not None else DEFAULT_EXPORT_PATH
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"exported_at": time.time(), "stages": get_summary()}, f, indent=2)
+    return str(path.resolve())
+
+
+def reset():
+    """Forget all recorded timings."""
+    with _lock:
+        _stages.clear()
+
+
+if SINK_PATH:
+    set_sink(SINK_PATH)
@@ -0,0 +1,78 @@
+"""
+Benchmark the per-contour fill computation used by detect_bubbles.
+
+Renders a 12 MP binary sheet with 240 bubbles (60 questions x 4 options), finds the bubble
+contours the same way detect_bubbles does and times the old full-image mask against
+contour_fill, which only masks each contour's bounding box.
+
+Run from the repository root:
+    python -m benchmarks.bench_contour_fill
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from app.processing.answer_detection import contour_fill
+
+
+def render_binary_sheet(width=4000, height=3000, questions=60, options=4, seed=0):
+    """Render a thresholded sheet: white bubbles on black, every other bubble filled."""
+    rng = np.random.default_rng(seed)
+    binary = np.zeros((height, width), dtype=np.uint8)
+    columns = 3
+    rows = questions // columns
+    radius = int(min(width / (columns * (options + 1)), height / (rows + 2)) * 0.3)
+
+    for q in range(questions):
+        col, row = divmod(q, rows)
+        answer = rng.integers(options)
+        for opt in range(options):
+            cx = int((col * (options + 1) + opt + 1) * width / (columns * (options + 1)))
+            cy = int((row + 1.5) * height / (rows + 2))
+            thickness = -1 if opt == answer else max(2, radius // 5)
+            cv2.circle(binary, (cx, cy), radius, 255, thickness)
+    return binary
+
+
+def full_image_fill(binary, contour):
+    """Fill computation as detect_bubbles did it before: one full-size mask per contour."""
+    mask = np.zeros_like(binary)
+    cv2.drawContours(mask, [contour], 0, 255, -1)
+    return np.sum(binary[mask == 255]) / np.sum(mask == 255) if np.sum(mask == 255) > 0 else 0
+
+
+def time_fills(fill_fn, binary, contours, repeat):
+    best = float('inf')
+    values = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        values = [fill_fn(binary, contour) for contour in contours]
+        best = min(best, time.perf_counter() - start)
+    return best, values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    binary = render_binary_sheet(args.width, args.height)
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    print(f"Sheet {args.width}x{args.height}, {len(contours)} bubble contours")
+
+    old_time, old_values = time_fills(full_image_fill, binary, contours, args.repeat)
+    new_time, new_values = time_fills(contour_fill, binary, contours, args.repeat)
+
+    max_diff = max(abs(a - b) for a, b in zip(old_values, new_values))
+    print(f"full-image mask: {old_time * 1000:9.1f} ms")
+    print(f"bounding box:    {new_time * 1000:9.1f} ms")
+    print(f"speedup:         {old_time / new_time:9.1f}x")
+    print(f"max fill difference: {max_diff:.6f}")
+
+
+if __name__ == "__main__":
+    main()
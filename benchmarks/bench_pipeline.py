@@ -0,0 +1,170 @@
+"""
+Benchmark the scan pipeline on synthetic photographed sheets: speed and accuracy together.
+
+For every frame size, renders sheets with known answers, photographs them with random
+perspective, rotation, blur and noise, and times:
+
+  corners    detect_document_corners (live preview path)
+  pipeline   process_document_pipeline (find, warp and orient the sheet)
+  template   detect_bubbles with the default SheetTemplate
+  contours   detect_bubbles with the contour detector
+
+Speed is reported as median milliseconds per frame and frames per second; accuracy as the
+fraction of sheets found (corner error for `corners`) and the fraction of questions read
+correctly. Use --min-accuracy to fail when the template reader drops below a threshold.
+
+Accuracy is measured on synthetic sheets, not printed ones. Each sheet's bubbles are drawn
+from a layout moved by up to --layout-jitter of a bubble pitch relative to the template the
+reader uses, so the template is not graded against the exact geometry it was drawn with; how
+well it fits a real printed sheet still has to be checked on photographs.
+
+Run from the repository root:
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --sizes 640x480 4000x3000 --sheets 20 --json results.json
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+
+import numpy as np
+
+from app.processing.answer_detection import detect_bubbles
+from app.processing.image_processing import process_document_pipeline, detect_document_corners
+from app.processing.sheet_template import DEFAULT_TEMPLATE
+from benchmarks.synthetic_sheet import random_answers, render_sheet, photograph_sheet, score_answers
+
+DEFAULT_SIZES = ("640x480", "1280x960", "1920x1440", "4000x3000")
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def make_cases(size, sheets, args, seed):
+    """Generate (frame, true corners, true answers) for one frame size."""
+    cases = []
+    for i in range(sheets):
+        case_seed = seed + i
+        truth = random_answers(blank_rate=args.blank_rate, seed=case_seed)
+        sheet = render_sheet(truth, faint_rate=args.faint_rate, layout_jitter=args.layout_jitter, seed=case_seed)
+        frame, corners = photograph_sheet(sheet, *size, perspective=args.perspective, rotation=args.rotation,
+                                          blur=args.blur, noise=args.noise, seed=case_seed)
+        cases.append((frame, corners, truth))
+    return cases
+
+
+def timed_call(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def summarize(name, size, times, accuracy, note=""):
+    median = float(np.median(times)) if times else 0.0
+    return {
+        "function": name,
+        "size": f"{size[0]}x{size[1]}",
+        "runs": len(times),
+        "median_ms": round(median * 1000, 2),
+        "fps": round(1.0 / median, 1) if median > 0 else 0.0,
+        "accuracy": round(accuracy, 4),
+        "note": note,
+    }
+
+
+def bench_size(size, args):
+    cases = make_cases(size, args.sheets, args, args.seed)
+    results = []
+
+    corner_times, corner_errors, corners_found = [], [], 0
+    pipeline_times, warped_sheets = [], []
+    for frame, true_corners, truth in cases:
+        for _ in range(args.repeat):
+            found, elapsed = timed_call(detect_document_corners, frame)
+            corner_times.append(elapsed)
+        if found is not None:
+            corners_found += 1
+            corner_errors.append(float(np.abs(found - true_corners).max()))
+
+        for _ in range(args.repeat):
+            (warped_color, warped_gray, sheet_pts), elapsed = timed_call(process_document_pipeline, frame)
+            pipeline_times.append(elapsed)
+        warped_sheets.append((warped_color if sheet_pts is not None else None, truth))
+
+    max_error = f"max corner error {max(corner_errors):.1f}px" if corner_errors else "no corners found"
+    results.append(summarize("corners", size, corner_times, corners_found / len(cases), max_error))
+    found = sum(1 for warped, _ in warped_sheets if warped is not None)
+    results.append(summarize("pipeline", size, pipeline_times, found / len(cases), "accuracy = sheets found"))
+
+    for name, template in (("template", DEFAULT_TEMPLATE), ("contours", None)):
+        times, scores = [], []
+        for warped, truth in warped_sheets:
+            if warped is None:
+                scores.append(0.0)
+                continue
+            for _ in range(args.repeat):
+                try:
+                    detected, elapsed = timed_call(detect_bubbles, warped, template=template)
+                except Exception:
+                    detected, elapsed = None, 0.0
+                times.append(elapsed)
+            scores.append(score_answers(detected, truth))
+        results.append(summarize(name, size, times, float(np.mean(scores)), "accuracy = questions correct, synthetic layout"))
+
+    return results
+
+
+def format_table(rows):
+    lines = [f"{'function':<10}{'size':>11}{'runs':>6}{'median ms':>11}{'fps':>8}{'accuracy':>10}  note"]
+    for row in rows:
+        lines.append(f"{row['function']:<10}{row['size']:>11}{row['runs']:>6}{row['median_ms']:>11.2f}"
+                     f"{row['fps']:>8.1f}{row['accuracy']:>10.1%}  {row['note']}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=list(DEFAULT_SIZES), help="Frame sizes as WIDTHxHEIGHT")
+    parser.add_argument("--sheets", type=int, default=10, help="Synthetic sheets per size")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per sheet and function")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--perspective", type=float, default=0.04)
+    parser.add_argument("--rotation", type=float, default=5.0)
+    parser.add_argument("--blur", type=float, default=1.0)
+    parser.add_argument("--noise", type=float, default=4.0)
+    parser.add_argument("--blank-rate", type=float, default=0.05)
+    parser.add_argument("--faint-rate", type=float, default=0.0)
+    parser.add_argument("--layout-jitter", type=float, default=0.1,
+                        help="Move the drawn layout by up to this fraction of a bubble pitch from the reader's template")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--min-accuracy", type=float,
+                        help="Exit with status 1 if the template reader's accuracy falls below this (0-1)")
+    args = parser.parse_args(argv)
+
+    # detect_bubbles logs every warning it hits; keep the report readable
+    logging.getLogger("chexam.processing.answer_detection").setLevel(logging.ERROR)
+
+    rows = []
+    for text in args.sizes:
+        rows.extend(bench_size(parse_size(text), args))
+    print(format_table(rows))
+    print(f"Accuracy is measured on synthetic sheets drawn up to {args.layout_jitter:g} of a bubble pitch "
+          f"off the reader's template, not on printed sheets.")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": rows}, f, indent=2)
+
+    if args.min_accuracy is not None:
+        worst = min(row["accuracy"] for row in rows if row["function"] == "template")
+        if worst < args.min_accuracy:
+            print(f"Template accuracy {worst:.1%} is below --min-accuracy {args.min_accuracy:.1%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Synthetic bubble sheets with known answers, for benchmarks.
+
+render_sheet draws a flat 60-question A-D sheet using the bubble geometry of a SheetTemplate,
+and photograph_sheet places it in a camera-like frame with perspective, rotation, blur and
+sensor noise. Both are deterministic for a given seed.
+
+The sheets are synthetic: with layout_jitter=0 the bubbles sit exactly where the reader's
+template expects them, which says nothing about how well the template fits a real printed
+sheet. perturb_template moves the drawn layout relative to the reader's to keep benchmarks
+from grading the template against itself.
+"""
+import cv2
+import numpy as np
+
+from app.processing.sheet_template import DEFAULT_TEMPLATE, SheetTemplate
+
+# Sheet size of a US-letter page at 100 dpi
+SHEET_WIDTH = 850
+SHEET_HEIGHT = 1100
+
+
+def random_answers(num_questions=60, options=('A', 'B', 'C', 'D'), blank_rate=0.05, seed=0):
+    """Answer key in the app's format: {"1": "A", ..., "60": "blank"}."""
+    rng = np.random.default_rng(seed)
+    answers = {}
+    for q in range(1, num_questions + 1):
+        answers[str(q)] = "blank" if rng.random() < blank_rate else options[rng.integers(len(options))]
+    return answers
+
+
+def perturb_template(template, jitter, seed=0):
+    """
+    Copy of a template with its grid edges and bubble size moved at random.
+
+    Args:
+        template: Layout to perturb
+        jitter: Maximum move of each grid edge as a fraction of the row pitch (top and bottom)
+            or option pitch (left and right); the bubble size changes by up to the same fraction
+        seed: Random seed
+
+    Returns:
+        SheetTemplate
+    """
+    rng = np.random.default_rng(seed)
+    params = template.to_dict()
+    row_pitch = (params['grid_bottom'] - params['grid_top']) / template.rows_per_column
+    option_pitch = ((params['grid_right'] - params['grid_left']) / template.num_columns
+                    * (1 - params['label_width']) / len(template.options))
+    for edge, pitch in (('grid_left', option_pitch), ('grid_right', option_pitch),
+                        ('grid_top', row_pitch), ('grid_bottom', row_pitch)):
+        params[edge] += rng.uniform(-jitter, jitter) * pitch
+    params['bubble_scale'] *= 1 + rng.uniform(-jitter, jitter)
+    return SheetTemplate(**params)
+
+
+def render_sheet(answers, template=DEFAULT_TEMPLATE, width=SHEET_WIDTH, height=SHEET_HEIGHT,
+                 fill_darkness=(40, 90), faint_rate=0.0, faint_darkness=(120, 150),
+                 layout_jitter=0.0, seed=0):
+    """
+    Draw a flat, top-down sheet with the given answers marked.
+
+    Args:
+        answers: {"1": "A" | "blank", ...}
+        template: Layout that places the bubbles
+        width, height: Sheet size in pixels
+        fill_darkness: Gray level range of a pencil mark
+        faint_rate: Fraction of marks drawn lightly (harder to read)
+        faint_darkness: Gray level range of a faint mark
+        layout_jitter: Draw the bubbles from perturb_template(template, layout_jitter) rather
+            than exactly where the template puts them
+        seed: Random seed
+
+    Returns:
+        BGR image of the sheet
+    """
+    rng = np.random.default_rng(seed)
+    if layout_jitter > 0:
+        template = perturb_template(template, layout_jitter, seed)
+    sheet = np.full((height, width), 245, dtype=np.uint8)
+    centers, radius = template.bubble_centers(width, height)
+    r = max(2, int(round(radius)))
+    outline = max(1, r // 6)
+
+    cv2.putText(sheet, "CHEXAM ANSWER SHEET", (int(width * 0.08), int(height * 0.08)),
+                cv2.FONT_HERSHEY_SIMPLEX, width / 900.0, 30, 2)
+    cv2.line(sheet, (int(width * 0.06), int(height * 0.15)), (int(width * 0.94), int(height * 0.15)), 30, 2)
+
+    for q in range(template.num_questions):
+        answer = answers.get(str(q + 1), "blank")
+        label_x = int(centers[q, 0, 0] - 2.6 * r)
+        cv2.putText(sheet, f"{q + 1}.", (max(0, label_x - r), int(centers[q, 0, 1] + r * 0.5)),
+                    cv2.FONT_HERSHEY_SIMPLEX, r / 14.0, 40, 1)
+        for o, option in enumerate(template.options):
+            center = (int(round(centers[q, o, 0])), int(round(centers[q, o, 1])))
+            if option == answer:
+                low, high = faint_darkness if rng.random() < faint_rate else fill_darkness
+                cv2.circle(sheet, center, r, int(rng.integers(low, high + 1)), -1, cv2.LINE_AA)
+            cv2.circle(sheet, center, r, 60, outline, cv2.LINE_AA)
+
+    return cv2.cvtColor(sheet, cv2.COLOR_GRAY2BGR)
+
+
+def photograph_sheet(sheet, frame_width=1280, frame_height=960, fill=0.8, perspective=0.04,
+                     rotation=5.0, blur=1.0, noise=4.0, seed=0):
+    """
+    Place a flat sheet in a camera frame.
+
+    Args:
+        sheet: Image from render_sheet
+        frame_width, frame_height: Output frame size
+        fill: Fraction of the frame height the sheet covers
+        perspective: Maximum corner displacement as a fraction of the sheet size
+        rotation: Maximum in-plane rotation in degrees (either direction)
+        blur: Gaussian blur sigma in pixels at 1280 px frame width (0 for none)
+        noise: Standard deviation of additive Gaussian noise (gray levels)
+        seed: Random seed
+
+    Returns:
+        frame: BGR camera frame
+        corners: float32 array (4, 2) of the sheet corners in the frame (tl, tr, br, bl)
+    """
+    rng = np.random.default_rng(seed)
+    sh, sw = sheet.shape[:2]
+
+    scale = fill * frame_height / sh
+    w, h = sw * scale, sh * scale
+    cx = frame_width / 2 + rng.uniform(-0.05, 0.05) * frame_width
+    cy = frame_height / 2 + rng.uniform(-0.03, 0.03) * frame_height
+    corners = np.array([[-w / 2, -h / 2], [w / 2, -h / 2], [w / 2, h / 2], [-w / 2, h / 2]])
+
+    angle = np.deg2rad(rng.uniform(-rotation, rotation))
+    rot = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    corners = corners @ rot.T
+    corners += rng.uniform(-perspective, perspective, size=(4, 2)) * [w, h]
+    corners = (corners + [cx, cy]).astype(np.float32)
+
+    src = np.array([[0, 0], [sw - 1, 0], [sw - 1, sh - 1], [0, sh - 1]], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(src, corners)
+
+    # Darker, slightly textured desk so the sheet edge stands out as it does in real photos
+    background = rng.normal(70, 8, size=(frame_height, frame_width)).astype(np.float32)
+    background = cv2.GaussianBlur(background, (0, 0), 3)
+    frame = cv2.cvtColor(np.clip(background, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+    frame = cv2.warpPerspective(sheet, matrix, (frame_width, frame_height), dst=frame,
+                                borderMode=cv2.BORDER_TRANSPARENT)
+
+    if blur > 0:
+        frame = cv2.GaussianBlur(frame, (0, 0), blur * frame_width / 1280.0)
+    if noise > 0:
+        frame = np.clip(frame + rng.normal(0, noise, frame.shape), 0, 255).astype(np.uint8)
+
+    return frame, corners
+
+
+def score_answers(detected, truth):
+    """
+    Fraction of questions read correctly.
+
+    Args:
+        detected: Detected answers; int or str keys, missing questions count as "blank"
+        truth: {"1": "A" | "blank", ...}
+    """
+    detected = {str(k): v for k, v in (detected or {}).items()}
+    correct = sum(1 for q, answer in truth.items() if detected.get(q, "blank") == answer)
+    return correct / len(truth) if truth else 0.0
@@ -37,7 +37,7 @@ version = 0.1
 
 # (list) Application requirements
 # comma separated e.g. requirements = sqlite3,kivy
-requirements = python3,kivy,opencv-python-headless,numpy,pillow,matplotlib,python-dateutil,google-generativeai
+requirements = python3,kivy,opencv-python-headless,numpy,pillow,matplotlib,python-dateutil,google-generativeai,requests
 
 # (str) Custom source folders for requirements
 # Sets custom source for any requirements with recipes